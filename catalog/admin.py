@@ -1,9 +1,22 @@
 from django.contrib import admin
-from catalog.models import Recipe, Category, Comment
+from catalog.models import (
+    Recipe, RecipeIngredient, RecipeStep, Category, Comment, Job,
+    ImportCheckpoint)
+
+
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    extra = 0
+
+
+class RecipeStepInline(admin.TabularInline):
+    model = RecipeStep
+    extra = 0
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'pub_date', 'edit_date']
+    list_display = ['title', 'author', 'pub_date', 'edit_date', 'like_count']
+    inlines = [RecipeIngredientInline, RecipeStepInline]
 
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -14,6 +27,18 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ['user', 'recipe', 'pub_date']
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'created', 'run_at',
+                    'finished']
+    list_filter = ['status', 'name']
+
+
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['name', 'line', 'imported', 'invalid', 'timestamp']
+
+
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(ImportCheckpoint, ImportCheckpointAdmin)
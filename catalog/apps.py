@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+
+    def ready(self):
+        # register signal handlers
+        from catalog import signals  # noqa: F401
+        # register background jobs' tasks
+        from catalog import tasks  # noqa: F401
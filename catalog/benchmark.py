@@ -0,0 +1,472 @@
+""" Benchmark data generator and runner for catalog's URLs """
+
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from catalog.models import (
+    Recipe, RecipeIngredient, RecipeStep, Category, Favourite, Comment)
+from catalog.bulk import bulk_create, get_next_pk, reset_sequences
+from catalog import urls
+
+
+USERNAME = 'bench_user_{}'
+CATEGORY_SLUG = 'bench-category-{}'
+PASSWORD = 'bench-password'
+# error of benchmark commands run with other than benchmark settings
+NOT_BENCHMARK_DATABASE = (
+    "Not a benchmark database (BENCHMARK_DATABASE is False), run with "
+    "--settings=cookbook.settings_benchmark.")
+
+ADJECTIVES = (
+    'spicy', 'creamy', 'quick', 'easy', 'roasted', 'grilled', 'baked',
+    'homemade', 'classic', 'vegan', 'crispy', 'sweet', 'smoky', 'light',
+)
+DISHES = (
+    'soup', 'salad', 'stew', 'curry', 'pie', 'pasta', 'risotto', 'cake',
+    'pancakes', 'omelette', 'burger', 'tart', 'casserole', 'stir fry',
+)
+INGREDIENTS = (
+    'chicken', 'beef', 'pork', 'salmon', 'tofu', 'eggs', 'flour', 'milk',
+    'butter', 'sugar', 'onions', 'garlic', 'tomatoes', 'potatoes', 'carrots',
+    'rice', 'pasta', 'cheese', 'spinach', 'mushrooms', 'peppers', 'lemons',
+    'basil', 'parsley', 'cream', 'beans', 'lentils', 'apples', 'honey',
+)
+UNITS = ('g', 'ml', 'cups', 'tbsp', 'tsp', 'pinch of', 'large', 'small')
+STEPS = (
+    'Preheat the oven and prepare a baking dish.',
+    'Chop the vegetables into small pieces.',
+    'Fry everything on medium heat for ten minutes.',
+    'Mix all the ingredients in a large bowl.',
+    'Simmer gently, stirring from time to time.',
+    'Season to taste and serve warm.',
+    'Bake until golden brown on top.',
+    'Leave to rest for a few minutes before serving.',
+)
+
+
+# DATA GENERATOR
+
+def random_recipe_texts(rnd):
+    """
+    Return random title, ingredients and directions (lists of texts).
+    """
+    title = '{} {} {}'.format(rnd.choice(ADJECTIVES).title(),
+                              rnd.choice(INGREDIENTS), rnd.choice(DISHES))
+    ingredients = [
+        '{} {} {}'.format(rnd.randint(1, 500), rnd.choice(UNITS), name)
+        for name in rnd.sample(INGREDIENTS, rnd.randint(5, 12))
+    ]
+    directions = rnd.sample(STEPS, rnd.randint(3, 8))
+    return title, ingredients, directions
+
+
+def generate_data(users=10000, categories=50, recipes=100000,
+                  favourites=1000000, comments=500000, seed=0,
+                  log=lambda message: None):
+    """
+    Fill database with random benchmark data. Rows are bulk created with
+    explicit pks, so signals aren't sent: denormalized data must be
+    rebuilt afterwards (see seed_benchmark_data command).
+    The first user is staff and author of some drafts.
+    Auto-filled dates (edit date, favourite and comment timestamps)
+    are set to current time.
+    """
+    rnd = random.Random(seed)
+    now = timezone.now()
+
+    log("Creating {} users...".format(users))
+    password = make_password(PASSWORD)
+    first_user = get_next_pk(User)
+    bulk_create(User, (
+        User(pk=first_user + i, username=USERNAME.format(i),
+             password=password, is_staff=i == 0)
+        for i in range(users)
+    ))
+    user_ids = range(first_user, first_user + users)
+
+    log("Creating {} categories...".format(categories))
+    category_ids = [CATEGORY_SLUG.format(i) for i in range(categories)]
+    bulk_create(Category, (
+        Category(slug=slug, name='Category {}'.format(i))
+        for i, slug in enumerate(category_ids)
+    ))
+
+    log("Creating {} recipes...".format(recipes))
+    first_recipe = get_next_pk(Recipe)
+    recipe_ids = range(first_recipe, first_recipe + recipes)
+    # every 10th recipe is a draft, every 100th is the first user's
+    published = [pk for pk in recipe_ids if pk % 10]
+
+    for start in range(0, recipes, 5000):
+        batch, ingredient_rows, step_rows = [], [], []
+        for pk in recipe_ids[start:start + 5000]:
+            title, ingredients, directions = random_recipe_texts(rnd)
+            is_draft = not pk % 10
+            age = timedelta(seconds=rnd.uniform(0, 2 * 365 * 24 * 3600))
+            batch.append(Recipe(
+                pk=pk,
+                author_id=(user_ids[0] if not pk % 100
+                           else rnd.choice(user_ids)),
+                status=(Recipe.STATUS_DRAFT if is_draft
+                        else Recipe.STATUS_PUBLISHED),
+                title=title,
+                description='A {} recipe.'.format(title.lower()),
+                pub_date=None if is_draft else now - age,
+            ))
+            ingredient_rows += [
+                RecipeIngredient(recipe_id=pk, position=position, desc=desc)
+                for position, desc in enumerate(ingredients)]
+            step_rows += [
+                RecipeStep(recipe_id=pk, position=position, desc=desc)
+                for position, desc in enumerate(directions)]
+        Recipe.objects.bulk_create(batch)
+        bulk_create(RecipeIngredient, ingredient_rows)
+        bulk_create(RecipeStep, step_rows)
+
+    RecipeCategory = Recipe.categories.through
+    bulk_create(RecipeCategory, (
+        RecipeCategory(recipe_id=recipe_id, category_id=category_id)
+        for recipe_id in recipe_ids
+        for category_id in rnd.sample(
+            category_ids, rnd.randint(1, min(3, len(category_ids))))
+    ))
+
+    log("Creating {} favourites...".format(favourites))
+    favourites = min(favourites, len(user_ids) * len(published))
+    pairs = set()
+    while len(pairs) < favourites:
+        # skewed popularity: few recipes get most of favourites
+        index = int(len(published) * rnd.random() ** 2)
+        pairs.add((rnd.choice(user_ids), published[index]))
+    bulk_create(Favourite, (
+        Favourite(user_id=user_id, recipe_id=recipe_id)
+        for user_id, recipe_id in pairs
+    ))
+    del pairs
+
+    log("Creating {} comments...".format(comments))
+    bulk_create(Comment, (
+        Comment(user_id=rnd.choice(user_ids),
+                recipe_id=published[int(len(published) * rnd.random() ** 2)],
+                text='Comment {}: tasty, would cook again.'.format(i))
+        for i in range(comments)
+    ))
+
+    reset_sequences([User, Recipe])
+
+
+# RUNNER
+
+class Benchmark:
+    """
+    Request made to benchmark a named URL.
+    kwargs and query are functions of BenchmarkContext.
+    Slow URLs (eg. full exports) can limit number of iterations.
+    Data created by requests is removed afterwards by cleanup function
+    of BenchmarkContext, so it doesn't grow between runs.
+    """
+    def __init__(self, kwargs=None, query=None, method='get', data=None,
+                 login=False, max_iterations=None, cleanup=None):
+        self.kwargs = kwargs or (lambda context: {})
+        self.query = query or (lambda context: {})
+        self.method = method
+        self.data = data
+        self.login = login
+        self.max_iterations = max_iterations
+        self.cleanup = cleanup
+
+
+class BenchmarkContext:
+    """
+    Objects of seeded data used in benchmarked URLs.
+    """
+    def __init__(self):
+        self.user = User.objects.get(username=USERNAME.format(0))
+        published = Recipe.objects.filter(status=Recipe.STATUS_PUBLISHED)
+        # the most liked recipe is the heaviest one to show
+        self.recipe = published.order_by('-like_count', '-pk').first()
+        self.draft = Recipe.objects\
+            .filter(author=self.user, status=Recipe.STATUS_DRAFT)\
+            .order_by('pk')\
+            .first()
+        self.category = Category.objects\
+            .filter(slug__startswith=CATEGORY_SLUG.format(''))\
+            .annotate(recipe_count=Count('recipes'))\
+            .order_by('-recipe_count', 'slug')\
+            .first()
+        self.recipe_ids = list(published
+                               .order_by('-pub_date', '-edit_date', '-id')
+                               .values_list('pk', flat=True)[:20])
+
+
+def recipe_pk(context):
+    return {'pk': context.recipe.pk}
+
+
+def draft_pk(context):
+    return {'pk': context.draft.pk}
+
+
+def user_pk(context):
+    return {'pk': context.user.pk}
+
+
+def category_slug(context):
+    return {'slug': context.category.slug}
+
+
+COMMENT_TEXT = 'Benchmark comment, tasty.'
+
+
+def delete_comments(context):
+    Comment.objects.filter(user=context.user, text=COMMENT_TEXT).delete()
+
+
+# URL name -> Benchmark, for every named URL in catalog/urls.py.
+# Views changing data are benchmarked with their GET (confirmation) page.
+BENCHMARKS = {
+    'index': Benchmark(),
+    'recipe_detail': Benchmark(kwargs=recipe_pk),
+    'recipes_by_category': Benchmark(kwargs=category_slug),
+    'recipes_newest': Benchmark(),
+    'recipes_popular': Benchmark(),
+    'recipes_by_user': Benchmark(kwargs=user_pk),
+    'recipe_search': Benchmark(query=lambda context: {'q': 'chicken soup'}),
+    'recipes_by_ingredients': Benchmark(
+        query=lambda context: {'ingredients': 'eggs, flour, milk, butter'}),
+    'recipe_create': Benchmark(login=True),
+    'my_recipes': Benchmark(login=True),
+    'my_drafts': Benchmark(login=True),
+    'draft_detail': Benchmark(kwargs=draft_pk, login=True),
+    'my_favourites': Benchmark(login=True),
+    'recipe_edit': Benchmark(kwargs=draft_pk, login=True),
+    'recipe_publish': Benchmark(kwargs=draft_pk, login=True),
+    'recipe_delete': Benchmark(kwargs=draft_pk, login=True),
+    'export': Benchmark(kwargs=lambda context: {'kind': 'recipes'},
+                        login=True),
+    'export_catalog': Benchmark(
+        kwargs=lambda context: {'kind': 'recipes'},
+        query=lambda context: {'gzip': '1'}, login=True, max_iterations=3),
+    'favourite': Benchmark(kwargs=recipe_pk, login=True),
+    'favourite_status': Benchmark(
+        query=lambda context: {
+            'ids': ','.join(str(pk) for pk in context.recipe_ids)},
+        login=True),
+    'add_comment': Benchmark(
+        kwargs=recipe_pk, method='post', login=True,
+        data={'text': COMMENT_TEXT}, cleanup=delete_comments),
+    'comments': Benchmark(kwargs=recipe_pk),
+    'api_recipe_list': Benchmark(),
+    'api_recipe_detail': Benchmark(kwargs=recipe_pk),
+    'api_category_recipes': Benchmark(kwargs=category_slug),
+    'api_user_recipes': Benchmark(kwargs=user_pk),
+    'cache_stats': Benchmark(login=True),
+    'job_stats': Benchmark(login=True),
+    'metrics': Benchmark(login=True),
+}
+
+
+def get_url_names():
+    """
+    Return names of all named URL patterns of catalog/urls.py.
+    """
+    return [pattern.name for pattern in urls.urlpatterns
+            if isinstance(pattern, URLPattern) and pattern.name]
+
+
+def get_host():
+    """
+    Host allowed by ALLOWED_HOSTS, for requests made by test client.
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def percentile(values, percent):
+    """
+    Return percentile of values (nearest-rank method).
+    """
+    values = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def get_request(name, benchmark, context):
+    """
+    Return (client, function making request of named benchmark with the
+    client). Streamed responses are read whole, error responses raise
+    RuntimeError.
+    """
+    client = Client(HTTP_HOST=get_host())
+    if benchmark.login:
+        client.force_login(context.user)
+    url = reverse(name, kwargs=benchmark.kwargs(context))
+    query = benchmark.query(context)
+    method = getattr(client, benchmark.method)
+    data = benchmark.data if benchmark.method == 'post' else query
+    if benchmark.method == 'post' and query:
+        url += '?' + '&'.join('{}={}'.format(*item) for item in query.items())
+
+    def request():
+        response = method(url, data)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        if response.status_code >= 400:
+            raise RuntimeError("{} returned {}".format(
+                url, response.status_code))
+        return response
+    return client, request
+
+
+def run_benchmark(name, benchmark, context, iterations=50, warmup=5,
+                  cold=False):
+    """
+    Request URL of named benchmark repeatedly and return dict of its
+    latency percentiles (in ms) and number of queries of the last request.
+    With cold=True, cache is cleared before every request.
+    """
+    if benchmark.max_iterations is not None:
+        iterations = min(iterations, benchmark.max_iterations)
+        warmup = min(warmup, 1)
+    client, request = get_request(name, benchmark, context)
+
+    timings = []
+    for i in range(warmup + iterations):
+        if cold:
+            cache.clear()
+            if benchmark.login:
+                client.force_login(context.user)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            request()
+            elapsed = time.perf_counter() - start
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+
+    return {
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99),
+        'queries': len(queries),
+    }
+
+
+def run_concurrent(name, benchmark, context, requests=200, concurrency=8):
+    """
+    Make requests to URL of named benchmark from concurrency threads at
+    once, like worker threads of threaded WSGI server, each with its own
+    client and database connection. Returns dict of throughput (requests
+    per second) and latency percentiles (in ms).
+    """
+    if benchmark.max_iterations is not None:
+        requests = min(requests, benchmark.max_iterations * concurrency)
+    counter = count()
+    timings = []
+    # all threads start measured requests together, after warm up
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker():
+        try:
+            _, request = get_request(name, benchmark, context)
+            request()
+            barrier.wait()
+            while next(counter) < requests:
+                start = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - start) * 1000)
+        except Exception:
+            barrier.abort()
+            raise
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        futures = [executor.submit(worker) for _ in range(concurrency)]
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        start = time.perf_counter()
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+
+    return {
+        'throughput': len(timings) / elapsed,
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99),
+    }
+
+
+def run_benchmarks(names=None, log=lambda name, result: None,
+                   concurrency=None, **kwargs):
+    """
+    Run benchmarks of given URL names (all by default).
+    Returns dict of name -> result of run_benchmark(), or of
+    run_concurrent() if concurrency is given.
+    """
+    missing = set(get_url_names()) - set(BENCHMARKS)
+    if missing:
+        raise ValueError("No benchmark for URLs: {}".format(
+            ', '.join(sorted(missing))))
+    unknown = set(names or ()) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError("Unknown benchmarks: {}".format(
+            ', '.join(sorted(unknown))))
+
+    context = BenchmarkContext()
+    results = {}
+    for name in names or get_url_names():
+        benchmark = BENCHMARKS[name]
+        try:
+            if concurrency:
+                results[name] = run_concurrent(
+                    name, benchmark, context, concurrency=concurrency,
+                    **kwargs)
+            else:
+                results[name] = run_benchmark(name, benchmark, context,
+                                              **kwargs)
+        finally:
+            if benchmark.cleanup is not None:
+                benchmark.cleanup(context)
+        log(name, results[name])
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, slack=2.0):
+    """
+    Return list of regressions (name, metric, baseline value, value),
+    where p95 latency grew more than tolerance (fraction) plus slack (ms)
+    or number of queries grew at all.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result['p95'] > base['p95'] * (1 + tolerance) + slack:
+            regressions.append((name, 'p95', base['p95'], result['p95']))
+        if result['queries'] > base['queries']:
+            regressions.append(
+                (name, 'queries', base['queries'], result['queries']))
+    return regressions
@@ -0,0 +1,35 @@
+""" Bulk inserts of rows with explicitly set primary keys """
+
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+
+
+def get_next_pk(model):
+    return (model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0) + 1
+
+
+def reset_sequences(models):
+    """
+    Move primary key sequences past explicitly set pks
+    (no-op on SQLite).
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def bulk_create(model, objects, batch_size=5000):
+    """
+    Insert objects from iterable in batches, never holding more than
+    one batch in memory.
+    """
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            break
+        model.objects.bulk_create(batch)
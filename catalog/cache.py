@@ -0,0 +1,122 @@
+""" Versioned caching helpers """
+
+import time
+
+from django.core.cache import cache
+
+
+def get_version_key(name):
+    return 'catalog:version:{}'.format(name)
+
+
+def get_version(name):
+    """
+    Return current version number of named cached data.
+    Versions are part of cache keys, so bumping the version invalidates
+    all entries cached with the previous one.
+    """
+    key = get_version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # Start from current time, so version lost from cache (eg. after
+        # restart of cache server) doesn't come back to old values.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(names):
+    """
+    Return dict of name -> current version, for many names at once.
+    """
+    keys = {get_version_key(name): name for name in names}
+    versions = {keys[key]: version
+                for key, version in cache.get_many(keys).items()}
+    for name in names:
+        if name not in versions:
+            versions[name] = get_version(name)
+    return versions
+
+
+def bump_version(name):
+    """
+    Invalidate named cached data by incrementing its version.
+    """
+    key = get_version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # version not in cache yet
+        get_version(name)
+
+
+REGISTRY_KEY = 'catalog:registry:{}'
+
+
+def register(registry, name):
+    """
+    Add name to named registry shared by all processes (see
+    get_registered()). Every name is added once, to its own numbered
+    slot, so concurrent registrations don't overwrite each other.
+    """
+    key = REGISTRY_KEY.format(registry)
+    name_key = '{}:name:{}'.format(key, name)
+    if not cache.add(name_key, True, None):
+        return
+    count_key = key + ':count'
+    cache.add(count_key, 0, None)
+    try:
+        slot = cache.incr(count_key)
+    except ValueError:
+        # evicted in the meantime, register on the next call
+        cache.delete(name_key)
+        return
+    cache.set('{}:{}'.format(key, slot), name, None)
+
+
+def get_registered(registry):
+    """
+    Return set of names added to registry by register().
+    """
+    key = REGISTRY_KEY.format(registry)
+    count = cache.get(key + ':count', 0)
+    names = cache.get_many(['{}:{}'.format(key, slot)
+                            for slot in range(1, count + 1)])
+    return set(names.values())
+
+
+STATS_KEY = 'catalog:stats:{}:{}'
+STATS_REGISTRY = 'stats'
+
+
+def _increment(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted in the meantime
+            cache.set(key, 1, None)
+
+
+def record_hit(name):
+    register(STATS_REGISTRY, name)
+    _increment(STATS_KEY.format(name, 'hits'))
+
+
+def record_miss(name):
+    register(STATS_REGISTRY, name)
+    _increment(STATS_KEY.format(name, 'misses'))
+
+
+def get_stats():
+    """
+    Return dict of cache name -> {'hits': ..., 'misses': ...}.
+    """
+    names = get_registered(STATS_REGISTRY)
+    keys = {(name, kind): STATS_KEY.format(name, kind)
+            for name in names for kind in ('hits', 'misses')}
+    values = cache.get_many(keys.values())
+    stats = {}
+    for (name, kind), key in keys.items():
+        stats.setdefault(name, {})[kind] = values.get(key, 0)
+    return stats
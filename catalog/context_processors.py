@@ -1,4 +1,14 @@
+from django.core.cache import cache
+
 from catalog.models import Recipe, Category
+from catalog import cache as versioned_cache
+from catalog.profiling import profiled
+
+
+CATEGORIES_CACHE_KEY = 'catalog:categories:{}'
+
+# process-local copy of categories list: (version, list)
+_local_categories = (None, None)
 
 
 def latest_recipes(request):
@@ -12,6 +22,34 @@ def latest_recipes(request):
     return {'latest_recipes': recipes}
 
 
+def get_categories(version):
+    '''
+    Return list of all categories for given categories version,
+    from process-local copy, shared cache or database (in that order).
+    '''
+    global _local_categories
+    local_version, categories = _local_categories
+    if local_version == version:
+        return categories
+
+    key = CATEGORIES_CACHE_KEY.format(version)
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories, None)
+    _local_categories = (version, categories)
+    return categories
+
+
+@profiled('all_categories')
 def all_categories(request):
-    categories = Category.objects.all()
-    return {'all_categories': categories}
+    '''
+    Categories for navbar. Cached until any category is changed
+    (see catalog.signals). 'categories_version' can be used as key of
+    cached template fragments rendering categories.
+    '''
+    version = versioned_cache.get_version('categories')
+    return {
+        'all_categories': get_categories(version),
+        'categories_version': version,
+    }
@@ -0,0 +1,225 @@
+""" Streaming exports of recipes, favourites and comments
+
+Rows are fetched with QuerySet.iterator() in chunks of EXPORT_CHUNK_SIZE
+and written out as they come, so memory use doesn't depend on number
+of exported rows. Recipes are exported in the format read by
+import_recipes command (see catalog.importer).
+"""
+
+import csv
+import json
+import zlib
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from catalog.models import (
+    Recipe, RecipeIngredient, RecipeStep, Favourite, Comment)
+
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+# size of chunks of streamed output (bytes, before compression)
+BUFFER_SIZE = 64 * 1024
+
+STATUS_NAMES = {
+    Recipe.STATUS_DRAFT: 'draft',
+    Recipe.STATUS_PUBLISHED: 'published',
+}
+
+
+def iterate_chunks(queryset):
+    """
+    Yield lists of up to EXPORT_CHUNK_SIZE objects of queryset,
+    fetched with iterator().
+    """
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    objects = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(objects, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def group_by_recipe(rows):
+    """
+    Return dict of recipe id -> list of values, for (recipe id, value) rows.
+    """
+    groups = defaultdict(list)
+    for recipe_id, value in rows:
+        groups[recipe_id].append(value)
+    return groups
+
+
+# EXPORTED ROWS
+
+RECIPE_FIELDS = (
+    'id', 'title', 'description', 'status', 'author', 'categories',
+    'ingredients', 'directions', 'pub_date', 'edit_date', 'like_count',
+    'photo',
+)
+
+
+def recipe_rows(queryset):
+    # iterator() ignores prefetch_related(), and prefetching builds
+    # a queryset for every recipe anyway: related rows of every chunk
+    # are loaded with one plain query per relation instead
+    RecipeCategory = Recipe.categories.through
+    queryset = queryset.select_related('author').order_by('pk')
+    for chunk in iterate_chunks(queryset):
+        pks = [recipe.pk for recipe in chunk]
+        categories = group_by_recipe(RecipeCategory.objects
+                                     .filter(recipe_id__in=pks)
+                                     .order_by('recipe_id', 'category_id')
+                                     .values_list('recipe_id', 'category_id'))
+        ingredients = group_by_recipe(RecipeIngredient.objects
+                                      .filter(recipe_id__in=pks)
+                                      .values_list('recipe_id', 'desc'))
+        directions = group_by_recipe(RecipeStep.objects
+                                     .filter(recipe_id__in=pks)
+                                     .values_list('recipe_id', 'desc'))
+        for recipe in chunk:
+            yield {
+                'id': recipe.pk,
+                'title': recipe.title,
+                'description': recipe.description,
+                'status': STATUS_NAMES[recipe.status],
+                'author': recipe.author.username if recipe.author else None,
+                'categories': categories[recipe.pk],
+                'ingredients': ingredients[recipe.pk],
+                'directions': directions[recipe.pk],
+                'pub_date': recipe.pub_date,
+                'edit_date': recipe.edit_date,
+                'like_count': recipe.like_count,
+                'photo': recipe.photo.name or None,
+            }
+
+
+FAVOURITE_FIELDS = ('user_id', 'recipe_id', 'recipe_title', 'timestamp')
+
+
+def favourite_rows(queryset):
+    queryset = queryset\
+        .select_related('recipe')\
+        .only('user', 'timestamp', 'recipe', 'recipe__title')\
+        .order_by('pk')
+    for favourite in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield {
+            'user_id': favourite.user_id,
+            'recipe_id': favourite.recipe_id,
+            'recipe_title': favourite.recipe.title,
+            'timestamp': favourite.timestamp,
+        }
+
+
+COMMENT_FIELDS = ('id', 'user_id', 'recipe_id', 'pub_date', 'text')
+
+
+def comment_rows(queryset):
+    queryset = queryset.order_by('pk')
+    for comment in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield {
+            'id': comment.pk,
+            'user_id': comment.user_id,
+            'recipe_id': comment.recipe_id,
+            'pub_date': comment.pub_date,
+            'text': comment.text,
+        }
+
+
+def get_exports(user=None):
+    """
+    Return dict of export name -> (rows, fields) of user's recipes,
+    drafts, favourites and comments, or of the whole catalog (published
+    recipes, all favourites and comments) if user is None.
+    Rows are generators, queries run only when they are consumed.
+    """
+    if user is None:
+        return {
+            'recipes': (recipe_rows(Recipe.objects.filter(
+                status=Recipe.STATUS_PUBLISHED)), RECIPE_FIELDS),
+            'favourites': (favourite_rows(Favourite.objects.all()),
+                           FAVOURITE_FIELDS),
+            'comments': (comment_rows(Comment.objects.all()),
+                         COMMENT_FIELDS),
+        }
+    return {
+        'recipes': (recipe_rows(Recipe.objects.authored_by(
+            user, Recipe.STATUS_PUBLISHED)), RECIPE_FIELDS),
+        'drafts': (recipe_rows(Recipe.objects.authored_by(
+            user, Recipe.STATUS_DRAFT)), RECIPE_FIELDS),
+        'favourites': (favourite_rows(Favourite.objects.filter(user=user)),
+                       FAVOURITE_FIELDS),
+        'comments': (comment_rows(Comment.objects.filter(user=user)),
+                     COMMENT_FIELDS),
+    }
+
+
+# FORMATS
+
+def to_ndjson(fields, rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Line:
+    """
+    File-like object returning written line, for csv.writer.
+    """
+    def write(self, line):
+        return line
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        # lists of ingredients etc. in one cell, one item per line
+        return '\n'.join(str(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def to_csv(fields, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[field]) for field in fields])
+
+
+def encode(lines, compress=False):
+    """
+    Join text lines into byte chunks of about BUFFER_SIZE,
+    gzip-compressed on the fly if compress is True.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            if compress:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b''.join(buffer)
+    if compress:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export(rows, fields, format='ndjson', compress=False):
+    """
+    Return iterator of bytes of rows (see recipe_rows() etc.) in given
+    format (one of FORMATS).
+    """
+    serialize = to_csv if format == 'csv' else to_ndjson
+    return encode(serialize(fields, rows), compress)
@@ -0,0 +1,166 @@
+""" Liking recipes and cached sets of users' favourite recipes """
+
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from catalog.models import Recipe, Favourite
+from catalog.cache import bump_version
+from catalog.http_cache import purge_surrogate_keys, recipe_key
+from catalog import popularity
+from catalog.feed import invalidate_affinity
+
+
+def get_favourite_ids_key(user_id):
+    return 'catalog:favourites:{}'.format(user_id)
+
+
+def get_favourite_ids(user):
+    """
+    Return set of pks of recipes liked by user. Cached, so checking
+    favourite status of any number of recipes takes at most one query.
+    """
+    key = get_favourite_ids_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = set(Favourite.objects
+                  .filter(user=user)
+                  .values_list('recipe_id', flat=True))
+        cache.set(key, ids, settings.FAVOURITE_IDS_CACHE_TIMEOUT)
+    return ids
+
+
+def invalidate_favourite_ids(user_id):
+    """
+    Drop cached favourites of user, now and once current transaction
+    commits, so set read by concurrent request before the commit
+    doesn't stay in cache.
+    """
+    key = get_favourite_ids_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def favourite_added(favourite):
+    """
+    Update data derived from favourites after favourite was created.
+    """
+    Recipe.change_like_count(favourite.recipe_id, 1)
+    bump_version('recipe:{}:likes'.format(favourite.recipe_id))
+    purge_surrogate_keys(recipe_key(favourite.recipe_id))
+    invalidate_favourite_ids(favourite.user_id)
+    invalidate_affinity(favourite.user_id)
+
+
+def favourite_removed(favourite):
+    """
+    Update data derived from favourites after favourite was deleted.
+    """
+    favourites_removed([favourite])
+
+
+def favourites_removed(favourites):
+    """
+    Update data derived from favourites after they were deleted
+    (eg. by cascade from deleted user), with one UPDATE of like counts
+    per distinct number of removed likes and one of popularity scores.
+    """
+    if not favourites:
+        return
+    likes = Counter(favourite.recipe_id for favourite in favourites)
+    recipe_ids = defaultdict(list)
+    for recipe_id, count in likes.items():
+        recipe_ids[count].append(recipe_id)
+    for count, ids in recipe_ids.items():
+        Recipe.change_like_counts(ids, -count)
+    for recipe_id in likes:
+        bump_version('recipe:{}:likes'.format(recipe_id))
+    purge_surrogate_keys(*[recipe_key(recipe_id) for recipe_id in likes])
+    for user_id in {favourite.user_id for favourite in favourites}:
+        invalidate_favourite_ids(user_id)
+        invalidate_affinity(user_id)
+    popularity.remove_favourites(favourites)
+
+
+def get_like_count(recipe_id):
+    """
+    Return like count of published recipe, or None if there is no such
+    recipe.
+    """
+    return Recipe.objects\
+        .filter(pk=recipe_id, status=Recipe.STATUS_PUBLISHED)\
+        .values_list('like_count', flat=True)\
+        .first()
+
+
+def qn(name):
+    return connection.ops.quote_name(name)
+
+
+def to_datetime(value):
+    # SQLite returns datetimes from raw queries as strings or naive
+    # datetimes (stored in UTC)
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+@transaction.atomic
+def add_favourite(user, recipe_id):
+    """
+    Add published recipe to user's favourites. Idempotent and safe for
+    concurrent requests: the row is inserted by single conditional
+    INSERT, relying on favourite_unique constraint.
+    INSERT ... ON CONFLICT and DELETE ... RETURNING (see remove_favourite())
+    need PostgreSQL or SQLite 3.35+.
+    Returns (created, like count), like count is None if there is no
+    such published recipe.
+    Signals aren't sent, side effects are applied explicitly.
+    """
+    timestamp = Favourite._meta.get_field('timestamp')\
+        .get_db_prep_value(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {favourite} (user_id, recipe_id, {timestamp}) '
+            'SELECT %s, id, %s FROM {recipe} WHERE id = %s AND status = %s '
+            'ON CONFLICT (user_id, recipe_id) DO NOTHING'.format(
+                favourite=qn(Favourite._meta.db_table),
+                recipe=qn(Recipe._meta.db_table),
+                timestamp=qn('timestamp')),
+            [user.pk, timestamp, recipe_id, Recipe.STATUS_PUBLISHED])
+        created = cursor.rowcount == 1
+
+    if created:
+        favourite_added(Favourite(user_id=user.pk, recipe_id=recipe_id))
+    return created, get_like_count(recipe_id)
+
+
+@transaction.atomic
+def remove_favourite(user, recipe_id):
+    """
+    Remove recipe from user's favourites, with single DELETE statement.
+    Idempotent and safe for concurrent requests.
+    Returns (deleted, like count), like count is None if there is no
+    such published recipe.
+    Signals aren't sent, side effects are applied explicitly.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {favourite} WHERE user_id = %s AND recipe_id = %s '
+            'RETURNING id, {timestamp}'.format(
+                favourite=qn(Favourite._meta.db_table),
+                timestamp=qn('timestamp')),
+            [user.pk, recipe_id])
+        row = cursor.fetchone()
+
+    if row is not None:
+        favourite_removed(Favourite(
+            pk=row[0], user_id=user.pk, recipe_id=recipe_id,
+            timestamp=to_datetime(row[1])))
+    return row is not None, get_like_count(recipe_id)
@@ -0,0 +1,106 @@
+""" Personalized "for you" feed, ranked by users' category affinity """
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from catalog.models import Recipe, Favourite
+from catalog.cache import record_hit, record_miss
+
+
+def decay(age):
+    """
+    Return weight of a favourite or recipe of given age (timedelta),
+    halving every FEED_HALF_LIFE_DAYS.
+    """
+    half_life = settings.FEED_HALF_LIFE_DAYS * 24 * 3600
+    return 0.5 ** (max(age.total_seconds(), 0) / half_life)
+
+
+def get_affinity_key(user_id):
+    return 'catalog:feed:affinity:{}'.format(user_id)
+
+
+def compute_affinity(user_id, now=None):
+    """
+    Return tuple of (category slug, weight) pairs of up to FEED_CATEGORIES
+    categories of recipes recently liked by user, the strongest first.
+    Every favourite adds its decayed weight to each of recipe's
+    categories, weights are normalized to sum up to 1.
+    """
+    now = now or timezone.now()
+    rows = Favourite.objects\
+        .filter(user_id=user_id)\
+        .order_by('-timestamp')\
+        .values_list('timestamp', 'recipe__categories')
+    weights = defaultdict(float)
+    for timestamp, slug in rows[:settings.FEED_MAX_FAVOURITES]:
+        if slug is not None:
+            weights[slug] += decay(now - timestamp)
+
+    strongest = sorted(weights.items(), key=lambda item: (-item[1], item[0]))
+    strongest = strongest[:settings.FEED_CATEGORIES]
+    total = sum(weight for _, weight in strongest)
+    return tuple((slug, round(weight / total, 4))
+                 for slug, weight in strongest)
+
+
+def get_affinity(user):
+    """
+    Return cached category affinity of user (see compute_affinity()).
+    Recomputed after user's favourites change, or FEED_AFFINITY_TIMEOUT
+    seconds, so older favourites fade away.
+    """
+    key = get_affinity_key(user.pk)
+    affinity = cache.get(key)
+    if affinity is None:
+        record_miss('feed')
+        affinity = compute_affinity(user.pk)
+        cache.set(key, affinity, settings.FEED_AFFINITY_TIMEOUT)
+    else:
+        record_hit('feed')
+    return affinity
+
+
+def invalidate_affinity(user_id):
+    """
+    Drop cached affinity of user, now and once current transaction
+    commits (see catalog.favourites.invalidate_favourite_ids()).
+    """
+    key = get_affinity_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_feed(user, exclude=(), now=None):
+    """
+    Return list of up to FEED_SIZE published recipes (cards) for user,
+    skipping recipes with pks in exclude.
+    Candidates are FEED_CANDIDATES newest recipes in user's affinity
+    categories, found by walking recipes' publication date index,
+    ranked by summed affinity of their categories times recency.
+    Takes two queries, plus one to recompute affinity if not cached.
+    """
+    affinity = dict(get_affinity(user))
+    if not affinity:
+        return []
+    now = now or timezone.now()
+
+    # one row per recipe's matching category
+    rows = Recipe.objects\
+        .filter(status=Recipe.STATUS_PUBLISHED,
+                categories__in=list(affinity))\
+        .order_by('-pub_date', '-edit_date', '-id')\
+        .values_list('pk', 'categories', 'pub_date')
+    scores = defaultdict(float)
+    for pk, slug, pub_date in rows[:settings.FEED_CANDIDATES]:
+        if pk not in exclude:
+            scores[pk] += affinity[slug] * decay(now - pub_date)
+
+    ranked = sorted(scores, key=lambda pk: (-scores[pk], -pk))
+    ranked = ranked[:settings.FEED_SIZE]
+    recipes = Recipe.objects.cards().in_bulk(ranked)
+    return [recipes[pk] for pk in ranked if pk in recipes]
@@ -0,0 +1,232 @@
+""" Full response caching for anonymous users, purged by surrogate keys """
+
+import hashlib
+import urllib.request
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import (
+    cc_delim_re, get_conditional_response, patch_cache_control)
+from django.utils.http import parse_http_date_safe
+
+from catalog.cache import (
+    get_versions, bump_version, record_hit, record_miss)
+from catalog.jobs import enqueue
+
+
+# Surrogate keys tagging cached responses. Purging a key invalidates
+# all responses tagged with it.
+CATEGORIES_KEY = 'categories'  # navbar, on every page
+RECIPES_KEY = 'recipes'  # lists of newest recipes, search
+POPULAR_KEY = 'popular'  # popular recipes leaderboard
+SIMILAR_KEY = 'similar'  # similar recipes, on recipe's page
+
+
+def recipe_key(pk):
+    return 'recipe-{}'.format(pk)
+
+
+def category_key(slug):
+    return 'category-{}'.format(slug)
+
+
+def user_key(pk):
+    return 'user-{}'.format(pk)
+
+
+def published_recipe_keys(recipe):
+    """
+    Return surrogate keys of pages showing published recipe:
+    its own page, lists of newest recipes, its author's and categories'.
+    """
+    keys = [recipe_key(recipe.pk), RECIPES_KEY, user_key(recipe.author_id)]
+    keys += [category_key(slug) for slug
+             in recipe.categories.values_list('slug', flat=True)]
+    return keys
+
+
+def add_surrogate_keys(request, *keys):
+    """
+    Tag response to request with surrogate keys. Only tagged responses
+    are cached by HttpCacheMiddleware.
+    """
+    if not hasattr(request, 'surrogate_keys'):
+        request.surrogate_keys = set()
+    request.surrogate_keys.update(keys)
+
+
+def get_version_name(key):
+    return 'surrogate:{}'.format(key)
+
+
+def bump_key_versions(keys):
+    for key in keys:
+        bump_version(get_version_name(key))
+
+
+def purge_surrogate_keys(*keys):
+    """
+    Invalidate cached responses tagged with any of given keys,
+    in local cache and (if HTTP_CACHE_PURGE_URL is set) in reverse proxy.
+    Versions are bumped now and once current transaction commits, so
+    response rendered by concurrent request before the commit doesn't
+    stay in cache (see catalog.favourites.invalidate_favourite_ids()).
+    """
+    bump_key_versions(keys)
+    if keys:
+        transaction.on_commit(lambda: bump_key_versions(keys))
+    if keys and settings.HTTP_CACHE_PURGE_URL:
+        enqueue('purge_surrogate_keys', keys=sorted(set(keys)))
+
+
+def send_purge_requests(keys):
+    """
+    Send PURGE request for every key to HTTP_CACHE_PURGE_URL
+    (with '{key}' placeholder). Run by background job, so failed
+    requests are retried.
+    """
+    for key in keys:
+        url = settings.HTTP_CACHE_PURGE_URL.format(key=key)
+        request = urllib.request.Request(url, method='PURGE')
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+
+
+class SurrogateKeysMixin:
+    """
+    View mixin tagging response with surrogate keys, making it cacheable
+    for anonymous users. Pages are tagged with categories shown in navbar
+    and recipes listed in context_object_name.
+    """
+    surrogate_keys = (CATEGORIES_KEY,)
+
+    def get_surrogate_keys(self, context):
+        keys = list(self.surrogate_keys)
+        recipes = context.get(self.context_object_name) or ()
+        keys.extend(recipe_key(recipe.pk) for recipe in recipes)
+        return keys
+
+    def render_to_response(self, context, **response_kwargs):
+        add_surrogate_keys(self.request, *self.get_surrogate_keys(context))
+        return super().render_to_response(context, **response_kwargs)
+
+
+class HttpCacheMiddleware:
+    """
+    Caches full responses of GET requests of anonymous users, if the view
+    tagged them with surrogate keys (see add_surrogate_keys()).
+
+    With HTTP_CACHE_MODE = 'local', responses are stored in django's cache
+    together with versions of their keys; response is served from cache
+    as long as none of its keys was purged.
+    With HTTP_CACHE_MODE = 'headers', responses get Cache-Control and
+    Surrogate-Key headers, leaving caching to a reverse proxy.
+
+    Must be placed after AuthenticationMiddleware and MessageMiddleware.
+    """
+    key_prefix = 'catalog:http'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable_request(request):
+            return self.get_response(request)
+
+        local = settings.HTTP_CACHE_MODE == 'local'
+        if local:
+            response = self.get_cached_response(request)
+            if response is not None:
+                record_hit('http')
+                return response
+
+        response = self.get_response(request)
+        keys = getattr(request, 'surrogate_keys', None)
+        if not keys or not self.is_cacheable_response(request, response):
+            return response
+
+        if local:
+            record_miss('http')
+            self.store_response(request, response, keys)
+        else:
+            patch_cache_control(response, public=True, max_age=0,
+                                s_maxage=settings.HTTP_CACHE_TIMEOUT)
+            response['Surrogate-Key'] = ' '.join(sorted(keys))
+        return response
+
+    def is_cacheable_request(self, request):
+        # pages with user's data and messages can't be shared
+        return (request.method == 'GET'
+                and not request.user.is_authenticated
+                and not len(get_messages(request)))
+
+    def is_cacheable_response(self, request, response):
+        if response.status_code != 200 or response.streaming:
+            return False
+        # response sets cookies or has form with user's csrf token
+        if response.cookies or request.META.get('CSRF_COOKIE_USED'):
+            return False
+        cache_control = response.get('Cache-Control', '')
+        return 'private' not in cache_control and 'no-' not in cache_control
+
+    def get_url_hash(self, request):
+        url = request.build_absolute_uri()
+        return hashlib.md5(url.encode()).hexdigest()
+
+    def get_headers_key(self, request):
+        return '{}:headers:{}'.format(self.key_prefix,
+                                      self.get_url_hash(request))
+
+    def get_response_key(self, request, vary_headers):
+        """
+        Key of response to request, for given list of Vary headers.
+        Cookie header is skipped: only anonymous users without
+        messages are served, so cookies don't change the response.
+        """
+        values = [request.META.get(
+            'HTTP_' + header.upper().replace('-', '_'), '')
+            for header in vary_headers if header.lower() != 'cookie']
+        vary_hash = hashlib.md5(repr(values).encode()).hexdigest()
+        return '{}:response:{}:{}'.format(
+            self.key_prefix, self.get_url_hash(request), vary_hash)
+
+    def get_cached_response(self, request):
+        vary_headers = cache.get(self.get_headers_key(request))
+        if vary_headers is None:
+            return None
+        entry = cache.get(self.get_response_key(request, vary_headers))
+        if entry is None:
+            return None
+
+        content, headers, versions = entry
+        current = get_versions(versions.keys())
+        if current != versions:
+            # some of the keys were purged
+            return None
+
+        response = HttpResponse(content)
+        for header, value in headers:
+            response[header] = value
+        # revalidation of responses with validators (eg. API)
+        last_modified = response.get('Last-Modified')
+        if last_modified:
+            last_modified = parse_http_date_safe(last_modified)
+        return get_conditional_response(
+            request, etag=response.get('ETag'),
+            last_modified=last_modified, response=response)
+
+    def store_response(self, request, response, keys):
+        if response.has_header('Vary'):
+            vary_headers = cc_delim_re.split(response['Vary'])
+        else:
+            vary_headers = []
+        timeout = settings.HTTP_CACHE_TIMEOUT
+        cache.set(self.get_headers_key(request), vary_headers, timeout)
+
+        versions = get_versions([get_version_name(key) for key in keys])
+        headers = [(header, value) for header, value in response.items()]
+        cache.set(self.get_response_key(request, vary_headers),
+                  (response.content, headers, versions), timeout)
@@ -0,0 +1,77 @@
+""" Resized WebP versions (derivatives) of recipes' photos """
+
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from catalog.models import Recipe
+from catalog.http_cache import purge_surrogate_keys, published_recipe_keys
+
+
+WEBP_QUALITY = 80
+DERIVATIVES_DIR = 'user_photos/derivatives'
+
+
+def get_derivative_name(recipe, field):
+    base = os.path.splitext(os.path.basename(recipe.photo.name))[0]
+    return '{}/{}_{}.webp'.format(DERIVATIVES_DIR, base, field.split('_')[-1])
+
+
+def resize(image, width):
+    """
+    Return copy of image scaled down to given width, keeping aspect ratio.
+    Images narrower than width are not upscaled.
+    """
+    if image.width <= width:
+        return image.copy()
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def generate_derivatives(recipe):
+    """
+    Create WebP derivatives of recipe's photo and store their paths
+    in recipe's photo_* fields. Derivatives are never upscaled, the
+    first one at least as wide as the original photo is the last one
+    created.
+    Recipe's edit_date is not changed, cached pages of published recipe
+    are purged instead. Previous derivatives are deleted only after new
+    ones are stored, so pages cached meanwhile don't show missing files.
+    """
+    fields = [field for field, _ in Recipe.PHOTO_DERIVATIVES]
+    old_names = [getattr(recipe, field).name for field in fields
+                 if getattr(recipe, field)]
+    for field in fields:
+        setattr(recipe, field, None)
+
+    if recipe.photo:
+        with recipe.photo.open('rb') as photo:
+            image = Image.open(photo)
+            # apply camera rotation, as EXIF isn't kept in derivatives
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+        for field, width in Recipe.PHOTO_DERIVATIVES:
+            content = BytesIO()
+            resize(image, width).save(
+                content, 'WEBP', quality=WEBP_QUALITY, method=6)
+            # storage picks a new name, as old file still exists
+            getattr(recipe, field).save(
+                get_derivative_name(recipe, field),
+                ContentFile(content.getvalue()), save=False)
+            # bigger ones would be the same, full-size image
+            if image.width <= width:
+                break
+
+    # plain update, so auto_now edit_date stays the same
+    names = {field: getattr(recipe, field).name or None for field in fields}
+    Recipe.objects.filter(pk=recipe.pk).update(**names)
+    if recipe.status == Recipe.STATUS_PUBLISHED:
+        purge_surrogate_keys(*published_recipe_keys(recipe))
+
+    storage = recipe.photo.storage
+    for name in old_names:
+        # file missing from storage could have been replaced by new one
+        if name not in names.values():
+            storage.delete(name)
@@ -0,0 +1,345 @@
+""" Streaming bulk import of recipes from NDJSON files
+
+Every line of imported file is a JSON object:
+
+    {"title": "Tomato soup", "description": "...",
+     "author": "username", "categories": ["soups", "Vegetarian"],
+     "ingredients": ["1 kg tomatoes", ...], "directions": ["...", ...],
+     "status": "published", "pub_date": "2020-05-01T12:00:00Z",
+     "photo": "tomato-soup.jpg"}
+
+Only title and categories (slugs or names) are required. Status is
+'published' (default, needs ingredients and directions) or 'draft'.
+Photo is a path relative to photos directory given to RecipeImporter.
+"""
+
+import json
+import os
+from itertools import islice
+
+from PIL import Image
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from catalog.models import (
+    Recipe, RecipeIngredient, RecipeStep, Category, ImportCheckpoint)
+from catalog.bulk import bulk_create, get_next_pk, reset_sequences
+from catalog.jobs import enqueue_many
+from catalog.http_cache import (
+    purge_surrogate_keys, RECIPES_KEY, category_key, user_key)
+
+
+TITLE_MAX_LENGTH = Recipe._meta.get_field('title').max_length
+DESC_MAX_LENGTH = RecipeIngredient._meta.get_field('desc').max_length
+STATUSES = {
+    'draft': Recipe.STATUS_DRAFT,
+    'published': Recipe.STATUS_PUBLISHED,
+}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+# PARSING
+
+def _get_string(record, key, default=None, max_length=None):
+    value = record.get(key, default)
+    if value is not None and not isinstance(value, str):
+        raise InvalidRecord("'{}' must be a string.".format(key))
+    if value is not None and max_length and len(value) > max_length:
+        raise InvalidRecord("'{}' is longer than {} characters.".format(
+            key, max_length))
+    return value
+
+
+def _get_strings(record, key, max_length=None):
+    values = record.get(key, [])
+    if (not isinstance(values, list)
+            or not all(isinstance(value, str) for value in values)):
+        raise InvalidRecord("'{}' must be a list of strings.".format(key))
+    values = [value.strip() for value in values if value.strip()]
+    if max_length and any(len(value) > max_length for value in values):
+        raise InvalidRecord("'{}' has items longer than {} characters."
+                            .format(key, max_length))
+    return values
+
+
+def parse_record(line):
+    """
+    Parse and validate one line of imported file (bytes) into dict
+    of recipe's data. Doesn't use the database, so it can be run
+    by worker processes. Raises InvalidRecord.
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise InvalidRecord("Invalid JSON: {}".format(e))
+    if not isinstance(record, dict):
+        raise InvalidRecord("Line must be a JSON object.")
+
+    title = (_get_string(record, 'title', max_length=TITLE_MAX_LENGTH)
+             or '').strip()
+    if not title:
+        raise InvalidRecord("'title' is required.")
+    data = {
+        'title': title,
+        'description': _get_string(record, 'description', ''),
+        'author': _get_string(record, 'author'),
+        'categories': _get_strings(record, 'categories'),
+        'ingredients': _get_strings(record, 'ingredients', DESC_MAX_LENGTH),
+        'directions': _get_strings(record, 'directions', DESC_MAX_LENGTH),
+        'photo': _get_string(record, 'photo'),
+    }
+    if not data['categories']:
+        raise InvalidRecord("'categories' can't be empty.")
+
+    status = record.get('status', 'published')
+    if status not in STATUSES:
+        raise InvalidRecord("Unknown status: {!r}.".format(status))
+    data['status'] = STATUSES[status]
+    if (data['status'] == Recipe.STATUS_PUBLISHED
+            and not (data['ingredients'] and data['directions'])):
+        raise InvalidRecord(
+            "Published recipe must have ingredients and directions.")
+
+    pub_date = _get_string(record, 'pub_date')
+    if pub_date is not None:
+        try:
+            pub_date = parse_datetime(pub_date)
+        except ValueError:
+            pub_date = None
+        if pub_date is None:
+            raise InvalidRecord("Invalid 'pub_date'.")
+        if timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date, timezone.utc)
+    data['pub_date'] = pub_date
+
+    photo = data['photo']
+    if photo is not None and (os.path.isabs(photo) or os.path.normpath(
+            photo).split(os.sep)[0] == os.pardir):
+        raise InvalidRecord("'photo' must be a relative path.")
+    return data
+
+
+def parse_line(item):
+    """
+    Return (line number, data, error) for (line number, line) item.
+    """
+    number, line = item
+    try:
+        return number, parse_record(line), None
+    except InvalidRecord as e:
+        return number, None, str(e)
+
+
+def read_batches(file, batch_size, offset=0, number=0):
+    """
+    Yield batches of lines of binary file, starting at offset (in bytes)
+    of line with given number, as (list of (line number, line) items,
+    offset and number of the next line). Blank lines are skipped.
+    """
+    file.seek(offset)
+    while True:
+        lines = list(islice(file, batch_size))
+        if not lines:
+            return
+        items = []
+        for line in lines:
+            number += 1
+            offset += len(line)
+            if line.strip():
+                items.append((number, line))
+        yield items, offset, number
+
+
+def parse_batches(batches, pool=None):
+    """
+    Yield batches from read_batches() with lines replaced by results
+    of parse_line(). With multiprocessing pool, lines are parsed by
+    its workers, the next batch while the current one is consumed.
+    """
+    if pool is None:
+        for items, offset, number in batches:
+            yield [parse_line(item) for item in items], offset, number
+        return
+
+    pending = None
+    for items, offset, number in batches:
+        result = pool.map_async(parse_line, items)
+        if pending is not None:
+            yield pending[0].get(), pending[1], pending[2]
+        pending = (result, offset, number)
+    if pending is not None:
+        yield pending[0].get(), pending[1], pending[2]
+
+
+# CHECKPOINTS
+
+CHECKPOINT_FIELDS = ('offset', 'line', 'imported', 'invalid')
+
+
+def load_checkpoint(name):
+    """
+    Return import state (offset and number of the next line, counts of
+    imported and invalid records) saved by save_checkpoint(), or None.
+    """
+    checkpoint = ImportCheckpoint.objects.filter(name=name).first()
+    if checkpoint is None:
+        return None
+    return {field: getattr(checkpoint, field)
+            for field in CHECKPOINT_FIELDS}
+
+
+def save_checkpoint(name, state):
+    """
+    Save import state after a batch. Should run in the batch's
+    transaction, so saved state is committed together with the batch.
+    """
+    ImportCheckpoint.objects.update_or_create(
+        name=name,
+        defaults={field: state[field] for field in CHECKPOINT_FIELDS})
+
+
+def delete_checkpoint(name):
+    ImportCheckpoint.objects.filter(name=name).delete()
+
+
+# IMPORTING
+
+class RecipeImporter:
+    """
+    Inserts parsed recipes in bulk, with explicit pks, so ingredients,
+    directions and categories rows can be inserted in bulk too.
+    Authors (usernames) and categories (slugs or case insensitive names)
+    are resolved with lookup maps loaded once.
+    Signals aren't sent: search indexing, ingredients normalization and
+    photo derivatives are queued as background jobs (unless enqueue_jobs
+    is False) and cached pages are purged explicitly.
+
+    Recipes' pks are taken after the highest existing one, so the import
+    shouldn't run together with other writes of recipes.
+    """
+    def __init__(self, default_author=None, photos_dir=None,
+                 enqueue_jobs=True):
+        self.authors = dict(User.objects.values_list('username', 'pk'))
+        self.categories = {}
+        for slug, name in Category.objects.values_list('slug', 'name'):
+            self.categories[name.lower()] = slug
+            self.categories[slug] = slug
+
+        self.default_author_id = None
+        if default_author is not None:
+            if default_author not in self.authors:
+                raise ValueError(
+                    "Unknown user: {}".format(default_author))
+            self.default_author_id = self.authors[default_author]
+        self.photos_dir = photos_dir
+        self.enqueue_jobs = enqueue_jobs
+
+    def get_author_id(self, data):
+        if data['author'] is None:
+            if self.default_author_id is None:
+                raise InvalidRecord("'author' is required.")
+            return self.default_author_id
+        try:
+            return self.authors[data['author']]
+        except KeyError:
+            raise InvalidRecord("Unknown author: {}".format(data['author']))
+
+    def get_category_slugs(self, data):
+        slugs = set()
+        for category in data['categories']:
+            slug = self.categories.get(
+                category, self.categories.get(category.lower()))
+            if slug is None:
+                raise InvalidRecord("Unknown category: {}".format(category))
+            slugs.add(slug)
+        return slugs
+
+    def attach_photo(self, recipe, photo):
+        """
+        Copy photo from photos directory to recipe's photo storage.
+        Photos of batches which fail later are left in the storage.
+        """
+        if self.photos_dir is None:
+            raise InvalidRecord("Photo given, but no photos directory.")
+        path = os.path.join(self.photos_dir, photo)
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except (OSError, SyntaxError) as e:
+            raise InvalidRecord("Invalid photo {}: {}".format(photo, e))
+        with open(path, 'rb') as file:
+            recipe.photo.save(os.path.basename(photo), File(file),
+                              save=False)
+
+    def import_batch(self, records):
+        """
+        Insert list of (line number, data) records, with pks following
+        the highest existing one. Should run in a transaction.
+        Returns (number of imported recipes, number of inserted rows,
+        list of (line number, error) of rejected records).
+        """
+        now = timezone.now()
+        first_pk = get_next_pk(Recipe)
+        RecipeCategory = Recipe.categories.through
+        recipes, ingredients, directions, categories = [], [], [], []
+        errors = []
+        purged_keys = set()
+
+        for number, data in records:
+            pk = first_pk + len(recipes)
+            try:
+                author_id = self.get_author_id(data)
+                slugs = self.get_category_slugs(data)
+                recipe = Recipe(
+                    pk=pk, author_id=author_id, status=data['status'],
+                    title=data['title'], description=data['description'],
+                    pub_date=data['pub_date'])
+                if data['photo'] is not None:
+                    self.attach_photo(recipe, data['photo'])
+            except InvalidRecord as e:
+                errors.append((number, str(e)))
+                continue
+
+            if (recipe.status == Recipe.STATUS_PUBLISHED
+                    and recipe.pub_date is None):
+                recipe.pub_date = now
+            recipes.append(recipe)
+            ingredients += [
+                RecipeIngredient(recipe_id=pk, position=position, desc=desc)
+                for position, desc in enumerate(data['ingredients'])]
+            directions += [
+                RecipeStep(recipe_id=pk, position=position, desc=desc)
+                for position, desc in enumerate(data['directions'])]
+            categories += [RecipeCategory(recipe_id=pk, category_id=slug)
+                           for slug in slugs]
+            if recipe.status == Recipe.STATUS_PUBLISHED:
+                purged_keys.add(user_key(author_id))
+                purged_keys.update(category_key(slug) for slug in slugs)
+
+        Recipe.objects.bulk_create(recipes)
+        bulk_create(RecipeIngredient, ingredients)
+        bulk_create(RecipeStep, directions)
+        bulk_create(RecipeCategory, categories)
+        reset_sequences([Recipe])
+
+        if self.enqueue_jobs:
+            enqueue_many('update_recipe_ingredients', [
+                {'recipe_id': recipe.pk} for recipe in recipes])
+            enqueue_many('index_recipe', [
+                {'recipe_id': recipe.pk} for recipe in recipes
+                if recipe.status == Recipe.STATUS_PUBLISHED])
+            enqueue_many('generate_photo_derivatives', [
+                {'recipe_id': recipe.pk} for recipe in recipes
+                if recipe.photo])
+        if purged_keys:
+            purge_surrogate_keys(RECIPES_KEY, *purged_keys)
+
+        rows = (len(recipes) + len(ingredients) + len(directions)
+                + len(categories))
+        return len(recipes), rows, errors
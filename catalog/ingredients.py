@@ -0,0 +1,141 @@
+""" Ingredient normalization and 'what can I cook' queries """
+
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, FloatField, ExpressionWrapper
+
+from catalog.models import Recipe, Ingredient
+
+
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+
+WORD_RE = re.compile(r'[^\W\d_]+')
+PARENTHESES_RE = re.compile(r'\(.*?\)')
+
+# all words below are in singular form, since words are singularized
+# before filtering
+UNITS = frozenset((
+    'g', 'gram', 'gramme', 'kg', 'kilogram', 'dag', 'dkg', 'mg',
+    'l', 'liter', 'litre', 'ml', 'dl', 'cl',
+    'oz', 'ounce', 'lb', 'pound',
+    'cup', 'glass', 'mug', 'tsp', 'teaspoon', 'tbsp', 'tablespoon',
+    'pinch', 'dash', 'handful', 'clove', 'slice', 'piece', 'pcs', 'pc',
+    'can', 'tin', 'jar', 'package', 'pack', 'packet', 'bag', 'bunch',
+    'sprig', 'stick', 'drop', 'splash', 'knob', 'head',
+))
+DESCRIPTORS = frozenset((
+    'a', 'an', 'and', 'or', 'of', 'to', 'for', 'the', 'some', 'few',
+    'taste', 'optional', 'about', 'approx', 'approximately',
+    'large', 'big', 'medium', 'small', 'little', 'whole', 'half',
+    'fresh', 'freshly', 'dried', 'frozen', 'raw', 'cooked', 'ripe',
+    'chopped', 'finely', 'roughly', 'diced', 'minced', 'sliced', 'grated',
+    'crushed', 'ground', 'peeled', 'melted', 'softened', 'beaten',
+    'boiled', 'heaped', 'level', 'extra',
+))
+# plural -> singular forms, not handled by suffix rules
+IRREGULAR_PLURALS = {
+    'leaves': 'leaf',
+    'loaves': 'loaf',
+    'halves': 'half',
+    'knives': 'knife',
+    'teeth': 'tooth',
+    'feet': 'foot',
+    'geese': 'goose',
+    'mice': 'mouse',
+}
+# words ending with 's' which are not plurals (and not ending with
+# 'ss', 'us' or 'is')
+NOT_PLURALS = frozenset(('molasses', 'brussels', 'series', 'species'))
+
+
+def singularize(word):
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word in NOT_PLURALS or len(word) < 4:
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'sses', 'xes', 'zes', 'oes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(text):
+    """
+    Return normalized ingredient name from free-text ingredient entry,
+    eg. '2 cups of finely chopped onions, peeled' -> 'onion'.
+    Quantities, units, preparation descriptors and parenthesized notes
+    are dropped and words are singularized.
+    Returns empty string if nothing is left.
+    """
+    text = PARENTHESES_RE.sub(' ', text.lower())
+    # part after comma is usually a preparation note
+    text = text.split(',')[0]
+    # isalpha() drops vulgar fractions like '½', matched by WORD_RE
+    words = [singularize(word) for word in WORD_RE.findall(text)
+             if word.isalpha()]
+    words = [word for word in words
+             if word not in UNITS and word not in DESCRIPTORS]
+    return ' '.join(words)[:NAME_MAX_LENGTH].strip()
+
+
+def get_ingredients(names):
+    """
+    Return Ingredient objects for given normalized names,
+    creating missing ones.
+    """
+    names = set(names)
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name) for name in names],
+        ignore_conflicts=True,
+    )
+    return Ingredient.objects.filter(name__in=names)
+
+
+@transaction.atomic
+def update_recipe_ingredients(recipe):
+    """
+    Set recipe's normalized ingredients from its ingredients list.
+    """
+    names = {normalize_ingredient(ingredient['desc'])
+             for ingredient in recipe.ingredients_list}
+    names.discard('')
+    recipe.normalized_ingredients.set(get_ingredients(names))
+    recipe.ingredient_count = len(names)
+    Recipe.objects.filter(pk=recipe.pk).update(
+        ingredient_count=recipe.ingredient_count)
+
+
+def find_recipes(pantry):
+    """
+    Return list of (recipe pk, matched, total) tuples of published recipes
+    using any of pantry ingredients (free-text entries), where 'matched'
+    is number of recipe's ingredients found in pantry and 'total' number
+    of all recipe's ingredients (denormalized ingredient_count).
+    List is sorted by coverage (matched/total), then by matched, and
+    limited to INGREDIENTS_MAX_RESULTS recipes.
+    Only index entries of pantry ingredients are read.
+    """
+    names = {normalize_ingredient(text) for text in pantry}
+    names.discard('')
+    if not names:
+        return []
+
+    NormalizedIngredient = Recipe.normalized_ingredients.through
+    matches = NormalizedIngredient.objects\
+        .filter(ingredient__name__in=names,
+                recipe__status=Recipe.STATUS_PUBLISHED,
+                recipe__ingredient_count__gt=0)\
+        .order_by()\
+        .values('recipe', 'recipe__ingredient_count')\
+        .annotate(matched=Count('pk'))\
+        .annotate(coverage=ExpressionWrapper(
+            F('matched') * 1.0 / F('recipe__ingredient_count'),
+            output_field=FloatField()))\
+        .order_by('-coverage', '-matched', '-recipe')\
+        .values_list('recipe', 'matched', 'recipe__ingredient_count')
+    return list(matches[:settings.INGREDIENTS_MAX_RESULTS])
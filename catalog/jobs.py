@@ -0,0 +1,193 @@
+""" Database-backed background job queue """
+
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from catalog.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# name -> function, filled by @task decorator (see catalog.tasks)
+TASKS = {}
+
+
+def task(name):
+    """
+    Register decorated function as task run by jobs with given name.
+    """
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, **kwargs):
+    """
+    Schedule task with given keyword arguments (json serializable).
+    Job is saved in current transaction, so it won't be run if the
+    transaction is rolled back.
+    """
+    if name not in TASKS:
+        raise ValueError("Unknown task: {}".format(name))
+    return Job.objects.create(
+        name=name, payload=json.dumps(kwargs), run_at=timezone.now())
+
+
+def enqueue_many(name, kwargs_list):
+    """
+    Schedule task once for every dict of keyword arguments in kwargs_list,
+    with single bulk INSERT. See enqueue().
+    """
+    if name not in TASKS:
+        raise ValueError("Unknown task: {}".format(name))
+    now = timezone.now()
+    return Job.objects.bulk_create([
+        Job(name=name, payload=json.dumps(kwargs), run_at=now)
+        for kwargs in kwargs_list
+    ])
+
+
+def get_retry_delay(attempts):
+    """
+    Return delay before next attempt, doubling with every failed one.
+    """
+    return timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def requeue_stale_jobs(now=None):
+    """
+    Return jobs left running by crashed workers to the queue.
+    """
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_TIMEOUT)
+    return Job.objects\
+        .filter(status=Job.STATUS_RUNNING, started__lt=stale)\
+        .update(status=Job.STATUS_PENDING, run_at=now)
+
+
+def claim_job(now=None):
+    """
+    Mark first due job as running and return it, or None if there is
+    no job to run. Conditional update makes it safe with many workers.
+    """
+    now = now or timezone.now()
+    while True:
+        job = Job.objects\
+            .filter(status=Job.STATUS_PENDING, run_at__lte=now)\
+            .order_by('run_at', 'id')\
+            .first()
+        if job is None:
+            return None
+        claimed = Job.objects\
+            .filter(pk=job.pk, status=Job.STATUS_PENDING)\
+            .update(status=Job.STATUS_RUNNING, started=now,
+                    attempts=F('attempts') + 1)
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # taken by another worker, try next one
+
+
+def run_job(job):
+    """
+    Run claimed job. Failed job is postponed with exponential backoff,
+    until it runs out of attempts.
+    Returns True on success.
+    """
+    try:
+        TASKS[job.name](**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            job.status = Job.STATUS_FAILED
+            job.finished = timezone.now()
+            logger.error("Job %s failed:\n%s", job, job.last_error)
+        else:
+            job.status = Job.STATUS_PENDING
+            job.run_at = timezone.now() + get_retry_delay(job.attempts)
+            logger.warning("Job %s failed, retrying at %s:\n%s",
+                           job, job.run_at, job.last_error)
+        job.save()
+        return False
+
+    job.status = Job.STATUS_DONE
+    job.finished = timezone.now()
+    job.save()
+    return True
+
+
+def run_pending_jobs(limit=None):
+    """
+    Run due jobs until the queue is empty (or limit of jobs was run).
+    Returns number of jobs run.
+    """
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def purge_jobs(now=None):
+    """
+    Delete finished jobs older than JOB_KEEP_DAYS.
+    Failed jobs are kept for inspection.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.JOB_KEEP_DAYS)
+    deleted, _ = Job.objects\
+        .filter(status=Job.STATUS_DONE, finished__lt=cutoff)\
+        .delete()
+    return deleted
+
+
+def get_queue_stats(now=None):
+    """
+    Return queue depth and job latency metrics:
+    numbers of jobs by status, age of the oldest due job and average
+    wait (created -> started) and run time of jobs finished within
+    last hour, in seconds.
+    """
+    now = now or timezone.now()
+    statuses = dict(Job._STATUS_CHOICES)
+    counts = {label.lower(): 0 for label in statuses.values()}
+    rows = Job.objects.order_by().values_list('status')\
+        .annotate(count=Count('pk'))
+    for status, count in rows:
+        counts[statuses[status].lower()] = count
+
+    due = Job.objects\
+        .filter(status=Job.STATUS_PENDING, run_at__lte=now)\
+        .aggregate(count=Count('pk'), oldest=Min('run_at'))
+
+    # averaged in python, as SQLite can't aggregate date differences
+    recent = list(Job.objects
+                  .filter(status=Job.STATUS_DONE,
+                          finished__gte=now - timedelta(hours=1))
+                  .values_list('created', 'started', 'finished'))
+
+    def average(durations):
+        if not recent:
+            return None
+        return sum(d.total_seconds() for d in durations) / len(recent)
+
+    return {
+        'jobs': counts,
+        'due': due['count'],
+        'oldest_due_age': (
+            (now - due['oldest']).total_seconds() if due['oldest'] else 0),
+        'avg_wait': average(started - created
+                            for created, started, _ in recent),
+        'avg_run_time': average(finished - started
+                                for _, started, finished in recent),
+    }
@@ -0,0 +1,25 @@
+""" Denormalized like counts of recipes """
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+from catalog.models import Recipe, Favourite
+
+
+def rebuild_like_counts():
+    """
+    Recalculate Recipe.like_count from Favourite table
+    with single UPDATE statement. Returns number of updated recipes.
+    """
+    favourites = Favourite.objects\
+        .filter(recipe=OuterRef('pk'))\
+        .order_by()\
+        .values('recipe')\
+        .annotate(count=Count('pk'))\
+        .values('count')
+    with transaction.atomic():
+        return Recipe.objects.update(
+            like_count=Coalesce(
+                Subquery(favourites, output_field=IntegerField()), 0)
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import Recipe
+from catalog.ingredients import update_recipe_ingredients
+
+
+class Command(BaseCommand):
+    help = "Fills normalized ingredients of all recipes."
+
+    def handle(self, *args, **options):
+        count = 0
+        for recipe in Recipe.objects.iterator():
+            update_recipe_ingredients(recipe)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            "Normalized ingredients set for {} recipes.".format(count)))
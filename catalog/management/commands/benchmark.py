@@ -0,0 +1,115 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from catalog.benchmark import (
+    run_benchmarks, compare, NOT_BENCHMARK_DATABASE)
+
+
+class Command(BaseCommand):
+    help = ("Measures latency percentiles and number of queries of every "
+            "named URL on data created by seed_benchmark_data. "
+            "Fails if results regressed against baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help="URL names to benchmark (all by default).",
+        )
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help="Clear cache before every request.",
+        )
+        parser.add_argument(
+            '--concurrency', type=int,
+            help="Measure throughput of N threads making requests at once "
+                 "(like threaded WSGI server) instead of latency.",
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help="Number of requests per URL with --concurrency.",
+        )
+        parser.add_argument(
+            '--baseline',
+            help="JSON file with baseline results to compare with.",
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help="Write results to baseline file instead of comparing.",
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help="Allowed growth of p95 latency, as fraction of baseline.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.BENCHMARK_DATABASE:
+            raise CommandError(NOT_BENCHMARK_DATABASE)
+        if options['concurrency'] is not None:
+            if options['concurrency'] < 1:
+                raise CommandError("--concurrency must be positive.")
+            if options['baseline'] or options['cold']:
+                raise CommandError(
+                    "--concurrency can't be used with --baseline or --cold.")
+            self.run_concurrent(options)
+            return
+
+        def log(name, result):
+            self.stdout.write(
+                "{:<24} p50 {p50:8.2f}ms  p95 {p95:8.2f}ms  "
+                "p99 {p99:8.2f}ms  {queries:3} queries".format(
+                    name, **result))
+
+        try:
+            results = run_benchmarks(
+                options['names'], log=log,
+                iterations=options['iterations'], warmup=options['warmup'],
+                cold=options['cold'])
+        except (ValueError, RuntimeError) as error:
+            raise CommandError(error)
+
+        baseline_file = options['baseline']
+        if not baseline_file:
+            return
+        if options['save_baseline']:
+            with open(baseline_file, 'w') as f:
+                json.dump({'vendor': connection.vendor, 'results': results},
+                          f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                "Baseline saved to {}.".format(baseline_file)))
+            return
+
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline['vendor'] != connection.vendor:
+            raise CommandError("Baseline was measured on {}, not {}.".format(
+                baseline['vendor'], connection.vendor))
+        regressions = compare(results, baseline['results'],
+                              tolerance=options['tolerance'])
+        for name, metric, before, after in regressions:
+            self.stderr.write("{}: {} {:g} -> {:g}".format(
+                name, metric, before, after))
+        if regressions:
+            raise CommandError("{} regressions found.".format(
+                len(regressions)))
+        self.stdout.write(self.style.SUCCESS("No regressions."))
+
+    def run_concurrent(self, options):
+        def log(name, result):
+            self.stdout.write(
+                "{:<24} {throughput:8.1f} req/s  p50 {p50:8.2f}ms  "
+                "p95 {p95:8.2f}ms  p99 {p99:8.2f}ms".format(name, **result))
+
+        try:
+            run_benchmarks(
+                options['names'], log=log,
+                concurrency=options['concurrency'],
+                requests=options['requests'])
+        except (ValueError, RuntimeError) as error:
+            raise CommandError(error)
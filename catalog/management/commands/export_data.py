@@ -0,0 +1,56 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.export import FORMATS, get_exports, export
+
+
+class Command(BaseCommand):
+    help = ("Streams published recipes, favourites or comments of the whole "
+            "catalog (or user's recipes, drafts, favourites or comments) "
+            "as NDJSON or CSV.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind', choices=('recipes', 'drafts', 'favourites', 'comments'))
+        parser.add_argument(
+            '--user',
+            help="Username of user whose data is exported.",
+        )
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help="Compress the output with gzip.",
+        )
+        parser.add_argument(
+            '--output',
+            help="Output file (default: standard output).",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user'] is not None:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(
+                    "Unknown user: {}".format(options['user']))
+        exports = get_exports(user)
+        if options['kind'] not in exports:
+            raise CommandError(
+                "Only users' drafts can be exported, use --user.")
+
+        rows, fields = exports[options['kind']]
+        chunks = export(rows, fields, options['format'], options['gzip'])
+        if options['output'] is None:
+            self.write(chunks, sys.stdout.buffer)
+        else:
+            with open(options['output'], 'wb') as file:
+                self.write(chunks, file)
+
+    def write(self, chunks, file):
+        for chunk in chunks:
+            file.write(chunk)
+        file.flush()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import Recipe
+from catalog.images import generate_derivatives
+
+
+class Command(BaseCommand):
+    help = "Creates resized WebP versions of recipes' photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help="Only recipes without derivatives yet.")
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(photo__isnull=True).exclude(photo='')
+        if options['missing']:
+            recipes = recipes.filter(photo_tile__isnull=True)
+
+        count = 0
+        for recipe in recipes.iterator():
+            generate_derivatives(recipe)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            "Photo derivatives generated for {} recipes.".format(count)))
@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.importer import (
+    RecipeImporter, read_batches, parse_batches, load_checkpoint,
+    save_checkpoint, delete_checkpoint)
+from catalog.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = ("Imports recipes from NDJSON file (one JSON object per line, "
+            "see catalog.importer), in batches of bulk inserts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file to import.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--author',
+            help="Username of author of recipes without 'author'.",
+        )
+        parser.add_argument(
+            '--photos',
+            help="Directory with photos, referenced by 'photo' paths.",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help="Number of processes parsing and validating lines "
+                 "(0: parse in this process).",
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help="Name of checkpoint saved in the database "
+                 "(default: absolute PATH).",
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help="Continue failed import from its checkpoint.",
+        )
+        parser.add_argument(
+            '--skip-jobs',
+            action='store_true',
+            help="Don't queue search indexing, ingredients normalization "
+                 "and photo derivatives jobs (run repair commands later).",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = (options['checkpoint']
+                      or os.path.abspath(options['path']))
+        if len(checkpoint) > ImportCheckpoint._meta.get_field(
+                'name').max_length:
+            raise CommandError(
+                "Checkpoint name too long, set it with --checkpoint.")
+        saved_state = load_checkpoint(checkpoint)
+        state = {'offset': 0, 'line': 0, 'imported': 0, 'invalid': 0}
+        if options['resume']:
+            if saved_state is None:
+                raise CommandError("No checkpoint: {}".format(checkpoint))
+            state = saved_state
+            self.stdout.write(
+                "Resuming at line {}.".format(state['line'] + 1))
+        elif saved_state is not None:
+            raise CommandError(
+                "Checkpoint {} exists, use --resume to continue the import "
+                "or remove it in admin.".format(checkpoint))
+
+        try:
+            importer = RecipeImporter(
+                default_author=options['author'],
+                photos_dir=options['photos'],
+                enqueue_jobs=not options['skip_jobs'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        pool = None
+        if options['workers'] > 0:
+            # workers only parse lines, they never use the database
+            pool = multiprocessing.Pool(options['workers'])
+        try:
+            with open(options['path'], 'rb') as file:
+                self.import_file(file, importer, pool, state, checkpoint,
+                                 options['batch_size'])
+        finally:
+            if pool is not None:
+                pool.terminate()
+        delete_checkpoint(checkpoint)
+
+    def import_file(self, file, importer, pool, state, checkpoint,
+                    batch_size):
+        start = time.perf_counter()
+        recipes = rows = 0
+        batches = parse_batches(read_batches(
+            file, batch_size, state['offset'], state['line']), pool)
+
+        for results, offset, line in batches:
+            records = [(number, data) for number, data, _ in results
+                       if data is not None]
+            errors = [(number, error) for number, _, error in results
+                      if error is not None]
+            # checkpoint is committed together with the batch
+            with transaction.atomic():
+                imported, inserted, rejected = importer.import_batch(records)
+                errors += rejected
+                state = {
+                    'offset': offset,
+                    'line': line,
+                    'imported': state['imported'] + imported,
+                    'invalid': state['invalid'] + len(errors),
+                }
+                save_checkpoint(checkpoint, state)
+
+            for number, error in sorted(errors):
+                self.stderr.write("Line {}: {}".format(number, error))
+            recipes += imported
+            rows += inserted
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                "Line {}: {} recipes imported ({:.0f} recipes/s, "
+                "{:.0f} rows/s), {} invalid.".format(
+                    line, state['imported'], recipes / elapsed,
+                    rows / elapsed, state['invalid']))
+
+        self.stdout.write(self.style.SUCCESS(
+            "{} recipes imported, {} invalid lines skipped.".format(
+                state['imported'], state['invalid'])))
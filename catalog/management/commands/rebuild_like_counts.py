@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from catalog.jobs import enqueue
+from catalog.likes import rebuild_like_counts
+
+
+class Command(BaseCommand):
+    help = "Rebuilds denormalized Recipe.like_count from Favourite table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--enqueue',
+            action='store_true',
+            help="Schedule background job instead of running it now.",
+        )
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = enqueue('rebuild_like_counts')
+            self.stdout.write(self.style.SUCCESS(
+                "Job {} queued.".format(job)))
+            return
+
+        updated = rebuild_like_counts()
+        self.stdout.write(self.style.SUCCESS(
+            "Like count rebuilt for {} recipes.".format(updated)))
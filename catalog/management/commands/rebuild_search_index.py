@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import Recipe
+from catalog.search import index_recipe
+
+
+class Command(BaseCommand):
+    help = "Rebuilds full-text search index of published recipes."
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(status=Recipe.STATUS_PUBLISHED)
+        count = 0
+        for recipe in recipes.iterator():
+            index_recipe(recipe)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            "Search index rebuilt for {} recipes.".format(count)))
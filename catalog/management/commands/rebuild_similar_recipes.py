@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds similar recipes from users' favourites, incrementally "
+            "with favourites added since the last run. Meant to be run "
+            "periodically, eg. by cron. Needs NumPy and SciPy.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help="Recalculate neighbours of all recipes.",
+        )
+        parser.add_argument(
+            '--enqueue',
+            action='store_true',
+            help="Schedule background job instead of running it now.",
+        )
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = enqueue('rebuild_similar_recipes', full=options['full'])
+            self.stdout.write(self.style.SUCCESS(
+                "Job {} queued.".format(job)))
+            return
+
+        try:
+            from catalog.recommendations import rebuild_similar
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError:
+            raise CommandError("NumPy and SciPy are required.")
+
+        recomputed = rebuild_similar(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            "Similar recipes rebuilt for {} recipes.".format(recomputed)))
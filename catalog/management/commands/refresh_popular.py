@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from catalog.popularity import refresh_popular
+from catalog.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = ("Refreshes popular recipes leaderboard with favourites added "
+            "since the last run. Meant to be run periodically, eg. by cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help="Recalculate all scores from scratch.",
+        )
+        parser.add_argument(
+            '--enqueue',
+            action='store_true',
+            help="Schedule background job instead of running it now.",
+        )
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = enqueue('refresh_popular', full=options['full'])
+            self.stdout.write(self.style.SUCCESS(
+                "Job {} queued.".format(job)))
+            return
+
+        processed = refresh_popular(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            "Leaderboard refreshed, {} favourites processed.".format(
+                processed)))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.jobs import run_pending_jobs, requeue_stale_jobs, purge_jobs
+
+
+class Command(BaseCommand):
+    help = ("Runs background jobs worker, polling the queue until stopped. "
+            "Many workers can run at the same time.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Run due jobs and exit.",
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5,
+            help="Seconds to wait when the queue is empty (default: 5).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                requeue_stale_jobs()
+                count = run_pending_jobs()
+                if count:
+                    self.stdout.write("{} jobs run.".format(count))
+                if options['once']:
+                    break
+                if not count:
+                    purge_jobs()
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Worker stopped."))
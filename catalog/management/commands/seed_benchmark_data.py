@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.benchmark import (
+    generate_data, USERNAME, NOT_BENCHMARK_DATABASE)
+from catalog.popularity import refresh_popular
+from catalog.likes import rebuild_like_counts
+
+
+class Command(BaseCommand):
+    help = ("Fills database with random data for benchmarks "
+            "(by default 100k recipes, 1M favourites, 500k comments).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--favourites', type=int, default=1000000)
+        parser.add_argument('--comments', type=int, default=500000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--skip-indexes',
+            action='store_true',
+            help="Don't build search index and normalized ingredients.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.BENCHMARK_DATABASE:
+            raise CommandError(NOT_BENCHMARK_DATABASE)
+        if User.objects.filter(username=USERNAME.format(0)).exists():
+            raise CommandError("Benchmark data already exists.")
+
+        with transaction.atomic():
+            generate_data(
+                users=options['users'],
+                categories=options['categories'],
+                recipes=options['recipes'],
+                favourites=options['favourites'],
+                comments=options['comments'],
+                seed=options['seed'],
+                log=self.stdout.write,
+            )
+
+        self.stdout.write("Rebuilding denormalized data...")
+        rebuild_like_counts()
+        refresh_popular(full=True)
+        if not options['skip_indexes']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+            call_command('backfill_ingredients', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Benchmark data created."))
@@ -0,0 +1,157 @@
+""" Metrics of requests, caches and jobs in Prometheus text format """
+
+from django.core.cache import cache
+
+from catalog.cache import get_stats, get_registered
+from catalog.jobs import get_queue_stats
+from catalog.profiling import (
+    BUCKETS, VIEWS_REGISTRY, SECTIONS_REGISTRY, get_view_key,
+    get_section_key)
+
+
+def format_labels(**labels):
+    return ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels.items())
+
+
+def get_view_metrics():
+    """
+    Return lines of per view request metrics.
+    """
+    views = sorted(get_registered(VIEWS_REGISTRY))
+    metrics = ['duration', 'db', 'template', 'queries']
+    buckets = [str(bound) for bound in BUCKETS] + ['+Inf']
+    keys = [get_view_key(view, metric) for view in views
+            for metric in metrics + ['bucket:' + b for b in buckets]]
+    values = cache.get_many(keys)
+
+    histogram = [
+        '# HELP catalog_request_duration_seconds Duration of requests.',
+        '# TYPE catalog_request_duration_seconds histogram',
+    ]
+    totals = {
+        'db': ['# HELP catalog_request_db_seconds_total '
+               'Time spent in database queries.'],
+        'template': ['# HELP catalog_request_template_seconds_total '
+                     'Time spent rendering templates.'],
+        'python': ['# HELP catalog_request_python_seconds_total '
+                   'Time spent outside of database and templates.'],
+        'queries': ['# HELP catalog_request_queries_total '
+                    'Number of database queries.'],
+    }
+    for name, lines in totals.items():
+        unit = '' if name == 'queries' else '_seconds'
+        lines.append('# TYPE catalog_request_{}{}_total counter'.format(
+            name, unit))
+
+    for view in views:
+        def value(metric):
+            return values.get(get_view_key(view, metric), 0)
+
+        count = 0
+        for bucket in buckets:
+            count += value('bucket:' + bucket)
+            histogram.append(
+                'catalog_request_duration_seconds_bucket{{{}}} {}'.format(
+                    format_labels(view=view, le=bucket), count))
+        labels = format_labels(view=view)
+        duration = value('duration') / 1000000
+        histogram.append('catalog_request_duration_seconds_sum{{{}}} {}'
+                         .format(labels, duration))
+        histogram.append('catalog_request_duration_seconds_count{{{}}} {}'
+                         .format(labels, count))
+
+        db = value('db') / 1000000
+        template = value('template') / 1000000
+        for name, total in (('db', db), ('template', template),
+                            ('python', max(duration - db - template, 0))):
+            totals[name].append(
+                'catalog_request_{}_seconds_total{{{}}} {}'.format(
+                    name, labels, total))
+        totals['queries'].append('catalog_request_queries_total{{{}}} {}'
+                                 .format(labels, value('queries')))
+
+    lines = histogram
+    for total in totals.values():
+        lines += total
+    return lines
+
+
+def get_section_metrics():
+    sections = sorted(get_registered(SECTIONS_REGISTRY))
+    values = cache.get_many([get_section_key(s) for s in sections])
+    lines = [
+        '# HELP catalog_section_seconds_total Time spent in profiled '
+        'sections of code.',
+        '# TYPE catalog_section_seconds_total counter',
+    ]
+    for section in sections:
+        lines.append('catalog_section_seconds_total{{{}}} {}'.format(
+            format_labels(section=section),
+            values.get(get_section_key(section), 0) / 1000000))
+    return lines
+
+
+def get_cache_metrics():
+    hits = [
+        '# HELP catalog_cache_hits_total Hits of catalog caches.',
+        '# TYPE catalog_cache_hits_total counter',
+    ]
+    misses = [
+        '# HELP catalog_cache_misses_total Misses of catalog caches.',
+        '# TYPE catalog_cache_misses_total counter',
+    ]
+    ratios = [
+        '# HELP catalog_cache_hit_ratio Fraction of hits of catalog caches.',
+        '# TYPE catalog_cache_hit_ratio gauge',
+    ]
+    for name, stats in sorted(get_stats().items()):
+        labels = format_labels(cache=name)
+        hits.append('catalog_cache_hits_total{{{}}} {}'.format(
+            labels, stats['hits']))
+        misses.append('catalog_cache_misses_total{{{}}} {}'.format(
+            labels, stats['misses']))
+        total = stats['hits'] + stats['misses']
+        if total:
+            ratios.append('catalog_cache_hit_ratio{{{}}} {}'.format(
+                labels, stats['hits'] / total))
+    return hits + misses + ratios
+
+
+def get_job_metrics():
+    stats = get_queue_stats()
+    lines = [
+        '# HELP catalog_jobs Number of background jobs by status.',
+        '# TYPE catalog_jobs gauge',
+    ]
+    for status, count in sorted(stats['jobs'].items()):
+        lines.append('catalog_jobs{{{}}} {}'.format(
+            format_labels(status=status), count))
+    gauges = (
+        ('due', 'catalog_jobs_due', 'Number of jobs due to run.'),
+        ('oldest_due_age', 'catalog_jobs_oldest_due_age_seconds',
+         'Age of the oldest job due to run.'),
+        ('avg_wait', 'catalog_jobs_wait_seconds',
+         'Average wait of jobs finished within last hour.'),
+        ('avg_run_time', 'catalog_jobs_run_time_seconds',
+         'Average run time of jobs finished within last hour.'),
+    )
+    for field, name, description in gauges:
+        if stats[field] is None:
+            continue
+        lines += [
+            '# HELP {} {}'.format(name, description),
+            '# TYPE {} gauge'.format(name),
+            '{} {}'.format(name, stats[field]),
+        ]
+    return lines
+
+
+def get_metrics():
+    """
+    Return all metrics in Prometheus text format.
+    """
+    lines = (get_view_metrics() + get_section_metrics()
+             + get_cache_metrics() + get_job_metrics())
+    return '\n'.join(lines) + '\n'
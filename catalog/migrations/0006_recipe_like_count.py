@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_like_count(apps, schema_editor):
+    Recipe = apps.get_model('catalog', 'Recipe')
+    Favourite = apps.get_model('catalog', 'Favourite')
+    counts = Favourite.objects\
+        .order_by()\
+        .values('recipe')\
+        .annotate(count=Count('pk'))
+    for row in counts:
+        Recipe.objects\
+            .filter(pk=row['recipe'])\
+            .update(like_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_recipe_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_like_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['status', '-like_count', '-pub_date'], name='recipe_popular_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_recipe_like_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularRecipe',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='catalog.Recipe')),
+                ('score', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Popular recipe',
+                'verbose_name_plural': 'Popular recipes',
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PopularRefresh',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('last_favourite_id', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'get_latest_by': 'timestamp',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='popularrecipe',
+            index=models.Index(fields=['-score'], name='popular_score_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Ingredient',
+                'verbose_name_plural': 'Ingredients',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='normalized_ingredients',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='recipes', to='catalog.Ingredient'),
+        ),
+    ]
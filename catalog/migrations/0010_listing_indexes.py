@@ -0,0 +1,62 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:49
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_favourites(apps, schema_editor):
+    """
+    Keep only the oldest Favourite of each (user, recipe) pair,
+    so unique constraint can be added.
+    """
+    Recipe = apps.get_model('catalog', 'Recipe')
+    Favourite = apps.get_model('catalog', 'Favourite')
+    duplicates = Favourite.objects\
+        .order_by()\
+        .values('user', 'recipe')\
+        .annotate(count=Count('pk'), first=Min('pk'))\
+        .filter(count__gt=1)
+    for row in duplicates:
+        Favourite.objects\
+            .filter(user=row['user'], recipe=row['recipe'])\
+            .exclude(pk=row['first'])\
+            .delete()
+        Recipe.objects\
+            .filter(pk=row['recipe'])\
+            .update(like_count=F('like_count') - (row['count'] - 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_ingredient'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='recipe_popular_idx',
+        ),
+        migrations.AddIndex(
+            model_name='favourite',
+            index=models.Index(fields=['user', 'timestamp'], name='favourite_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['status', 'pub_date', 'edit_date'], name='recipe_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'status', 'pub_date', 'edit_date'], name='recipe_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'status', 'edit_date'], name='recipe_author_edit_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_favourites,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favourite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='favourite_unique'),
+        ),
+    ]
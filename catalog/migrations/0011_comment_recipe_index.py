@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['recipe', 'pub_date'], name='comment_recipe_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_comment_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='photo_banner',
+            field=models.ImageField(blank=True, default=None, editable=False, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='photo_card',
+            field=models.ImageField(blank=True, default=None, editable=False, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='photo_tile',
+            field=models.ImageField(blank=True, default=None, editable=False, null=True, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:20
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+DESC_MAX_LENGTH = 254
+
+
+def get_descs(value):
+    """
+    Return texts of items of JSON list edited in admin. Items without
+    text are skipped, too long ones truncated to fit the new column.
+    """
+    return [item['desc'][:DESC_MAX_LENGTH]
+            for item in json.loads(value or '[]')
+            if isinstance(item, dict) and isinstance(item.get('desc'), str)]
+
+
+def copy_to_rows(apps, schema_editor):
+    """
+    Copy ingredients and directions from recipes' JSON columns
+    to RecipeIngredient and RecipeStep rows.
+    """
+    Recipe = apps.get_model('catalog', 'Recipe')
+    RecipeIngredient = apps.get_model('catalog', 'RecipeIngredient')
+    RecipeStep = apps.get_model('catalog', 'RecipeStep')
+
+    ingredients, steps = [], []
+    recipes = Recipe.objects.values_list('pk', 'ingredients', 'directions')
+    for pk, ingredients_json, directions_json in recipes.iterator():
+        for position, desc in enumerate(get_descs(ingredients_json)):
+            ingredients.append(RecipeIngredient(
+                recipe_id=pk, position=position, desc=desc))
+        for position, desc in enumerate(get_descs(directions_json)):
+            steps.append(RecipeStep(
+                recipe_id=pk, position=position, desc=desc))
+        if len(ingredients) + len(steps) > 5000:
+            RecipeIngredient.objects.bulk_create(ingredients)
+            RecipeStep.objects.bulk_create(steps)
+            ingredients, steps = [], []
+    RecipeIngredient.objects.bulk_create(ingredients)
+    RecipeStep.objects.bulk_create(steps)
+
+
+def copy_to_json(apps, schema_editor):
+    Recipe = apps.get_model('catalog', 'Recipe')
+    RecipeIngredient = apps.get_model('catalog', 'RecipeIngredient')
+    RecipeStep = apps.get_model('catalog', 'RecipeStep')
+
+    for field, model in (('ingredients', RecipeIngredient),
+                         ('directions', RecipeStep)):
+        lists = {}
+        rows = model.objects\
+            .order_by('recipe', 'position')\
+            .values_list('recipe', 'desc')
+        for recipe_id, desc in rows.iterator():
+            lists.setdefault(recipe_id, []).append({'desc': desc})
+        for recipe_id, items in lists.items():
+            Recipe.objects.filter(pk=recipe_id).update(
+                **{field: json.dumps(items)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_job'),
+    ]
+
+    # related names are set in 0015, after the JSON columns are removed
+    operations = [
+        migrations.CreateModel(
+            name='RecipeIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('desc', models.CharField(max_length=254)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.Recipe')),
+            ],
+            options={
+                'ordering': ['recipe', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeStep',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('desc', models.CharField(max_length=254)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.Recipe')),
+            ],
+            options={
+                'ordering': ['recipe', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'position'), name='recipe_ingredient_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipestep',
+            constraint=models.UniqueConstraint(fields=('recipe', 'position'), name='recipe_step_unique'),
+        ),
+        migrations.RunPython(copy_to_rows, copy_to_json),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_ingredient_count(apps, schema_editor):
+    Recipe = apps.get_model('catalog', 'Recipe')
+    NormalizedIngredient = Recipe.normalized_ingredients.through
+    counts = NormalizedIngredient.objects\
+        .order_by()\
+        .values('recipe')\
+        .annotate(count=Count('pk'))
+    for row in counts:
+        Recipe.objects\
+            .filter(pk=row['recipe'])\
+            .update(ingredient_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_similar_recipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_ingredient_count,
+                             migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils.functional import cached_property
 
 from catalog import util
+from catalog.profiling import profiled
 import json
 
 
@@ -30,11 +33,65 @@ class Category(models.Model):
         return reverse('recipes_by_category', kwargs={'slug': self.pk})
 
 
+class Ingredient(models.Model):
+    """
+    Normalized ingredient name, eg. 'onion' for '2 large onions, diced'.
+    See catalog.ingredients for normalization rules.
+    """
+    class Meta:
+        verbose_name = 'Ingredient'
+        verbose_name_plural = 'Ingredients'
+        ordering = ['name']
+
+    name = models.CharField(
+        blank=False,
+        unique=True,
+        max_length=64,
+    )
+
+    def __str__(self):
+        return str(self.name)
+
+
+class RecipeQuerySet(models.QuerySet):
+    # columns used by recipe cards in lists: link, title, photo and
+    # keyset pagination position
+    CARD_FIELDS = ('id', 'status', 'title', 'photo', 'photo_tile',
+                   'photo_card', 'photo_banner', 'pub_date', 'edit_date')
+
+    def cards(self):
+        """
+        Load only columns shown on recipe cards in lists.
+        """
+        return self.only(*self.CARD_FIELDS)
+
+    def authored_by(self, user, status):
+        """
+        Recipes of user with given status, as listed in user's recipes
+        and drafts, and exported (see catalog.export).
+        """
+        return self.filter(status=status, author=user)
+
+
 class Recipe(models.Model):
     class Meta:
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
         ordering = ['-pub_date', '-edit_date']
+        # Ascending columns on purpose: scanned backwards, the index
+        # (with primary key appended to every index entry) matches
+        # ordering by (-pub_date, -edit_date, -id) used by keyset pagination.
+        indexes = [
+            # public listings: published recipes, newest first
+            models.Index(fields=['status', 'pub_date', 'edit_date'],
+                         name='recipe_published_idx'),
+            # per-user listings of published recipes
+            models.Index(fields=['author', 'status', 'pub_date', 'edit_date'],
+                         name='recipe_author_idx'),
+            # user's drafts, ordered by edit date
+            models.Index(fields=['author', 'status', 'edit_date'],
+                         name='recipe_author_edit_idx'),
+        ]
 
     # choices for Recipe.status field
     STATUS_DRAFT, STATUS_PUBLISHED = range(2)
@@ -43,6 +100,8 @@ class Recipe(models.Model):
         (STATUS_PUBLISHED, 'Published'),
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     # fields
     author = models.ForeignKey(
         User,
@@ -55,23 +114,51 @@ class Recipe(models.Model):
         Category,
         related_name='recipes',
     )
+    # normalized ingredients, filled from ingredients on save in edit view
+    normalized_ingredients = models.ManyToManyField(
+        Ingredient,
+        related_name='recipes',
+        blank=True,
+        editable=False,
+    )
     status = models.PositiveSmallIntegerField(
         choices=_STATUS_CHOICES,
         default=STATUS_DRAFT,
     )
     title = models.CharField(max_length=254, blank=False)
     description = models.TextField(blank=True)
-    directions = models.TextField(blank=True)
-    ingredients = models.TextField(blank=True)
     edit_date = models.DateTimeField(auto_now=True)
     pub_date = models.DateTimeField(blank=True, null=True)
 
+    # denormalized number of normalized ingredients,
+    # maintained by catalog.ingredients.update_recipe_ingredients
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # denormalized number of Favourite rows pointing at this recipe,
+    # maintained by catalog.signals and rebuilt by 'rebuild_like_counts'
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+
     photo = models.ImageField(
         blank=True,
         null=True,
         default=None,
         upload_to=util.get_image_path
     )
+    # WebP derivatives of photo, of width given in PHOTO_DERIVATIVES,
+    # generated by catalog.images
+    photo_tile = models.ImageField(
+        blank=True, null=True, default=None, editable=False)
+    photo_card = models.ImageField(
+        blank=True, null=True, default=None, editable=False)
+    photo_banner = models.ImageField(
+        blank=True, null=True, default=None, editable=False)
+
+    # derivative field -> max width (px)
+    PHOTO_DERIVATIVES = (
+        ('photo_tile', 320),
+        ('photo_card', 640),
+        ('photo_banner', 1280),
+    )
 
     def __str__(self):
         return str(self.title)
@@ -81,40 +168,303 @@ class Recipe(models.Model):
             return reverse('draft_detail', kwargs={'pk': self.pk})
         return reverse('recipe_detail', kwargs={'pk': self.pk})
 
-    @property
+    @cached_property
+    @profiled('recipe_rows')
     def ingredients_list(self):
         """
         Return ingredients as list of dicts, as such can be used
         as formset initial.
         [{'desc':...}, {'desc':...}, ]
+        Loaded once per instance, from prefetched rows if available.
         """
-        if not self.ingredients:
-            return []
-        return json.loads(self.ingredients)
+        return [{'desc': row.desc} for row in self.ingredients.all()]
 
-    @property
+    @cached_property
+    @profiled('recipe_rows')
     def directions_list(self):
         """
         Returns directions as list of dicts, as such can be used
         as formset initial.
         [{'desc':...}, {'desc':...}, ]
+        Loaded once per instance, from prefetched rows if available.
         """
-        if not self.directions:
-            return []
-        return json.loads(self.directions)
+        return [{'desc': row.desc} for row in self.directions.all()]
+
+    def set_ingredients(self, descs):
+        """
+        Replace recipe's ingredients with given list of texts.
+        """
+        self._set_rows(RecipeIngredient, descs)
+        self.__dict__.pop('ingredients_list', None)
+
+    def set_directions(self, descs):
+        """
+        Replace recipe's directions with given list of texts.
+        """
+        self._set_rows(RecipeStep, descs)
+        self.__dict__.pop('directions_list', None)
+
+    def _set_rows(self, model, descs):
+        model.objects.filter(recipe=self).delete()
+        model.objects.bulk_create([
+            model(recipe=self, position=position, desc=desc)
+            for position, desc in enumerate(descs)
+        ])
+
+    @property
+    def photo_src(self):
+        """
+        Return url of the smallest available version of photo.
+        """
+        if self.photo_tile:
+            return self.photo_tile.url
+        return self.photo.url
+
+    @property
+    def photo_srcset(self):
+        """
+        Return 'srcset' attribute value listing available photo derivatives.
+        """
+        return ', '.join(
+            '{} {}w'.format(getattr(self, field).url, width)
+            for field, width in self.PHOTO_DERIVATIVES
+            if getattr(self, field)
+        )
+
+    @classmethod
+    def change_like_count(cls, pk, delta):
+        """
+        Atomically add delta to like_count of recipe with given pk.
+        Done with single UPDATE statement, so concurrent changes
+        are not lost. Counter never goes below zero.
+        """
+        cls.change_like_counts([pk], delta)
+
+    @classmethod
+    def change_like_counts(cls, pks, delta):
+        """
+        Add delta to like_count of every recipe with pk in pks,
+        with single UPDATE statement (see change_like_count()).
+        """
+        queryset = cls.objects.filter(pk__in=pks)
+        if delta < 0:
+            queryset = queryset.filter(like_count__gte=-delta)
+        queryset.update(like_count=F('like_count') + delta)
+
+
+class RecipeIngredient(models.Model):
+    """
+    Ingredient of recipe, as entered by author, eg. '2 large onions, diced'.
+    """
+    class Meta:
+        ordering = ['recipe', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'position'],
+                                    name='recipe_ingredient_unique'),
+        ]
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='ingredients',
+    )
+    position = models.PositiveSmallIntegerField()
+    desc = models.CharField(max_length=254)
+
+    def __str__(self):
+        return str(self.desc)
+
+
+class RecipeStep(models.Model):
+    """
+    Step of recipe's directions.
+    """
+    class Meta:
+        ordering = ['recipe', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'position'],
+                                    name='recipe_step_unique'),
+        ]
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='directions',
+    )
+    position = models.PositiveSmallIntegerField()
+    desc = models.CharField(max_length=254)
+
+    def __str__(self):
+        return str(self.desc)
 
 
 class Favourite(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='favourite_unique'),
+        ]
+        indexes = [
+            # user's favourites list, newest first
+            models.Index(fields=['user', 'timestamp'],
+                         name='favourite_user_idx'),
+        ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
 
 
+class PopularRecipe(models.Model):
+    """
+    Precomputed trending score of a published recipe.
+    Score is a sum of favourites, each decaying exponentially with age.
+    Table is maintained by 'refresh_popular' management command.
+    """
+    class Meta:
+        verbose_name = 'Popular recipe'
+        verbose_name_plural = 'Popular recipes'
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['-score'], name='popular_score_idx'),
+        ]
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+    )
+    # score as of PopularRefresh.timestamp of the latest refresh
+    score = models.FloatField(default=0)
+
+    def __str__(self):
+        return "{} ({:.2f})".format(self.recipe_id, self.score)
+
+
+class PopularRefresh(models.Model):
+    """
+    Bookkeeping of PopularRecipe refreshes, so next refresh
+    only needs to handle favourites added since.
+    """
+    class Meta:
+        get_latest_by = 'timestamp'
+
+    timestamp = models.DateTimeField()
+    last_favourite_id = models.PositiveIntegerField(default=0)
+
+
+class SimilarRecipe(models.Model):
+    """
+    Precomputed neighbour of a recipe: recipe liked by the same users,
+    with cosine similarity of their favourites as score. Top neighbours
+    of every recipe are kept, see catalog.recommendations.
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'similar'],
+                                    name='similar_recipe_unique'),
+        ]
+        indexes = [
+            # neighbours of recipe, the most similar first
+            models.Index(fields=['recipe', '-score'],
+                         name='similar_recipe_idx'),
+        ]
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    score = models.FloatField()
+
+    def __str__(self):
+        return "{} -> {} ({:.2f})".format(
+            self.recipe_id, self.similar_id, self.score)
+
+
+class SimilarRefresh(models.Model):
+    """
+    Bookkeeping of SimilarRecipe rebuilds, so incremental rebuild
+    only needs to handle favourites added since.
+    """
+    class Meta:
+        get_latest_by = 'timestamp'
+
+    timestamp = models.DateTimeField()
+    last_favourite_id = models.PositiveIntegerField(default=0)
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of recipes import (see import_recipes command): offset and
+    number of the next line of imported file, counts of imported and
+    invalid records. Saved in the transaction of every imported batch,
+    so it always matches committed recipes.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    offset = models.BigIntegerField(default=0)
+    line = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    invalid = models.PositiveIntegerField(default=0)
+    timestamp = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class SearchDocument(models.Model):
+    """
+    Published recipe included in full-text search index.
+    Length is weighted number of indexed tokens, used for BM25 ranking.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+    )
+    length = models.FloatField(default=0)
+
+
+class SearchPosting(models.Model):
+    """
+    Inverted index entry: term occurring in a document,
+    with weighted term frequency.
+    """
+    class Meta:
+        unique_together = [('term', 'document')]
+
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(
+        SearchDocument,
+        on_delete=models.CASCADE,
+        related_name='postings',
+    )
+    frequency = models.FloatField()
+
+    def __str__(self):
+        return "{} in {}".format(self.term, self.document_id)
+
+
 class Comment(models.Model):
     class Meta:
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
         ordering = ['-pub_date']
+        indexes = [
+            # recipe's comments, newest first (scanned backwards)
+            models.Index(fields=['recipe', 'pub_date'],
+                         name='comment_recipe_idx'),
+        ]
+
+    # ordering of paginated comments, with unique tie-breaker
+    KEYSET_ORDERING = ('-pub_date', '-id')
 
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
@@ -127,3 +477,48 @@ class Comment(models.Model):
         user = self.user or "Account deleted"
         date = self.pub_date.strftime("%Y-%m-%d %H:%M:%S")
         return "{} on {}".format(user, date)
+
+
+class Job(models.Model):
+    """
+    Persistent background job, run by 'run_jobs' worker (see catalog.jobs).
+    """
+    class Meta:
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        indexes = [
+            # worker's queue: pending jobs, due first
+            models.Index(fields=['status', 'run_at'], name='job_queue_idx'),
+        ]
+
+    # choices for Job.status field
+    STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED = range(4)
+    _STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=64)
+    # keyword arguments of the task, as json string
+    payload = models.TextField(default='{}')
+    status = models.PositiveSmallIntegerField(
+        choices=_STATUS_CHOICES,
+        default=STATUS_PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    # job isn't run before this time (postponed on retry)
+    run_at = models.DateTimeField()
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "{} #{}".format(self.name, self.pk)
+
+    @property
+    def kwargs(self):
+        return json.loads(self.payload)
@@ -0,0 +1,174 @@
+""" Keyset (cursor) pagination for list views """
+
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from django.utils.encoding import force_str
+
+
+def encode_cursor(values, direction):
+    """
+    Return opaque, url-safe token for given keyset values.
+    """
+    data = json.dumps([direction, values], default=force_str)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Return (direction, values) decoded from token.
+    Raises ValueError if token is malformed.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if (not isinstance(data, list) or len(data) != 2
+            or data[0] not in ('next', 'prev')
+            or not isinstance(data[1], list)):
+        raise ValueError("Malformed cursor")
+    return data
+
+
+def keyset_filter(ordering, values):
+    """
+    Return Q object selecting rows placed after given keyset values
+    in given ordering.
+    For ordering (a, b) it's: a >= va AND (a > va OR (a = va AND b > vb)).
+    The redundant bound on the first field lets database use it as
+    range of index scan, which it can't do with the OR alone.
+    """
+    query = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = '{}__{}'.format(name, 'lt' if field.startswith('-') else 'gt')
+        condition = Q(**{lookup: values[i]})
+        for previous, value in zip(ordering[:i], values):
+            condition &= Q(**{previous.lstrip('-'): value})
+        query |= condition
+    if len(ordering) > 1:
+        first = ordering[0]
+        lookup = '{}__{}'.format(first.lstrip('-'),
+                                 'lte' if first.startswith('-') else 'gte')
+        query &= Q(**{lookup: values[0]})
+    return query
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else '-' + field
+                 for field in ordering)
+
+
+class KeysetPage:
+    """
+    Page of keyset paginated list. Quacks like django's Page,
+    as far as templates and ListView are concerned.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def get_keyset_values(obj, ordering):
+    return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+
+def decode_keyset_values(model, ordering, values):
+    """
+    Convert values decoded from cursor to python types of fields.
+    """
+    if len(values) != len(ordering):
+        raise ValidationError("Cursor doesn't match ordering")
+    return [model._meta.get_field(field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)]
+
+
+def get_keyset_page(queryset, ordering, page_size, token=None):
+    """
+    Return KeysetPage of queryset in given ordering, starting after
+    position encoded in token (first page if token is None).
+    Raises Http404 if token is invalid.
+    """
+    direction, values = 'next', None
+    if token:
+        try:
+            direction, values = decode_cursor(token)
+            values = decode_keyset_values(queryset.model, ordering, values)
+        except (ValueError, ValidationError):
+            raise Http404("Invalid cursor.")
+
+    backwards = direction == 'prev'
+    query_ordering = reverse_ordering(ordering) if backwards else ordering
+    queryset = queryset.order_by(*query_ordering)
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(query_ordering, values))
+
+    # one extra row tells whether there is another page
+    object_list = list(queryset[:page_size + 1])
+    has_more = len(object_list) > page_size
+    object_list = object_list[:page_size]
+    if backwards:
+        object_list.reverse()
+
+    # going backwards, we came from the next page
+    if backwards:
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, values is not None
+
+    next_cursor = previous_cursor = None
+    if object_list:
+        if has_next:
+            next_cursor = encode_cursor(
+                get_keyset_values(object_list[-1], ordering), 'next')
+        if has_previous:
+            previous_cursor = encode_cursor(
+                get_keyset_values(object_list[0], ordering), 'prev')
+    return KeysetPage(object_list, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin paginating with opaque cursor tokens, instead of
+    page numbers. Each page is a single index range read, with no
+    COUNT(*) query and no OFFSET scan.
+    Requests with page number (old URLs) still get offset pagination.
+
+    keyset_ordering must be unique, so it should end with 'id',
+    and contain only non-null fields.
+    """
+    keyset_ordering = ('-id',)
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.page_kwarg in self.request.GET:
+            queryset = queryset.order_by(*self.keyset_ordering)
+            return super().paginate_queryset(queryset, page_size)
+
+        page = get_keyset_page(
+            queryset, self.keyset_ordering, page_size,
+            self.request.GET.get(self.cursor_kwarg))
+        return (None, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,118 @@
+""" Trending score leaderboard for popular recipes """
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Case, When, Value, FloatField
+from django.utils import timezone
+
+from catalog.models import Favourite, PopularRecipe, PopularRefresh
+from catalog.http_cache import purge_surrogate_keys, POPULAR_KEY
+
+
+# max number of recipes changed by single UPDATE of remove_favourites()
+UPDATE_BATCH_SIZE = 500
+
+
+def decay(age):
+    """
+    Return weight of a favourite of given age (timedelta).
+    Weight is 1 for brand new favourite and halves every half-life.
+    """
+    half_life = settings.POPULAR_HALF_LIFE_DAYS * 24 * 3600
+    return 0.5 ** (age.total_seconds() / half_life)
+
+
+def get_last_refresh():
+    try:
+        return PopularRefresh.objects.latest()
+    except PopularRefresh.DoesNotExist:
+        return None
+
+
+@transaction.atomic
+def refresh_popular(full=False, now=None):
+    """
+    Bring PopularRecipe scores up to date.
+    Incremental refresh decays existing scores to 'now' and adds only
+    favourites created since the last refresh. Full refresh (or the
+    first one) recalculates all scores from Favourite table.
+    Returns number of processed favourites.
+
+    New favourites are found by id, higher than the last processed one.
+    With concurrent writes (eg. on PostgreSQL), a favourite can commit
+    after one with higher id was already processed; it's skipped until
+    the next full refresh, so run one periodically (eg. nightly).
+    """
+    now = now or timezone.now()
+    last_refresh = get_last_refresh()
+
+    # snapshot of favourites to process in this run
+    max_id = Favourite.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+    favourites = Favourite.objects.filter(pk__lte=max_id)
+
+    if full or last_refresh is None:
+        PopularRecipe.objects.all().delete()
+    else:
+        factor = decay(now - last_refresh.timestamp)
+        PopularRecipe.objects.update(score=F('score') * factor)
+        favourites = favourites.filter(pk__gt=last_refresh.last_favourite_id)
+
+    scores = defaultdict(float)
+    processed = 0
+    for recipe_id, timestamp in favourites\
+            .order_by()\
+            .values_list('recipe_id', 'timestamp')\
+            .iterator():
+        scores[recipe_id] += decay(now - timestamp)
+        processed += 1
+
+    existing = PopularRecipe.objects.in_bulk(list(scores))
+    for popular in existing.values():
+        popular.score += scores.pop(popular.pk)
+    PopularRecipe.objects.bulk_update(existing.values(), ['score'])
+    PopularRecipe.objects.bulk_create([
+        PopularRecipe(recipe_id=recipe_id, score=score)
+        for recipe_id, score in scores.items()
+    ])
+
+    PopularRecipe.objects\
+        .filter(score__lt=settings.POPULAR_MIN_SCORE)\
+        .delete()
+    PopularRefresh.objects.create(timestamp=now, last_favourite_id=max_id)
+    purge_surrogate_keys(POPULAR_KEY)
+    return processed
+
+
+def remove_favourite(favourite):
+    """
+    Subtract weight of deleted favourite from leaderboard,
+    if it was already counted by previous refresh.
+    """
+    remove_favourites([favourite])
+
+
+def remove_favourites(favourites):
+    """
+    Subtract weights of deleted favourites, counted by previous refresh,
+    from leaderboard with single UPDATE statement per batch of recipes.
+    """
+    last_refresh = get_last_refresh()
+    if last_refresh is None:
+        return
+    weights = defaultdict(float)
+    for favourite in favourites:
+        if favourite.pk <= last_refresh.last_favourite_id:
+            weights[favourite.recipe_id] += decay(
+                last_refresh.timestamp - favourite.timestamp)
+    weights = list(weights.items())
+    # in batches, keeping number of query parameters within SQLite limit
+    for start in range(0, len(weights), UPDATE_BATCH_SIZE):
+        batch = weights[start:start + UPDATE_BATCH_SIZE]
+        PopularRecipe.objects\
+            .filter(pk__in=[recipe_id for recipe_id, weight in batch])\
+            .update(score=F('score') - Case(
+                *[When(pk=recipe_id, then=Value(weight))
+                  for recipe_id, weight in batch],
+                output_field=FloatField()))
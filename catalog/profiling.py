@@ -0,0 +1,206 @@
+""" Opt-in request profiling, aggregated for metrics """
+
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.base import Template
+from django.urls import resolve, Resolver404
+from django.utils import timezone
+
+from catalog.cache import register
+from catalog.query_budget import QueryCounter
+
+
+# upper bounds of request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS_KEY = 'catalog:metrics:{}'
+# registries of names of profiled views and sections (see catalog.cache)
+VIEWS_REGISTRY = 'metrics:views'
+SECTIONS_REGISTRY = 'metrics:sections'
+
+# profile of request being served by current thread
+_local = threading.local()
+
+
+class RequestProfile(QueryCounter):
+    """
+    Time spent by request in database, templates and profiled sections.
+    """
+    def __init__(self):
+        super().__init__()
+        self.template_time = 0.0
+        self.sections = {}
+        self.rendering = False
+
+
+def get_current_profile():
+    return getattr(_local, 'profile', None)
+
+
+def profiled(section):
+    """
+    Decorator recording time spent in function as named section
+    of current request's profile.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = get_current_profile()
+            if profile is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.sections[section] = (
+                    profile.sections.get(section, 0.0)
+                    + time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _profiled_render(render):
+    """
+    Wrap Template._render, timing the outermost template rendered, without
+    queries made during rendering.
+    """
+    @functools.wraps(render)
+    def wrapper(self, context):
+        profile = get_current_profile()
+        if profile is None or profile.rendering:
+            return render(self, context)
+        profile.rendering = True
+        start, db_time = time.perf_counter(), profile.time
+        try:
+            return render(self, context)
+        finally:
+            profile.rendering = False
+            profile.template_time += (time.perf_counter() - start
+                                      - (profile.time - db_time))
+    wrapper.profiled = True
+    return wrapper
+
+
+# RECORDING
+
+def _add(key, value):
+    if not cache.add(key, value, None):
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            # evicted in the meantime
+            cache.set(key, value, None)
+
+
+def _micro(seconds):
+    # cache can only increment integers
+    return int(seconds * 1000000)
+
+
+def get_view_key(view, metric):
+    return METRICS_KEY.format('view:{}:{}'.format(view, metric))
+
+
+def get_section_key(section):
+    return METRICS_KEY.format('section:{}'.format(section))
+
+
+def record_request(view, duration, profile):
+    """
+    Add profiled request of named view to aggregated metrics.
+    """
+    register(VIEWS_REGISTRY, view)
+    bucket = next((str(bound) for bound in BUCKETS if duration <= bound),
+                  '+Inf')
+    _add(get_view_key(view, 'bucket:' + bucket), 1)
+    _add(get_view_key(view, 'duration'), _micro(duration))
+    _add(get_view_key(view, 'db'), _micro(profile.time))
+    _add(get_view_key(view, 'template'), _micro(profile.template_time))
+    _add(get_view_key(view, 'queries'), profile.count)
+    for section, seconds in profile.sections.items():
+        register(SECTIONS_REGISTRY, section)
+        _add(get_section_key(section), _micro(seconds))
+
+
+def save_stats(profiler, view):
+    """
+    Write profiler's stats to PROFILING_DIR, removing the oldest files
+    over PROFILING_MAX_FILES.
+    """
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    filename = '{}-{}.prof'.format(
+        timezone.now().strftime('%Y%m%d%H%M%S%f'), view.replace(':', '-'))
+    profiler.dump_stats(os.path.join(directory, filename))
+
+    files = sorted(name for name in os.listdir(directory)
+                   if name.endswith('.prof'))
+    for name in files[:-settings.PROFILING_MAX_FILES]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # removed by another process
+            pass
+
+
+def get_view_name(request):
+    """
+    Return URL name of request, also for responses served before URL
+    resolving (eg. from HttpCacheMiddleware).
+    """
+    match = request.resolver_match
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unresolved'
+    return match.view_name
+
+
+class ProfilingMiddleware:
+    """
+    Records duration of every request, with time spent in database,
+    templates and rest (python), aggregated per URL name and exposed
+    by metrics_view. PROFILING_SAMPLE_RATE fraction of requests is
+    profiled with cProfile, stats are written to PROFILING_DIR.
+
+    Enabled with PROFILING setting. Should be the first middleware,
+    so duration and queries of all others are included.
+    """
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if not getattr(Template._render, 'profiled', False):
+            Template._render = _profiled_render(Template._render)
+
+    def __call__(self, request):
+        profile = _local.profile = RequestProfile()
+        profiler = None
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                if profiler is not None:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _local.profile = None
+        duration = time.perf_counter() - start
+
+        view = get_view_name(request)
+        record_request(view, duration, profile)
+        if profiler is not None:
+            save_stats(profiler, view)
+        return response
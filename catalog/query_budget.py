@@ -0,0 +1,82 @@
+""" Per-view limits of database queries """
+
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(budget):
+    """
+    Decorator declaring maximum number of queries made while serving
+    request to function view (including session and user lookups).
+    Class based views declare it as query_budget attribute.
+    """
+    def decorator(view_func):
+        view_func.query_budget = budget
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func):
+    """
+    Return query budget of view function or class based view,
+    None if not declared.
+    """
+    view = getattr(view_func, 'view_class', view_func)
+    return getattr(view, 'query_budget', None)
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting queries and their time.
+    """
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+class QueryCountMiddleware:
+    """
+    Reports number of queries and their time (in milliseconds) of every
+    request in X-Query-Count and X-DB-Time headers.
+    With QUERY_BUDGET_ENFORCE setting (default: DEBUG), raises
+    QueryBudgetExceeded if view made more queries than its budget.
+
+    Must be placed before middleware making queries (sessions,
+    authentication), to count their queries too. It comes right after
+    ProfilingMiddleware in settings, which makes no queries.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        budget = getattr(request, 'query_budget', None)
+        if (settings.QUERY_BUDGET_ENFORCE and budget is not None
+                and counter.count > budget):
+            raise QueryBudgetExceeded(
+                "{} made {} queries, budget is {}.".format(
+                    request.path, counter.count, budget))
+
+        response['X-Query-Count'] = str(counter.count)
+        response['X-DB-Time'] = '{:.2f}'.format(counter.time * 1000)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func)
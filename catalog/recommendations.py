@@ -0,0 +1,152 @@
+""" "Similar recipes" recommender, built from co-favourites """
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from catalog.models import Favourite, SimilarRecipe, SimilarRefresh
+from catalog.http_cache import (
+    purge_surrogate_keys, recipe_key, SIMILAR_KEY)
+
+
+# number of recipes whose neighbours are computed at once, bounds memory
+# used by co-favourite counts
+BLOCK_SIZE = 1000
+
+
+def get_last_refresh():
+    try:
+        return SimilarRefresh.objects.latest()
+    except SimilarRefresh.DoesNotExist:
+        return None
+
+
+def load_favourites(max_id):
+    """
+    Return arrays of user ids and recipe ids of favourites up to max_id.
+    """
+    import numpy as np
+
+    rows = Favourite.objects\
+        .filter(pk__lte=max_id)\
+        .order_by()\
+        .values_list('user_id', 'recipe_id')
+    pairs = np.fromiter(
+        (value for row in rows.iterator() for value in row), dtype=np.int64)
+    pairs = pairs.reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def build_matrix(user_ids, recipe_ids):
+    """
+    Return sparse binary users x recipes matrix (CSR) of favourites,
+    with array of recipe ids of its columns (sorted).
+    """
+    import numpy as np
+    from scipy import sparse
+
+    users, rows = np.unique(user_ids, return_inverse=True)
+    recipes, columns = np.unique(recipe_ids, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(users), len(recipes)))
+    return matrix, recipes
+
+
+def get_neighbours(matrix, transposed, norms, block, k, min_common):
+    """
+    Return arrays (columns, neighbour columns, scores) of up to k most
+    similar recipes for every recipe (matrix column) in block.
+    transposed is recipes x users matrix (CSR), norms square roots
+    of recipes' like counts.
+    Similarity is cosine of recipes' columns: number of users who liked
+    both recipes, divided by geometric mean of their like counts.
+    Pairs with less than min_common common users are skipped.
+    """
+    import numpy as np
+
+    # block recipes x all recipes co-favourite counts
+    common = (transposed[block] @ matrix).tocsr()
+    rows = np.repeat(np.arange(len(block)), np.diff(common.indptr))
+    columns, counts = common.indices, common.data
+
+    keep = (counts >= min_common) & (columns != block[rows])
+    rows, columns, counts = rows[keep], columns[keep], counts[keep]
+    scores = counts / (norms[block][rows] * norms[columns])
+
+    # sort by row, the most similar first, and take first k of every row
+    order = np.lexsort((-scores, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    top = rank < k
+    return block[rows[top]], columns[top], scores[top]
+
+
+@transaction.atomic
+def rebuild_similar(full=False, now=None):
+    """
+    Rebuild SimilarRecipe table from favourites matrix.
+    Incremental rebuild recomputes only neighbours of recipes liked by
+    users who added favourites since the last rebuild, as only their
+    co-favourite counts changed. Scores of these recipes in neighbour
+    lists of other recipes, and removed favourites, are updated by the
+    next full rebuild. Both load the whole favourites matrix, so memory
+    and time of incremental rebuild still grow with the Favourite table;
+    only neighbours computation is limited to the touched recipes.
+    Cached pages of recomputed recipes are purged (all of them after
+    full rebuild).
+    Needs NumPy and SciPy. Returns number of recomputed recipes.
+    """
+    import numpy as np
+
+    now = now or timezone.now()
+    last_refresh = get_last_refresh()
+    max_id = Favourite.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+    full = full or last_refresh is None
+    if not full and max_id <= last_refresh.last_favourite_id:
+        # no new favourites, nothing to recompute
+        return 0
+
+    user_ids, recipe_ids = load_favourites(max_id)
+    matrix, recipes = build_matrix(user_ids, recipe_ids)
+    transposed = matrix.T.tocsr()
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+
+    if full:
+        SimilarRecipe.objects.all().delete()
+        block_columns = np.arange(len(recipes))
+    else:
+        new_users = Favourite.objects\
+            .filter(pk__gt=last_refresh.last_favourite_id, pk__lte=max_id)\
+            .order_by()\
+            .values_list('user_id', flat=True)\
+            .distinct()
+        touched = np.unique(recipe_ids[np.isin(user_ids, list(new_users))])
+        block_columns = np.searchsorted(recipes, touched)
+
+    for start in range(0, len(block_columns), BLOCK_SIZE):
+        block = block_columns[start:start + BLOCK_SIZE]
+        columns, neighbours, scores = get_neighbours(
+            matrix, transposed, norms, block,
+            settings.SIMILAR_RECIPES_COUNT,
+            settings.SIMILAR_RECIPES_MIN_COMMON)
+        if not full:
+            SimilarRecipe.objects\
+                .filter(recipe_id__in=recipes[block].tolist())\
+                .delete()
+        SimilarRecipe.objects.bulk_create([
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, similar_id, score in zip(
+                recipes[columns].tolist(), recipes[neighbours].tolist(),
+                scores.tolist())
+        ])
+
+    SimilarRefresh.objects.create(timestamp=now, last_favourite_id=max_id)
+    if full:
+        purge_surrogate_keys(SIMILAR_KEY)
+    elif len(block_columns):
+        purge_surrogate_keys(*[recipe_key(pk) for pk
+                               in recipes[block_columns].tolist()])
+    return len(block_columns)
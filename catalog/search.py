@@ -0,0 +1,155 @@
+""" Full-text recipe search over project-maintained inverted index """
+
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from catalog.models import Recipe, SearchDocument, SearchPosting
+from catalog.cache import get_version, bump_version, record_hit, record_miss
+
+
+TOKEN_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'into', 'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+))
+TERM_MAX_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+# weight of a token in each of indexed fields
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'ingredients': 2.0,
+    'description': 1.0,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STATS_CACHE_KEY = 'catalog:search:stats'
+STATS_CACHE_TIMEOUT = 600
+RESULTS_CACHE_KEY = 'catalog:search:{}:{}'
+
+
+def tokenize(text):
+    """
+    Split text into lowercase terms, skipping stop words,
+    numbers and single characters.
+    """
+    return [token[:TERM_MAX_LENGTH]
+            for token in TOKEN_RE.findall(text.lower())
+            if len(token) > 1
+            and not token.isdigit()
+            and token not in STOP_WORDS]
+
+
+def get_recipe_fields(recipe):
+    """
+    Return dict of field name -> text, for fields in FIELD_WEIGHTS.
+    """
+    return {
+        'title': recipe.title,
+        'ingredients': ' '.join(
+            ingredient['desc'] for ingredient in recipe.ingredients_list),
+        'description': recipe.description,
+    }
+
+
+@transaction.atomic
+def index_recipe(recipe):
+    """
+    (Re)build index entries of given recipe.
+    Only published recipes are searchable, drafts are removed from index.
+    """
+    # cached results are dropped right away and again after commit,
+    # in case they were cached from the old index in the meantime
+    bump_version('search')
+    transaction.on_commit(lambda: bump_version('search'))
+    SearchDocument.objects.filter(pk=recipe.pk).delete()
+    if recipe.status != Recipe.STATUS_PUBLISHED:
+        return
+
+    frequencies = Counter()
+    for field, text in get_recipe_fields(recipe).items():
+        for term in tokenize(text):
+            frequencies[term] += FIELD_WEIGHTS[field]
+
+    document = SearchDocument.objects.create(
+        recipe=recipe, length=sum(frequencies.values()))
+    SearchPosting.objects.bulk_create([
+        SearchPosting(term=term, document=document, frequency=frequency)
+        for term, frequency in frequencies.items()
+    ])
+
+
+def get_index_stats():
+    """
+    Return (number of documents, average document length).
+    Cached, since it doesn't have to be exact for ranking.
+    """
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        aggregate = SearchDocument.objects.aggregate(
+            count=Count('pk'), avg_length=Avg('length'))
+        stats = (aggregate['count'], aggregate['avg_length'] or 0)
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def search_recipes(query):
+    """
+    Return list of published recipes' pks matching query,
+    ranked with BM25. Results are cached per set of query terms
+    until the index changes.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+
+    digest = hashlib.md5(' '.join(sorted(terms)).encode()).hexdigest()
+    key = RESULTS_CACHE_KEY.format(get_version('search'), digest)
+    ranked = cache.get(key)
+    if ranked is None:
+        record_miss('search')
+        ranked = rank_recipes(terms)
+        cache.set(key, ranked, settings.SEARCH_CACHE_TIMEOUT)
+    else:
+        record_hit('search')
+    return ranked
+
+
+def rank_recipes(terms):
+    """
+    Return list of pks of recipes matching any of terms, ranked with BM25.
+    Only index entries of given terms are read.
+    """
+    postings = SearchPosting.objects\
+        .filter(term__in=terms)\
+        .values_list('term', 'document_id', 'frequency', 'document__length')
+
+    by_term = defaultdict(list)
+    for term, document_id, frequency, length in postings:
+        by_term[term].append((document_id, frequency, length))
+
+    count, avg_length = get_index_stats()
+    # cached stats may be slightly behind actual index
+    count = max(count, max(map(len, by_term.values()), default=0))
+    avg_length = avg_length or 1
+
+    scores = defaultdict(float)
+    for term, entries in by_term.items():
+        df = len(entries)
+        idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+        for document_id, frequency, length in entries:
+            norm = K1 * (1 - B + B * length / avg_length)
+            scores[document_id] += idf * frequency * (K1 + 1) \
+                / (frequency + norm)
+
+    ranked = sorted(scores, key=lambda pk: (-scores[pk], -pk))
+    return ranked[:settings.SEARCH_MAX_RESULTS]
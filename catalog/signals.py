@@ -0,0 +1,87 @@
+""" Signal handlers keeping denormalized data in sync """
+
+import threading
+
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from catalog.models import Recipe, Category, Favourite, Comment
+from catalog.cache import bump_version
+from catalog.favourites import favourite_added, favourites_removed
+from catalog.http_cache import (
+    purge_surrogate_keys, published_recipe_keys, CATEGORIES_KEY,
+    recipe_key, category_key)
+
+
+# favourites deleted by cascade, by (model, pk) of user or recipe being
+# deleted in current thread; handled together after it's gone
+_local = threading.local()
+
+
+def get_cascaded():
+    if not hasattr(_local, 'cascaded'):
+        _local.cascaded = {}
+    return _local.cascaded
+
+
+@receiver(request_started)
+def request_started_handler(**kwargs):
+    # drop batches left by deletes which failed in previous requests
+    get_cascaded().clear()
+
+
+@receiver(post_save, sender=Favourite)
+def favourite_created(sender, instance, created, **kwargs):
+    if created:
+        favourite_added(instance)
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Recipe)
+def favourites_owner_deleting(sender, instance, **kwargs):
+    # sent before its favourites are deleted by cascade
+    get_cascaded()[sender, instance.pk] = []
+
+
+@receiver(post_delete, sender=Favourite)
+def favourite_deleted(sender, instance, **kwargs):
+    cascaded = get_cascaded()
+    for key in ((User, instance.user_id), (Recipe, instance.recipe_id)):
+        if key in cascaded:
+            cascaded[key].append(instance)
+            return
+    favourites_removed([instance])
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Recipe)
+def favourites_owner_deleted(sender, instance, **kwargs):
+    favourites_removed(get_cascaded().pop((sender, instance.pk), []))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # invalidate cached categories list (see catalog.context_processors)
+    bump_version('categories')
+    # and pages showing it in navbar
+    purge_surrogate_keys(CATEGORIES_KEY, category_key(instance.slug))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # invalidate cached comments of the recipe (see RecipeDetail)
+    bump_version('recipe:{}:comments'.format(instance.recipe_id))
+    purge_surrogate_keys(recipe_key(instance.recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # drafts are never cached
+    if instance.status != Recipe.STATUS_PUBLISHED:
+        return
+    purge_surrogate_keys(*published_recipe_keys(instance))
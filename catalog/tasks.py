@@ -0,0 +1,57 @@
+""" Tasks run by background jobs, see catalog.jobs """
+
+from catalog.models import Recipe
+from catalog.jobs import task
+from catalog.images import generate_derivatives
+from catalog.ingredients import update_recipe_ingredients
+from catalog.search import index_recipe
+from catalog.popularity import refresh_popular
+from catalog.recommendations import rebuild_similar
+from catalog.http_cache import send_purge_requests
+from catalog.likes import rebuild_like_counts
+
+
+def get_recipe(recipe_id):
+    # recipe could be deleted after the job was queued
+    return Recipe.objects.filter(pk=recipe_id).first()
+
+
+@task('generate_photo_derivatives')
+def generate_photo_derivatives_task(recipe_id):
+    recipe = get_recipe(recipe_id)
+    if recipe is not None:
+        generate_derivatives(recipe)
+
+
+@task('update_recipe_ingredients')
+def update_recipe_ingredients_task(recipe_id):
+    recipe = get_recipe(recipe_id)
+    if recipe is not None:
+        update_recipe_ingredients(recipe)
+
+
+@task('index_recipe')
+def index_recipe_task(recipe_id):
+    recipe = get_recipe(recipe_id)
+    if recipe is not None:
+        index_recipe(recipe)
+
+
+@task('rebuild_like_counts')
+def rebuild_like_counts_task():
+    rebuild_like_counts()
+
+
+@task('refresh_popular')
+def refresh_popular_task(full=False):
+    refresh_popular(full=full)
+
+
+@task('rebuild_similar_recipes')
+def rebuild_similar_recipes_task(full=False):
+    rebuild_similar(full=full)
+
+
+@task('purge_surrogate_keys')
+def purge_surrogate_keys_task(keys):
+    send_purge_requests(keys)
@@ -0,0 +1,68 @@
+""" Fragment caching with hit/miss counters """
+
+from django import template
+from django.core.cache import caches, InvalidCacheBackendError
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags.cache import CacheNode
+
+from catalog.cache import record_hit, record_miss
+
+
+register = template.Library()
+
+
+class CountedCacheNode(CacheNode):
+    """
+    Same as {% cache %} node, but records hits and misses
+    under fragment's name (see catalog.cache.get_stats).
+    """
+
+    def render(self, context):
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+        except template.VariableDoesNotExist:
+            raise template.TemplateSyntaxError(
+                '"counted_cache" tag got an unknown variable: %r'
+                % self.expire_time_var.var)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        try:
+            fragment_cache = caches['template_fragments']
+        except InvalidCacheBackendError:
+            fragment_cache = caches['default']
+
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        cache_key = make_template_fragment_key(self.fragment_name, vary_on)
+        value = fragment_cache.get(cache_key)
+        if value is None:
+            record_miss(self.fragment_name)
+            value = self.nodelist.render(context)
+            fragment_cache.set(cache_key, value, expire_time)
+        else:
+            record_hit(self.fragment_name)
+        return value
+
+
+@register.tag('counted_cache')
+def do_counted_cache(parser, token):
+    """
+    Usage is the same as of {% cache %} tag, without 'using' option::
+
+        {% load catalog_cache %}
+        {% counted_cache [expire_time] [fragment_name] [var1] [var2] .. %}
+            .. some expensive processing ..
+        {% endcounted_cache %}
+    """
+    nodelist = parser.parse(('endcounted_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            "'%r' tag requires at least 2 arguments." % tokens[0])
+    return CountedCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],  # fragment_name can't be a variable.
+        [parser.compile_filter(token) for token in tokens[3:]],
+        None,
+    )
@@ -1,3 +1,1491 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib.util
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, resolve
+from django.utils import timezone
+
+from catalog.models import (
+    Recipe, Category, Favourite, Job, Comment, SimilarRecipe,
+    ImportCheckpoint, PopularRecipe)
+from catalog.popularity import refresh_popular
+from catalog.recommendations import rebuild_similar
+from catalog.search import index_recipe, search_recipes
+from catalog.ingredients import update_recipe_ingredients, find_recipes
+from catalog.images import generate_derivatives
+from catalog.cache import (
+    register, get_registered, get_version, REGISTRY_KEY)
+from catalog.http_cache import (
+    recipe_key, purge_surrogate_keys, get_version_name)
+from catalog.feed import get_affinity, compute_affinity, get_feed
+from catalog.favourites import get_favourite_ids
+from catalog.importer import RecipeImporter, parse_record
+from catalog import jobs, context_processors
+from catalog.benchmark import (
+    generate_data, run_benchmarks, compare, BENCHMARKS, BenchmarkContext,
+    USERNAME)
+from catalog.query_budget import get_query_budget, QueryBudgetExceeded
+from catalog.pagination import encode_cursor
+from catalog.views.public import IndexView
+from catalog import urls
+from catalog.likes import rebuild_like_counts
+
+HAS_NUMPY = all(importlib.util.find_spec(name)
+                for name in ('numpy', 'scipy'))
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite',
+                     "Uses SQLite's EXPLAIN QUERY PLAN")
+class ListViewsQueryPlanTest(TestCase):
+    """
+    Queries of list views must be served by indexes: no full table scan
+    and no sorting with temporary B-tree.
+    """
+    FULL_SCAN_RE = re.compile(r'SCAN (TABLE )?catalog_\w+$')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'user', 'user@example.com', 'password')
+        cls.category = Category.objects.create(slug='soups', name='Soups')
+        now = timezone.now()
+        for i in range(45):
+            status = Recipe.STATUS_PUBLISHED if i % 3 else Recipe.STATUS_DRAFT
+            recipe = Recipe.objects.create(
+                title='Recipe {}'.format(i),
+                author=cls.user,
+                status=status,
+                pub_date=now - timedelta(hours=i) if status else None,
+            )
+            recipe.categories.add(cls.category)
+            if status:
+                Favourite.objects.create(user=cls.user, recipe=recipe)
+        refresh_popular()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_query_plans(self, url):
+        """
+        Request url and return list of (sql, plan details) of
+        queries touching catalog tables.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        plans = []
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'catalog_' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def test_list_views_use_indexes(self):
+        urls = [
+            reverse('index'),
+            reverse('recipes_newest'),
+            reverse('recipes_popular'),
+            reverse('recipes_by_category', kwargs={'slug': 'soups'}),
+            reverse('recipes_by_user', kwargs={'pk': self.user.pk}),
+            reverse('my_recipes'),
+            reverse('my_drafts'),
+            reverse('my_favourites'),
+        ]
+        # old, page-number URLs of keyset paginated views
+        urls += [
+            reverse('recipes_by_category', kwargs={'slug': 'soups'})
+            + '?page=2',
+            reverse('my_favourites') + '?page=2',
+        ]
+        for url in urls:
+            self.assertUsesIndexes(url)
+
+    def assertUsesIndexes(self, url):
+        plans = self.get_query_plans(url)
+        for sql, details in plans:
+            for detail in details:
+                with self.subTest(url=url, sql=sql, detail=detail):
+                    self.assertNotIn('TEMP B-TREE', detail)
+                    self.assertIsNone(self.FULL_SCAN_RE.match(detail))
+        return plans
+
+    def test_cursor_pages_use_index_ranges(self):
+        # second page of list is read from index, starting at position
+        # of the cursor on the first ordering field
+        lists = [
+            ('recipes_by_category', {'slug': 'soups'}, 'pub_date'),
+            ('recipes_by_user', {'pk': self.user.pk}, 'pub_date'),
+            ('my_recipes', {}, 'pub_date'),
+            ('my_drafts', {}, 'edit_date'),
+            ('my_favourites', {}, 'timestamp'),
+            ('api_recipe_list', {}, 'pub_date'),
+            ('api_category_recipes', {'slug': 'soups'}, 'pub_date'),
+            ('api_user_recipes', {'pk': self.user.pk}, 'pub_date'),
+        ]
+        for name, kwargs, field in lists:
+            url = reverse(name, kwargs=kwargs)
+            response = self.client.get(url)
+            if name.startswith('api_'):
+                cursor = response.json()['next']
+            else:
+                cursor = response.context['page_obj'].next_cursor
+            self.assertIsNotNone(cursor, name)
+
+            url += '?cursor=' + cursor
+            details = [detail
+                       for sql, details in self.assertUsesIndexes(url)
+                       for detail in details]
+            with self.subTest(url=url, details=details):
+                self.assertTrue(any(
+                    re.search(r'\b{}<\?'.format(field), detail)
+                    for detail in details))
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user')
+        now = timezone.now()
+        for i in range(25):
+            # groups of recipes published at the same time, so pages
+            # break ties by the following fields of ordering
+            Recipe.objects.create(
+                title='Recipe {}'.format(i),
+                author=cls.user,
+                status=Recipe.STATUS_PUBLISHED,
+                pub_date=now - timedelta(hours=i // 4),
+            )
+        cls.url = reverse('recipes_by_user', kwargs={'pk': cls.user.pk})
+        cls.expected = list(Recipe.objects
+                            .order_by('-pub_date', '-edit_date', '-id')
+                            .values_list('pk', flat=True))
+
+    def get_page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_next_and_previous_cursors(self):
+        pages = [self.get_page()]
+        self.assertIsNone(pages[0].previous_cursor)
+        while pages[-1].has_next():
+            pages.append(self.get_page(cursor=pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(
+            [recipe.pk for page in pages for recipe in page], self.expected)
+
+        # and back, from the last page
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.get_page(cursor=page.previous_cursor)
+            self.assertEqual([recipe.pk for recipe in page],
+                             [recipe.pk for recipe in expected])
+            self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor(self):
+        for cursor in ('x', encode_cursor(['a'], 'next'),
+                       encode_cursor([1, 2, 3], 'sideways')):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_page_number_fallback(self):
+        page = self.get_page(page=2)
+        self.assertEqual(page.number, 2)
+        self.assertEqual([recipe.pk for recipe in page],
+                         self.expected[10:20])
+        response = self.client.get(self.url, {'page': 4})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(JOB_MAX_ATTEMPTS=3, JOB_RETRY_DELAY=10)
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.TASKS['test'] = lambda value: self.calls.append(value)
+        jobs.TASKS['test_failing'] = lambda value: 1 / 0
+        self.addCleanup(jobs.TASKS.pop, 'test')
+        self.addCleanup(jobs.TASKS.pop, 'test_failing')
+
+    def test_job_is_run_once(self):
+        job = jobs.enqueue('test', value=1)
+        self.assertEqual(jobs.run_pending_jobs(), 1)
+        self.assertEqual(jobs.run_pending_jobs(), 0)
+        self.assertEqual(self.calls, [1])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual(jobs.get_queue_stats()['jobs']['done'], 1)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = jobs.enqueue('test_failing', value=1)
+        delays = []
+        for attempt in range(3):
+            job.refresh_from_db()
+            # make job due
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            with self.assertLogs('catalog.jobs'):
+                self.assertEqual(jobs.run_pending_jobs(), 1)
+            job.refresh_from_db()
+            delays.append(job.run_at - job.started)
+
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('ZeroDivisionError', job.last_error)
+        # postponed 10s, then 20s; failed job isn't postponed
+        self.assertAlmostEqual(delays[0].total_seconds(), 10, delta=1)
+        self.assertAlmostEqual(delays[1].total_seconds(), 20, delta=1)
+
+    def test_stale_job_is_requeued(self):
+        job = jobs.enqueue('test', value=1)
+        jobs.claim_job()
+        self.assertEqual(jobs.run_pending_jobs(), 0)
+        Job.objects.filter(pk=job.pk).update(
+            started=timezone.now() - timedelta(days=1))
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        self.assertEqual(jobs.run_pending_jobs(), 1)
+        self.assertEqual(self.calls, [1])
+
+
+class RecipeApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'user', 'user@example.com', 'password')
+        cls.category = Category.objects.create(slug='soups', name='Soups')
+        cls.recipe = Recipe.objects.create(
+            title='Tomato soup',
+            author=cls.user,
+            status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now(),
+        )
+        cls.recipe.set_ingredients(['tomatoes'])
+        cls.recipe.categories.add(cls.category)
+        cls.draft = Recipe.objects.create(title='Draft', author=cls.user)
+        cls.url = reverse('api_recipe_detail', kwargs={'pk': cls.recipe.pk})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lists(self):
+        urls = [
+            reverse('api_recipe_list'),
+            reverse('api_category_recipes', kwargs={'slug': 'soups'}),
+            reverse('api_user_recipes', kwargs={'pk': self.user.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                titles = [recipe['title'] for recipe in data['results']]
+                self.assertEqual(titles, ['Tomato soup'])
+                self.assertIsNone(data['next'])
+
+    @override_settings(API_PAGE_SIZE=2)
+    def test_cursor_pages(self):
+        now = self.recipe.pub_date
+        for i in range(4):
+            Recipe.objects.create(
+                title='Recipe {}'.format(i),
+                author=self.user,
+                status=Recipe.STATUS_PUBLISHED,
+                pub_date=now - timedelta(hours=i // 2),
+            )
+        expected = list(Recipe.objects
+                        .filter(status=Recipe.STATUS_PUBLISHED)
+                        .order_by('-pub_date', '-edit_date', '-id')
+                        .values_list('title', flat=True))
+        url = reverse('api_recipe_list')
+        pages = [self.client.get(url).json()]
+        while pages[-1]['next']:
+            with CaptureQueriesContext(connection) as context:
+                pages.append(self.client.get(
+                    url, {'cursor': pages[-1]['next']}).json())
+            sql = context.captured_queries[-1]['sql']
+        self.assertEqual(len(pages), 3)
+        self.assertEqual([recipe['title'] for page in pages
+                          for recipe in page['results']], expected)
+        previous = self.client.get(url, {'cursor': pages[1]['previous']})
+        self.assertEqual(previous.json()['results'], pages[0]['results'])
+
+        if connection.vendor != 'sqlite':
+            return
+        # page is read from index range, starting at the cursor
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+        self.assertIn('pub_date<?', details[0])
+        self.assertFalse(any('TEMP B-TREE' in detail for detail in details))
+
+    def test_fields(self):
+        response = self.client.get(self.url, {'fields': 'title,ingredients'})
+        data = response.json()
+        self.assertEqual(data, {'id': self.recipe.pk, 'title': 'Tomato soup',
+                                'ingredients': ['tomatoes']})
+        response = self.client.get(self.url, {'fields': 'title,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_drafts_are_hidden(self):
+        url = reverse('api_recipe_detail', kwargs={'pk': self.draft.pk})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # other fields - other representation
+        response = self.client.get(self.url, {'fields': 'title'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        last_modified = response['Last-Modified']
+        response = self.client.get(self.url, {'fields': 'title'},
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # like count changes without editing recipe
+        Favourite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['like_count'], 1)
+
+    def test_conditional_get_photo(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(photo='soup.jpg')
+        response = self.client.get(self.url, {'fields': 'photo'})
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+
+        # derivatives are generated without editing recipe
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            photo_tile='soup_tile.webp')
+        # cached responses are purged by generate_derivatives()
+        cache.clear()
+        response = self.client.get(self.url, {'fields': 'photo'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('tile', response.json()['photo'])
+
+
+class CategoriesCacheTest(TestCase):
+    """
+    Navbar categories are cached per version, in process and in shared
+    cache; changing any category bumps the version.
+    """
+    def setUp(self):
+        cache.clear()
+        context_processors._local_categories = (None, None)
+        self.user = User.objects.create_user('user')
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(slug='soups', name='Soups')
+
+    def get_category_names(self):
+        response = self.client.get(reverse('recipes_newest'))
+        return [category.name
+                for category in response.context['all_categories']]
+
+    def test_changes_bump_version(self):
+        for change in (self.category.save, self.category.delete,
+                       lambda: Category.objects.create(slug='x', name='X')):
+            version = get_version('categories')
+            change()
+            self.assertGreater(get_version('categories'), version)
+
+    def test_copies_refresh_on_next_request(self):
+        self.assertEqual(self.get_category_names(), ['Soups'])
+        version = get_version('categories')
+        key = context_processors.CATEGORIES_CACHE_KEY.format(version)
+        self.assertEqual(context_processors._local_categories[0], version)
+        self.assertEqual(cache.get(key), [self.category])
+
+        # another process, with no local copy, uses the shared one
+        context_processors._local_categories = (None, None)
+        with mock.patch.object(Category.objects, 'all') as all_categories:
+            self.assertEqual(self.get_category_names(), ['Soups'])
+        all_categories.assert_not_called()
+
+        self.category.name = 'Stews'
+        self.category.save()
+        self.assertEqual(self.get_category_names(), ['Stews'])
+        version = get_version('categories')
+        key = context_processors.CATEGORIES_CACHE_KEY.format(version)
+        self.assertEqual(context_processors._local_categories[0], version)
+        self.assertEqual([category.name for category in cache.get(key)],
+                         ['Stews'])
+
+
+class HttpCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'user', 'user@example.com', 'password')
+        cls.recipe = Recipe.objects.create(
+            title='Tomato soup',
+            author=cls.user,
+            status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now(),
+        )
+        cls.url = reverse('recipe_detail', kwargs={'pk': cls.recipe.pk})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_page_is_cached_until_purged(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        Comment.objects.create(user=self.user, recipe=self.recipe,
+                               text='Very tasty soup')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Very tasty soup')
+
+        Favourite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['recipe'].like_count, 1)
+
+    def test_unrelated_purge_keeps_page(self):
+        self.client.get(self.url)
+        other = Recipe.objects.create(
+            title='Other', author=self.user, status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now())
+        Comment.objects.create(user=self.user, recipe=other,
+                               text='Very tasty soup')
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_authenticated_page_is_not_cached(self):
+        self.client.get(self.url)
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertIsNotNone(response.context)
+
+    @override_settings(HTTP_CACHE_MODE='headers')
+    def test_headers_mode(self):
+        response = self.client.get(self.url)
+        self.assertIn('recipe-{}'.format(self.recipe.pk),
+                      response['Surrogate-Key'].split())
+        self.assertIn('s-maxage', response['Cache-Control'])
+
+
+class FragmentCacheTest(TestCase):
+    """
+    Fragments of recipe page are re-rendered after changes made by
+    add_comment and favourite views, as counted in cache stats.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.recipe = Recipe.objects.create(
+            title='Tomato soup',
+            author=cls.user,
+            status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now(),
+        )
+        cls.url = reverse('recipe_detail', kwargs={'pk': cls.recipe.pk})
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_stats(self, name):
+        client = self.client_class()
+        client.force_login(self.staff)
+        stats = client.get(reverse('cache_stats')).json()['caches']
+        return stats.get(name, {'hits': 0, 'misses': 0})
+
+    def test_comments_fragment_follows_add_comment(self):
+        self.client.get(self.url)
+        self.assertEqual(self.get_stats('recipe_comments'),
+                         {'hits': 0, 'misses': 1})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'No comments yet!')
+        self.assertEqual(self.get_stats('recipe_comments'),
+                         {'hits': 1, 'misses': 1})
+
+        self.client.post(reverse('add_comment', kwargs={'pk': self.recipe.pk}),
+                         {'text': 'Very tasty soup'})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Very tasty soup')
+        self.assertEqual(self.get_stats('recipe_comments'),
+                         {'hits': 1, 'misses': 2})
+        # immutable body is still served from cache
+        self.assertEqual(self.get_stats('recipe_body'),
+                         {'hits': 2, 'misses': 1})
+
+    def test_like_count_follows_favourite_view(self):
+        anonymous = self.client_class()
+        response = anonymous.get(self.url)
+        self.assertContains(response, '<span id="like-count">0</span>')
+        anonymous.get(self.url)
+        # second request is served with the whole page from cache
+        self.assertEqual(self.get_stats('recipe_body'),
+                         {'hits': 0, 'misses': 1})
+
+        self.client.put(reverse('favourite', kwargs={'pk': self.recipe.pk}))
+        response = anonymous.get(self.url)
+        self.assertContains(response, '<span id="like-count">1</span>')
+        self.assertEqual(self.get_stats('recipe_body'),
+                         {'hits': 1, 'misses': 1})
+
+
+@override_settings(COMMENTS_PER_PAGE=4)
+class CommentsViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user')
+        cls.recipe = Recipe.objects.create(
+            title='Tomato soup',
+            author=cls.user,
+            status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now(),
+        )
+        now = timezone.now()
+        for i in range(10):
+            comment = Comment.objects.create(
+                user=cls.user, recipe=cls.recipe,
+                text='Comment {}'.format(i))
+            # pairs of comments with the same date
+            Comment.objects.filter(pk=comment.pk).update(
+                pub_date=now - timedelta(minutes=i // 2))
+        cls.expected = list(Comment.objects
+                            .order_by('-pub_date', '-id')
+                            .values_list('text', flat=True))
+        cls.url = reverse('comments', kwargs={'pk': cls.recipe.pk})
+
+    def get_page(self, cursor=None):
+        params = {'cursor': cursor} if cursor else {}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages(self):
+        pages = [self.get_page()]
+        while pages[-1]['next']:
+            pages.append(self.get_page(pages[-1]['next']))
+        self.assertEqual([len(page['comments']) for page in pages],
+                         [4, 4, 2])
+        self.assertEqual([comment['text'] for page in pages
+                          for comment in page['comments']], self.expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+
+class HttpCachePurgeTest(TransactionTestCase):
+    def test_keys_are_purged_again_on_commit(self):
+        name = get_version_name(recipe_key(1))
+        with transaction.atomic():
+            purge_surrogate_keys(recipe_key(1))
+            # version read by concurrent request before the commit
+            version = get_version(name)
+        self.assertGreater(get_version(name), version)
+
+
+class FavouriteStatusTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'user', 'user@example.com', 'password')
+        cls.recipes = [
+            Recipe.objects.create(
+                title='Recipe {}'.format(i),
+                author=cls.user,
+                status=Recipe.STATUS_PUBLISHED,
+                pub_date=timezone.now(),
+            ) for i in range(3)
+        ]
+        Favourite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        cls.url = reverse('favourite_status')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_status(self):
+        ids = ','.join(str(recipe.pk) for recipe in self.recipes)
+        response = self.client.get(self.url, {'ids': ids})
+        return response.json()['favourites']
+
+    def test_status_follows_favourite_changes(self):
+        self.assertEqual(self.get_status(), [self.recipes[0].pk])
+        # favourite set is cached: session and user queries only
+        with self.assertNumQueries(2):
+            self.get_status()
+
+        url = reverse('favourite', kwargs={'pk': self.recipes[1].pk})
+        self.client.put(url)
+        self.assertEqual(self.get_status(),
+                         [self.recipes[0].pk, self.recipes[1].pk])
+        self.client.delete(url)
+        self.assertEqual(self.get_status(), [self.recipes[0].pk])
+
+    def test_invalid_ids(self):
+        response = self.client.get(self.url, {'ids': '1,x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FavouriteViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'user', 'user@example.com', 'password')
+        cls.recipe = Recipe.objects.create(
+            title='Tomato soup',
+            author=cls.user,
+            status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now(),
+        )
+        cls.draft = Recipe.objects.create(title='Draft', author=cls.user)
+        cls.url = reverse('favourite', kwargs={'pk': cls.recipe.pk})
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_put_and_delete_are_idempotent(self):
+        for changed in (True, False):
+            data = self.client.put(self.url).json()
+            self.assertEqual(data, {'liked': True, 'changed': changed,
+                                    'like_count': 1})
+        self.assertEqual(Favourite.objects.count(), 1)
+
+        for changed in (True, False):
+            data = self.client.delete(self.url).json()
+            self.assertEqual(data, {'liked': False, 'changed': changed,
+                                    'like_count': 0})
+        self.assertEqual(Favourite.objects.count(), 0)
+
+    def test_get_doesnt_change_state(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data, {'liked': False, 'changed': False,
+                                'like_count': 0})
+        self.assertEqual(Favourite.objects.count(), 0)
+
+    def test_draft_cant_be_liked(self):
+        url = reverse('favourite', kwargs={'pk': self.draft.pk})
+        self.assertEqual(self.client.put(url).status_code, 404)
+        self.assertEqual(Favourite.objects.count(), 0)
+
+
+class LikeCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user('user{}'.format(i))
+            for i in range(3)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                title='Recipe {}'.format(i),
+                author=cls.users[0],
+                status=Recipe.STATUS_PUBLISHED,
+                pub_date=timezone.now(),
+            ) for i in range(2)
+        ]
+        for user in cls.users:
+            Favourite.objects.create(user=user, recipe=cls.recipes[0])
+        Favourite.objects.create(user=cls.users[1], recipe=cls.recipes[1])
+
+    def get_like_counts(self):
+        return [Recipe.objects.get(pk=recipe.pk).like_count
+                for recipe in self.recipes]
+
+    def test_counts_follow_favourites(self):
+        self.assertEqual(self.get_like_counts(), [3, 1])
+
+    def test_command_restores_counts(self):
+        Recipe.objects.update(like_count=7)
+        call_command('rebuild_like_counts', stdout=StringIO())
+        self.assertEqual(self.get_like_counts(), [3, 1])
+
+    def test_deleting_user_decrements_counts(self):
+        User.objects.get(username='user1').delete()
+        self.assertEqual(self.get_like_counts(), [2, 0])
+        Favourite.objects.filter(user=self.users[2]).delete()
+        self.assertEqual(self.get_like_counts(), [1, 0])
+
+    def test_cascade_is_batched(self):
+        # favourites deleted with user are handled together: number of
+        # queries doesn't grow with number of favourites
+        for i in range(10):
+            recipe = Recipe.objects.create(
+                title='Extra {}'.format(i),
+                author=self.users[0],
+                status=Recipe.STATUS_PUBLISHED,
+                pub_date=timezone.now(),
+            )
+            Favourite.objects.create(user=self.users[2], recipe=recipe)
+        with CaptureQueriesContext(connection) as few:
+            User.objects.get(username='user1').delete()
+        with CaptureQueriesContext(connection) as many:
+            User.objects.get(username='user2').delete()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(self.get_like_counts(), [1, 0])
+        self.assertFalse(Recipe.objects.filter(like_count__gt=0)
+                         .exclude(pk=self.recipes[0].pk).exists())
+
+
+class FavouriteConcurrencyTest(TransactionTestCase):
+    """
+    Concurrent PUT and DELETE requests must leave like count
+    equal to the number of Favourite rows.
+    """
+    THREADS = 8
+    REQUESTS = 10
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'password')
+        self.recipe = Recipe.objects.create(
+            title='Tomato soup',
+            author=self.user,
+            status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now(),
+        )
+        self.url = reverse('favourite', kwargs={'pk': self.recipe.pk})
+
+    def hammer(self, methods):
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(method):
+            try:
+                client = self.client_class()
+                client.force_login(self.user)
+                barrier.wait(timeout=30)
+                for _ in range(self.REQUESTS):
+                    response = getattr(client, method)(self.url)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(method,))
+                   for method in methods]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assertConsistent(self):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.like_count,
+                         Favourite.objects.filter(recipe=self.recipe).count())
+
+    def test_concurrent_puts(self):
+        self.hammer(['put'] * self.THREADS)
+        self.assertConsistent()
+        self.assertEqual(self.recipe.like_count, 1)
+
+    def test_concurrent_puts_and_deletes(self):
+        self.hammer(['put', 'delete'] * (self.THREADS // 2))
+        self.assertConsistent()
+
+
+class BenchmarkTest(TestCase):
+    """
+    Every named URL must have a benchmark, working on generated data.
+    """
+    def setUp(self):
+        cache.clear()
+        generate_data(users=5, categories=3, recipes=30, favourites=50,
+                      comments=20)
+        rebuild_like_counts()
+
+    def test_generated_data(self):
+        self.assertEqual(Recipe.objects.filter(
+            status=Recipe.STATUS_PUBLISHED).count(), 27)
+        self.assertEqual(Favourite.objects.count(), 50)
+        self.assertTrue(Recipe.objects.filter(
+            author__username=USERNAME.format(0),
+            status=Recipe.STATUS_DRAFT).exists())
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(iterations=2, warmup=0)
+        self.assertEqual(set(results), set(BENCHMARKS))
+
+    def test_unknown_names(self):
+        with self.assertRaisesMessage(ValueError, 'Unknown benchmarks: nope'):
+            run_benchmarks(['index', 'nope'], iterations=1, warmup=0)
+
+    def test_created_data_removed(self):
+        count = Comment.objects.count()
+        run_benchmarks(['add_comment'], iterations=2, warmup=0)
+        self.assertEqual(Comment.objects.count(), count)
+
+    def test_commands_need_benchmark_database(self):
+        for command in ('seed_benchmark_data', 'benchmark'):
+            with self.subTest(command=command):
+                with self.assertRaisesMessage(CommandError,
+                                              'Not a benchmark database'):
+                    call_command(command)
+
+    def test_compare(self):
+        baseline = {'index': {'p95': 10.0, 'queries': 3}}
+        self.assertEqual(
+            compare({'index': {'p95': 13.0, 'queries': 3}}, baseline), [])
+        self.assertEqual(
+            compare({'index': {'p95': 15.0, 'queries': 4}}, baseline),
+            [('index', 'p95', 10.0, 15.0), ('index', 'queries', 3, 4)])
+
+
+class ConcurrentBenchmarkTest(TransactionTestCase):
+    """
+    Throughput benchmark makes requests from several threads,
+    each with its own database connection.
+    """
+    def setUp(self):
+        cache.clear()
+        generate_data(users=5, categories=3, recipes=30, favourites=50,
+                      comments=20)
+        rebuild_like_counts()
+
+    def test_run_benchmarks(self):
+        names = ['index', 'favourite', 'favourite_status', 'comments']
+        results = run_benchmarks(names, concurrency=2, requests=6)
+        self.assertEqual(set(results), set(names))
+        for result in results.values():
+            self.assertGreater(result['throughput'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Views must not make more queries than their budget, with cold cache
+    and authenticated user (the worst case).
+    """
+    def setUp(self):
+        cache.clear()
+        generate_data(users=5, categories=3, recipes=30, favourites=50,
+                      comments=20)
+        rebuild_like_counts()
+        refresh_popular()
+        self.context = BenchmarkContext()
+        self.client.force_login(self.context.user)
+
+    def assertWithinBudget(self, name, request):
+        """
+        Make request with cold cache and check number of its queries
+        against budget of view of named URL.
+        """
+        budget = get_query_budget(resolve(reverse(
+            name, kwargs=BENCHMARKS[name].kwargs(self.context))).func)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(len(queries), budget, "\n".join(
+            query['sql'] for query in queries.captured_queries))
+
+    def test_every_view_has_budget(self):
+        for pattern in urls.urlpatterns:
+            with self.subTest(url=pattern.name):
+                self.assertIsNotNone(get_query_budget(pattern.callback))
+
+    def test_get_requests(self):
+        for name, benchmark in BENCHMARKS.items():
+            url = reverse(name, kwargs=benchmark.kwargs(self.context))
+            request = getattr(self.client, benchmark.method)
+            data = benchmark.data or benchmark.query(self.context)
+            with self.subTest(url=name):
+                self.assertWithinBudget(name, lambda: request(url, data))
+
+    def test_changing_requests(self):
+        draft = self.context.draft
+        favourite_url = reverse('favourite',
+                                kwargs={'pk': self.context.recipe.pk})
+        edit_data = {
+            'recipe-title': 'Edited draft',
+            'recipe-categories': [self.context.category.pk],
+            'recipe-description': 'Edited.',
+            'ingredients-TOTAL_FORMS': 2,
+            'ingredients-INITIAL_FORMS': 0,
+            'ingredients-0-desc': '2 eggs',
+            'ingredients-1-desc': '100 g flour',
+            'directions-TOTAL_FORMS': 1,
+            'directions-INITIAL_FORMS': 0,
+            'directions-0-desc': 'Mix everything.',
+        }
+        requests = [
+            ('recipe_create', lambda: self.client.post(
+                reverse('recipe_create'), {
+                    'recipe-title': 'New draft',
+                    'recipe-categories': [self.context.category.pk],
+                })),
+            ('recipe_edit', lambda: self.client.post(
+                reverse('recipe_edit', kwargs={'pk': draft.pk}), edit_data)),
+            ('recipe_publish', lambda: self.client.post(
+                reverse('recipe_publish', kwargs={'pk': draft.pk}))),
+            ('favourite', lambda: self.client.put(favourite_url)),
+            ('favourite', lambda: self.client.delete(favourite_url)),
+        ]
+        for name, request in requests:
+            with self.subTest(url=name):
+                self.assertWithinBudget(name, request)
+
+        other_draft = Recipe.objects.filter(
+            author=self.context.user, status=Recipe.STATUS_DRAFT).first()
+        self.context.draft = other_draft
+        self.assertWithinBudget('recipe_delete', lambda: self.client.post(
+            reverse('recipe_delete', kwargs={'pk': other_draft.pk})))
+
+    def test_headers(self):
+        response = self.client.get(reverse('index'))
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertGreaterEqual(float(response['X-DB-Time']), 0)
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_enforced_at_runtime(self):
+        with mock.patch.object(IndexView, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('index'))
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        self.recipe = Recipe.objects.create(
+            title='Soup', author=user, status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now())
+        self.recipe.set_ingredients(['water'])
+
+    def test_requests_are_profiled(self):
+        with self.settings(PROFILING=True, PROFILING_SAMPLE_RATE=1,
+                           PROFILING_DIR=self.directory,
+                           PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                self.client.get(reverse('recipe_detail',
+                                        kwargs={'pk': self.recipe.pk}))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('catalog_request_duration_seconds_count'
+                      '{view="recipe_detail"} 3', metrics)
+        self.assertIn('catalog_request_duration_seconds_bucket'
+                      '{view="recipe_detail",le="+Inf"} 3', metrics)
+        self.assertIn('catalog_section_seconds_total'
+                      '{section="all_categories"}', metrics)
+        self.assertIn('catalog_section_seconds_total'
+                      '{section="recipe_rows"}', metrics)
+        self.assertIn('catalog_jobs{status="pending"} 0', metrics)
+
+    def test_metrics_not_public(self):
+        response = self.client.get(reverse('metrics'),
+                                   REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, 403)
+        # local address of reverse proxy isn't trusted by default
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_names_registered_once(self):
+        register('test', 'a')
+        register('test', 'b')
+        register('test', 'a')
+        self.assertEqual(get_registered('test'), {'a', 'b'})
+        self.assertEqual(cache.get(REGISTRY_KEY.format('test') + ':count'),
+                         2)
+
+
+class RecipeCardsTest(TestCase):
+    """
+    List pages load only columns shown on recipe cards.
+    """
+    def setUp(self):
+        cache.clear()
+        generate_data(users=3, categories=2, recipes=20, favourites=20,
+                      comments=0)
+        refresh_popular()
+        self.context = BenchmarkContext()
+        self.client.force_login(self.context.user)
+
+    def test_list_views_load_cards(self):
+        names = ['index', 'recipes_newest', 'recipes_popular',
+                 'recipes_by_category', 'recipes_by_user', 'recipe_search',
+                 'recipes_by_ingredients', 'my_recipes', 'my_drafts',
+                 'my_favourites']
+        for name in names:
+            benchmark = BENCHMARKS[name]
+            url = reverse(name, kwargs=benchmark.kwargs(self.context))
+            with self.subTest(url=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url, benchmark.query(self.context))
+                self.assertEqual(response.status_code, 200)
+                for query in queries.captured_queries:
+                    self.assertNotIn('"description"', query['sql'])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user')
+
+    def create_recipe(self, title):
+        recipe = Recipe.objects.create(
+            title=title, author=self.user, status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now())
+        index_recipe(recipe)
+        return recipe
+
+    def test_results_cached_until_index_changes(self):
+        soup = self.create_recipe('Tomato soup')
+        self.assertEqual(search_recipes('soup'), [soup.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(search_recipes('Soup!'), [soup.pk])
+
+        other = self.create_recipe('Onion soup')
+        self.assertCountEqual(search_recipes('soup'), [soup.pk, other.pk])
+
+
+class FindRecipesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user')
+
+    def create_recipe(self, ingredients):
+        recipe = Recipe.objects.create(
+            title='Recipe', author=self.user,
+            status=Recipe.STATUS_PUBLISHED, pub_date=timezone.now())
+        recipe.set_ingredients(ingredients)
+        update_recipe_ingredients(recipe)
+        return recipe
+
+    def test_ranked_by_coverage(self):
+        omelette = self.create_recipe(['3 eggs', 'pinch of salt'])
+        cake = self.create_recipe(['2 eggs', 'flour', 'sugar', 'salt'])
+        self.create_recipe(['water'])
+        self.assertEqual(Recipe.objects.get(pk=cake.pk).ingredient_count, 4)
+        self.assertEqual(find_recipes(['eggs', 'salt']),
+                         [(omelette.pk, 2, 2), (cake.pk, 2, 4)])
+        with self.settings(INGREDIENTS_MAX_RESULTS=1):
+            self.assertEqual(find_recipes(['salt']), [(omelette.pk, 1, 2)])
+
+
+class PhotoDerivativesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media = self.settings(MEDIA_ROOT=directory)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        user = User.objects.create_user('user')
+        self.client.force_login(user)
+        self.recipe = Recipe.objects.create(
+            title='Soup', author=user, status=Recipe.STATUS_PUBLISHED,
+            pub_date=timezone.now())
+        photo = BytesIO()
+        Image.new('RGB', (10, 10)).save(photo, 'JPEG')
+        self.recipe.photo.save('soup.jpg', ContentFile(photo.getvalue()))
+
+    def test_regenerated(self):
+        url = self.recipe.get_absolute_url()
+        self.assertNotContains(self.client.get(url), '.webp')
+
+        generate_derivatives(self.recipe)
+        old_tile = Recipe.objects.get(pk=self.recipe.pk).photo_tile
+        # cached header is replaced, though edit date didn't change
+        self.assertContains(self.client.get(url), old_tile.url)
+
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        generate_derivatives(recipe)
+        self.assertNotEqual(recipe.photo_tile.name, old_tile.name)
+        self.assertTrue(recipe.photo_tile.storage.exists(
+            recipe.photo_tile.name))
+        self.assertFalse(old_tile.storage.exists(old_tile.name))
+        self.assertContains(self.client.get(url), recipe.photo_tile.url)
+
+
+@override_settings(POPULAR_HALF_LIFE_DAYS=7, POPULAR_MIN_SCORE=0.01)
+class PopularityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.users = [
+            User.objects.create_user('user{}'.format(i))
+            for i in range(3)
+        ]
+        author = User.objects.create_user('author')
+        cls.recipes = [
+            Recipe.objects.create(
+                title='Recipe {}'.format(i),
+                author=author,
+                status=Recipe.STATUS_PUBLISHED,
+                pub_date=cls.now,
+            ) for i in range(3)
+        ]
+        cls.like(0, 0, days=0)
+        cls.like(1, 0, days=7)
+        cls.like(0, 1, days=14)
+        # decays below POPULAR_MIN_SCORE
+        cls.like(1, 2, days=70)
+
+    @classmethod
+    def like(cls, user, recipe, days):
+        favourite = Favourite.objects.create(
+            user=cls.users[user], recipe=cls.recipes[recipe])
+        Favourite.objects.filter(pk=favourite.pk).update(
+            timestamp=cls.now - timedelta(days=days))
+
+    def get_scores(self):
+        return dict(PopularRecipe.objects.values_list('recipe_id', 'score'))
+
+    def assertScores(self, expected):
+        scores = self.get_scores()
+        self.assertEqual(set(scores), set(
+            self.recipes[i].pk for i in expected))
+        for i, score in expected.items():
+            self.assertAlmostEqual(scores[self.recipes[i].pk], score)
+
+    def test_decayed_scores(self):
+        self.assertEqual(refresh_popular(now=self.now), 4)
+        # 1 + 0.5 for favourites of age 0 and a half-life, 0.25 for two
+        # half-lives; recipe liked ten half-lives ago is pruned
+        self.assertScores({0: 1.5, 1: 0.25})
+
+    def test_incremental_refresh(self):
+        refresh_popular(now=self.now)
+        later = self.now + timedelta(days=7)
+        self.like(1, 1, days=-7)
+        # only the favourite added since the last refresh is processed
+        self.assertEqual(refresh_popular(now=later), 1)
+        self.assertScores({0: 0.75, 1: 1.125})
+
+    def test_full_refresh_recomputes_scores(self):
+        refresh_popular(now=self.now)
+        PopularRecipe.objects.update(score=100)
+        self.assertEqual(refresh_popular(full=True, now=self.now), 4)
+        self.assertScores({0: 1.5, 1: 0.25})
+
+    def test_unliking_subtracts_decayed_weight(self):
+        refresh_popular(now=self.now)
+        self.client.force_login(self.users[1])
+        self.client.delete(reverse(
+            'favourite', kwargs={'pk': self.recipes[0].pk}))
+        self.assertScores({0: 1.0, 1: 0.25})
+
+        # favourite added after the refresh isn't counted yet
+        self.like(2, 1, days=0)
+        Favourite.objects.filter(user=self.users[2]).delete()
+        self.assertScores({0: 1.0, 1: 0.25})
+
+        # favourites deleted by cascade with their user are subtracted
+        User.objects.get(username='user0').delete()
+        self.assertScores({0: 0.0, 1: 0.0})
+
+
+class SimilarRecipesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user('user{}'.format(i))
+                      for i in range(4)]
+        self.recipes = [Recipe.objects.create(
+            title='Recipe {}'.format(i), author=self.users[0],
+            status=Recipe.STATUS_PUBLISHED, pub_date=timezone.now())
+            for i in range(3)]
+
+    def like(self, user, recipe):
+        Favourite.objects.create(user=self.users[user],
+                                 recipe=self.recipes[recipe])
+
+    def get_similar(self, recipe):
+        return list(SimilarRecipe.objects
+                    .filter(recipe=self.recipes[recipe])
+                    .order_by('-score')
+                    .values_list('similar__title', flat=True))
+
+    @unittest.skipUnless(HAS_NUMPY, "Needs NumPy and SciPy")
+    @override_settings(SIMILAR_RECIPES_MIN_COMMON=2)
+    def test_rebuild(self):
+        for user in (0, 1, 2):
+            self.like(user, 0)
+            self.like(user, 1)
+        self.like(3, 2)
+        self.like(0, 2)
+        rebuild_similar()
+        self.assertEqual(self.get_similar(0), ['Recipe 1'])
+        self.assertEqual(self.get_similar(2), [])
+        score = SimilarRecipe.objects.get(
+            recipe=self.recipes[0], similar=self.recipes[1]).score
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+        # incremental: second common user of recipes 0 and 2
+        self.like(1, 2)
+        with mock.patch('catalog.recommendations.purge_surrogate_keys') \
+                as purge:
+            self.assertEqual(rebuild_similar(), 3)
+            self.assertEqual(rebuild_similar(), 0)
+        purge.assert_called_once_with(
+            *[recipe_key(recipe.pk) for recipe in self.recipes])
+        self.assertEqual(self.get_similar(0), ['Recipe 1', 'Recipe 2'])
+        self.assertCountEqual(self.get_similar(2), ['Recipe 0', 'Recipe 1'])
+
+    def test_shown_on_recipe_page(self):
+        SimilarRecipe.objects.create(recipe=self.recipes[0],
+                                     similar=self.recipes[2], score=0.5)
+        response = self.client.get(self.recipes[0].get_absolute_url())
+        self.assertContains(response, 'People who liked this also liked')
+        self.assertContains(response, 'Recipe 2')
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user')
+        self.author = User.objects.create_user('author')
+        self.categories = [Category.objects.create(
+            name='Category {}'.format(i), slug='category-{}'.format(i))
+            for i in range(3)]
+        self.recipes = []
+        for i in range(9):
+            recipe = Recipe.objects.create(
+                title='Recipe {}'.format(i), author=self.author,
+                status=Recipe.STATUS_PUBLISHED,
+                pub_date=timezone.now() - timedelta(days=10 - i))
+            recipe.categories.set([self.categories[i % 3]])
+            self.recipes.append(recipe)
+        self.client.force_login(self.user)
+
+    def like(self, recipe):
+        url = reverse('favourite', kwargs={'pk': self.recipes[recipe].pk})
+        self.client.put(url)
+
+    def get_feed(self):
+        response = self.client.get(reverse('index'))
+        return [recipe.title for recipe in response.context['feed_recipes']]
+
+    def test_affinity(self):
+        self.like(0)
+        self.like(3)
+        self.like(1)
+        self.assertEqual(get_affinity(self.user),
+                         (('category-0', 0.6667), ('category-1', 0.3333)))
+        Favourite.objects.filter(recipe=self.recipes[0]).update(
+            timestamp=timezone.now() - timedelta(
+                days=settings.FEED_HALF_LIFE_DAYS))
+        self.assertEqual(compute_affinity(self.user.pk),
+                         (('category-0', 0.6), ('category-1', 0.4)))
+
+    def test_feed_on_index_page(self):
+        self.assertEqual(self.get_feed(), [])
+        self.like(0)
+        # refreshed after favourite change, liked recipe is skipped
+        self.assertEqual(self.get_feed(), ['Recipe 6', 'Recipe 3'])
+        self.like(1)
+        self.like(4)
+        self.assertEqual(self.get_feed(),
+                         ['Recipe 7', 'Recipe 6', 'Recipe 3'])
+
+        # cached affinity, serving takes two queries
+        get_favourite_ids(self.user)
+        with self.assertNumQueries(2):
+            get_feed(self.user)
+
+
+class ImportRecipesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.user = User.objects.create_user('user')
+        Category.objects.create(name='Soups', slug='soups')
+        Category.objects.create(name='Vegetarian', slug='vegetarian')
+        Image.new('RGB', (10, 10)).save(
+            os.path.join(self.directory, 'soup.jpg'))
+
+        self.path = os.path.join(self.directory, 'recipes.ndjson')
+        with open(self.path, 'w') as file:
+            for i in range(5):
+                file.write(json.dumps({
+                    'title': 'Soup {}'.format(i),
+                    'author': 'user',
+                    'categories': ['soups', 'Vegetarian'],
+                    'ingredients': ['water', 'salt'],
+                    'directions': ['Boil.'],
+                }) + '\n')
+            file.write('\n{"title": "No categories"}\n')
+            file.write(json.dumps({
+                'title': 'Draft with photo', 'status': 'draft',
+                'categories': ['soups'], 'photo': 'soup.jpg'}) + '\n')
+
+    def import_recipes(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        with self.settings(MEDIA_ROOT=self.directory):
+            call_command('import_recipes', self.path, '--batch-size', '3',
+                         '--author', 'user', '--photos', self.directory,
+                         *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import(self):
+        stdout, stderr = self.import_recipes()
+        self.assertIn('6 recipes imported, 1 invalid', stdout)
+        self.assertIn('recipes/s', stdout)
+        self.assertEqual(stderr.strip(),
+                         "Line 7: 'categories' can't be empty.")
+
+        recipe = Recipe.objects.get(title='Soup 1')
+        self.assertEqual(recipe.status, Recipe.STATUS_PUBLISHED)
+        self.assertIsNotNone(recipe.pub_date)
+        self.assertEqual(recipe.ingredients_list,
+                         [{'desc': 'water'}, {'desc': 'salt'}])
+        self.assertCountEqual(recipe.categories.values_list('pk', flat=True),
+                              ['soups', 'vegetarian'])
+        draft = Recipe.objects.get(title='Draft with photo')
+        self.assertEqual(draft.photo.name,
+                         'user_photos/{}.jpg'.format(draft.pk))
+
+        jobs = Counter(Job.objects.values_list('name', flat=True))
+        self.assertEqual(jobs, {'update_recipe_ingredients': 6,
+                                'index_recipe': 5,
+                                'generate_photo_derivatives': 1})
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_resume(self):
+        import_batch = RecipeImporter.import_batch
+        calls = []
+
+        def failing_import_batch(importer, records):
+            calls.append(records)
+            if len(calls) == 2:
+                raise RuntimeError("Failed")
+            return import_batch(importer, records)
+
+        with mock.patch.object(RecipeImporter, 'import_batch',
+                               failing_import_batch):
+            with self.assertRaises(RuntimeError):
+                self.import_recipes('--skip-jobs')
+        self.assertEqual(Recipe.objects.count(), 3)
+        # recipe created meanwhile takes pk of the failed batch
+        Recipe.objects.create(title='Draft', author=self.user)
+
+        with self.assertRaises(CommandError):
+            self.import_recipes()
+        stdout, _ = self.import_recipes('--resume', '--skip-jobs')
+        self.assertIn('Resuming at line 4', stdout)
+        self.assertIn('6 recipes imported', stdout)
+        self.assertEqual(Recipe.objects.count(), 7)
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_parallel_parsing(self):
+        stdout, _ = self.import_recipes('--workers', '2')
+        self.assertIn('6 recipes imported', stdout)
+        self.assertEqual(Recipe.objects.count(), 6)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user')
+        other = User.objects.create_user('other')
+        category = Category.objects.create(name='Soups', slug='soups')
+        self.recipes = []
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                title='Soup {}'.format(i), author=self.user,
+                status=Recipe.STATUS_PUBLISHED, pub_date=timezone.now())
+            recipe.categories.set([category])
+            recipe.set_ingredients(['water', 'salt {}'.format(i)])
+            recipe.set_directions(['Boil.'])
+            self.recipes.append(recipe)
+        Recipe.objects.create(title='Draft', author=self.user)
+        Recipe.objects.create(title='Other', author=other,
+                              status=Recipe.STATUS_PUBLISHED,
+                              pub_date=timezone.now())
+        Favourite.objects.create(user=self.user, recipe=self.recipes[1])
+        self.client.force_login(self.user)
+
+    def get_content(self, name, kind, **query):
+        response = self.client.get(
+            reverse(name, kwargs={'kind': kind}), query)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_recipes(self):
+        response = self.client.get(
+            reverse('export', kwargs={'kind': 'recipes'}))
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="recipes.ndjson"')
+        # one query for recipes and one per relation for every chunk
+        with self.assertNumQueries(1 + 3 * 3):
+            lines = b''.join(response.streaming_content).splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['title'] for record in records],
+                         ['Soup {}'.format(i) for i in range(5)])
+        self.assertEqual(records[4]['ingredients'], ['water', 'salt 4'])
+        self.assertEqual(records[4]['categories'], ['soups'])
+        self.assertEqual(records[4]['author'], 'user')
+        # exported recipes can be imported back
+        self.assertEqual(parse_record(lines[4])['title'], 'Soup 4')
+
+        drafts = self.get_content('export', 'drafts').splitlines()
+        self.assertEqual(json.loads(drafts[0])['status'], 'draft')
+
+    def test_csv_and_gzip(self):
+        content = gzip.decompress(self.get_content(
+            'export', 'favourites', format='csv', gzip='1'))
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(rows[0], ['user_id', 'recipe_id', 'recipe_title',
+                                   'timestamp'])
+        self.assertEqual(rows[1][1:3], [str(self.recipes[1].pk), 'Soup 1'])
+
+    def test_errors(self):
+        url = reverse('export', kwargs={'kind': 'recipes'})
+        self.assertEqual(
+            self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(
+            reverse('export', kwargs={'kind': 'users'})).status_code, 404)
+        # full catalog only for staff
+        response = self.client.get(
+            reverse('export_catalog', kwargs={'kind': 'recipes'}))
+        self.assertEqual(response.status_code, 302)
+
+    def test_catalog(self):
+        self.user.is_staff = True
+        self.user.save()
+        lines = self.get_content('export_catalog', 'recipes').splitlines()
+        self.assertEqual(len(lines), 6)
+
+        path = os.path.join(tempfile.mkdtemp(), 'recipes.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_data', 'recipes', '--user', 'other',
+                     '--format', 'csv', '--output', path)
+        with open(path) as file:
+            rows = list(csv.reader(file))
+        self.assertEqual([row[1] for row in rows[1:]], ['Other'])
@@ -14,6 +14,10 @@ urlpatterns = [
          name='recipes_popular'),
     path('recipes/by/<int:pk>/', views.public.RecipesByUser.as_view(),
          name='recipes_by_user'),
+    path('search/', views.public.RecipeSearch.as_view(),
+         name='recipe_search'),
+    path('cook/', views.public.RecipesByIngredients.as_view(),
+         name='recipes_by_ingredients'),
 
     # USER VIEWS
     path('recipe/new/', views.user.recipe_create_draft, name='recipe_create'),
@@ -30,10 +34,32 @@ urlpatterns = [
          name='recipe_publish'),
     path('recipe/<int:pk>/delete/', views.user.recipe_delete,
          name='recipe_delete'),
+    path('export/<slug:kind>/', views.export.export_view, name='export'),
+    path('export/catalog/<slug:kind>/', views.export.export_catalog_view,
+         name='export_catalog'),
 
     # AJAX
     path('recipe/<int:pk>/favourite/', views.ajax.favourite_view,
-         name='favourite_toggle'),
+         name='favourite'),
+    path('favourites/status/', views.ajax.favourite_status_view,
+         name='favourite_status'),
     path('recipe/<int:pk>/add_comment/', views.ajax.add_comment_view,
          name='add_comment'),
+    path('recipe/<int:pk>/comments/', views.ajax.comments_view,
+         name='comments'),
+
+    # API v1
+    path('api/v1/recipes/', views.api.recipe_list_view,
+         name='api_recipe_list'),
+    path('api/v1/recipes/<int:pk>/', views.api.recipe_detail_view,
+         name='api_recipe_detail'),
+    path('api/v1/categories/<slug:slug>/recipes/',
+         views.api.category_recipes_view, name='api_category_recipes'),
+    path('api/v1/users/<int:pk>/recipes/', views.api.user_recipes_view,
+         name='api_user_recipes'),
+
+    # STATS
+    path('stats/cache/', views.stats.cache_stats_view, name='cache_stats'),
+    path('stats/jobs/', views.stats.job_stats_view, name='job_stats'),
+    path('metrics/', views.stats.metrics_view, name='metrics'),
 ]
@@ -1,3 +1,6 @@
 from . import public
 from . import user
 from . import ajax
+from . import stats
+from . import api
+from . import export
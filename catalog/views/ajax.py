@@ -1,32 +1,79 @@
 """ Views for ajax requests """
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse, HttpResponseNotAllowed
+from django.http import (
+    JsonResponse, HttpResponseNotAllowed, HttpResponseBadRequest, Http404)
+from django.views.decorators.cache import cache_control
 
 
-from catalog.models import Recipe, Category, Favourite
+from catalog.models import Recipe, Category, Comment
 from catalog.forms import CommentForm
+from catalog.pagination import get_keyset_page
+from catalog.http_cache import add_surrogate_keys, recipe_key
+from catalog.favourites import (
+    get_favourite_ids, get_like_count, add_favourite, remove_favourite)
+from catalog.query_budget import query_budget
 
 
+@query_budget(9)
+@cache_control(private=True)
 def favourite_view(request, pk):
+    """
+    Shows (GET), adds (PUT) or removes (DELETE) recipe from user's
+    favourites. PUT and DELETE are idempotent, so repeated or concurrent
+    requests end in the same state. Returns the state and recipe's
+    like count.
+    """
+    if request.method not in ("GET", "PUT", "DELETE"):
+        return HttpResponseNotAllowed(['GET', 'PUT', 'DELETE'])
+    if not request.user.is_authenticated:
+        raise PermissionDenied()
+
+    if request.method == "PUT":
+        liked = True
+        changed, like_count = add_favourite(request.user, pk)
+    elif request.method == "DELETE":
+        liked = False
+        changed, like_count = remove_favourite(request.user, pk)
+    else:
+        liked = pk in get_favourite_ids(request.user)
+        changed, like_count = False, get_like_count(pk)
+    if like_count is None:
+        raise Http404("No such recipe.")
+
+    return JsonResponse({
+        'liked': liked,
+        'changed': changed,
+        'like_count': like_count,
+    })
+
+
+@query_budget(3)
+@cache_control(private=True)
+def favourite_status_view(request):
+    """
+    Returns which of recipes given in 'ids' GET parameter (comma
+    separated pks) are liked by user.
+    """
     if not request.method == "GET":
         return HttpResponseNotAllowed(['GET'])
     if not request.user.is_authenticated:
         raise PermissionDenied()
 
-    recipe = get_object_or_404(Recipe, pk=pk, status=Recipe.STATUS_PUBLISHED)
-    favourite, created = Favourite.objects.get_or_create(
-        user=request.user,
-        recipe=recipe
-    )
-    if created:
-        return JsonResponse({'created': True})
-    else:
-        favourite.delete()
-        return JsonResponse({'created': False})
+    try:
+        ids = {int(pk) for pk in request.GET.get('ids', '').split(',') if pk}
+    except ValueError:
+        return HttpResponseBadRequest("Invalid ids.")
+    if len(ids) > settings.FAVOURITE_STATUS_MAX_IDS:
+        return HttpResponseBadRequest("Too many ids.")
+
+    favourites = ids & get_favourite_ids(request.user)
+    return JsonResponse({'favourites': sorted(favourites)})
 
 
+@query_budget(4)
 def add_comment_view(request, pk):
     if not request.method == "POST":
         return HttpResponseNotAllowed(['POST'])
@@ -47,3 +94,27 @@ def add_comment_view(request, pk):
                              })
 
     return JsonResponse({'success': False})
+
+
+@query_budget(4)
+def comments_view(request, pk):
+    """
+    Returns page of recipe's comments, newest first, starting after
+    position given in 'cursor' GET parameter.
+    """
+    if not request.method == "GET":
+        return HttpResponseNotAllowed(['GET'])
+
+    recipe = get_object_or_404(Recipe, pk=pk, status=Recipe.STATUS_PUBLISHED)
+    add_surrogate_keys(request, recipe_key(recipe.pk))
+    page = get_keyset_page(
+        recipe.comments.select_related('user'),
+        Comment.KEYSET_ORDERING,
+        settings.COMMENTS_PER_PAGE,
+        request.GET.get('cursor'),
+    )
+    return JsonResponse({
+        'comments': [{'title': str(comment), 'text': str(comment.text)}
+                     for comment in page],
+        'next': page.next_cursor,
+    })
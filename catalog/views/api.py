@@ -0,0 +1,261 @@
+""" Read-only JSON API, version 1 """
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.shortcuts import get_object_or_404
+from django.http import JsonResponse, HttpResponseNotAllowed
+from django.views.decorators.http import condition
+
+from catalog.models import Recipe, Category
+from catalog.pagination import get_keyset_page
+from catalog.cache import get_version
+from catalog.http_cache import (
+    add_surrogate_keys, CATEGORIES_KEY, RECIPES_KEY,
+    recipe_key, category_key, user_key)
+from catalog.query_budget import query_budget
+
+
+LIST_ORDERING = ('-pub_date', '-edit_date', '-id')
+
+
+def get_photo(recipe, request):
+    if not recipe.photo:
+        return None
+    photo = {'original': request.build_absolute_uri(recipe.photo.url)}
+    for field, _ in Recipe.PHOTO_DERIVATIVES:
+        derivative = getattr(recipe, field)
+        if derivative:
+            photo[field[len('photo_'):]] = request.build_absolute_uri(
+                derivative.url)
+    return photo
+
+
+def get_author(recipe, request):
+    if recipe.author is None:
+        return None
+    return {'id': recipe.author.pk, 'username': recipe.author.username}
+
+
+# field name -> function(recipe, request) returning its value
+RECIPE_FIELDS = {
+    'id': lambda recipe, request: recipe.pk,
+    'title': lambda recipe, request: recipe.title,
+    'description': lambda recipe, request: recipe.description,
+    'url': lambda recipe, request: request.build_absolute_uri(
+        recipe.get_absolute_url()),
+    'author': get_author,
+    'categories': lambda recipe, request: [
+        {'slug': category.slug, 'name': category.name}
+        for category in recipe.categories.all()],
+    'ingredients': lambda recipe, request: [
+        ingredient['desc'] for ingredient in recipe.ingredients_list],
+    'directions': lambda recipe, request: [
+        direction['desc'] for direction in recipe.directions_list],
+    'photo': get_photo,
+    'like_count': lambda recipe, request: recipe.like_count,
+    'pub_date': lambda recipe, request: recipe.pub_date,
+    'edit_date': lambda recipe, request: recipe.edit_date,
+}
+LIST_FIELDS = ('id', 'title', 'url', 'author', 'photo', 'like_count',
+               'pub_date')
+DETAIL_FIELDS = tuple(RECIPE_FIELDS)
+# big columns, not loaded unless their field is requested
+DEFERRABLE_FIELDS = ('description',)
+# related rows, prefetched only if their field is requested
+PREFETCHED_FIELDS = ('categories', 'ingredients', 'directions')
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def get_fields(request, default):
+    """
+    Return tuple of fields requested in 'fields' GET parameter
+    (comma separated), or default ones. 'id' is always included.
+    Raises FieldsError for unknown fields.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return default
+    fields = ['id']
+    for field in value.split(','):
+        field = field.strip()
+        if field not in RECIPE_FIELDS:
+            raise FieldsError("Unknown field: {}".format(field))
+        if field not in fields:
+            fields.append(field)
+    return tuple(fields)
+
+
+def fields_error(error):
+    return JsonResponse({'error': str(error)}, status=400)
+
+
+def get_recipes(fields):
+    """
+    Return queryset of published recipes, loading only data needed
+    for given fields.
+    """
+    queryset = Recipe.objects\
+        .filter(status=Recipe.STATUS_PUBLISHED)\
+        .defer(*[field for field in DEFERRABLE_FIELDS if field not in fields])
+    if 'author' in fields:
+        queryset = queryset.select_related('author')
+    queryset = queryset.prefetch_related(
+        *[field for field in PREFETCHED_FIELDS if field in fields])
+    return queryset
+
+
+def serialize_recipe(recipe, fields, request):
+    return {field: RECIPE_FIELDS[field](recipe, request) for field in fields}
+
+
+def recipe_list_response(request, queryset, fields, surrogate_key):
+    """
+    Return JSON response with keyset paginated page of recipes,
+    starting after position given in 'cursor' GET parameter.
+    """
+    page = get_keyset_page(queryset, LIST_ORDERING, settings.API_PAGE_SIZE,
+                           request.GET.get('cursor'))
+    add_surrogate_keys(request, surrogate_key,
+                       *[recipe_key(recipe.pk) for recipe in page])
+    if 'categories' in fields:
+        add_surrogate_keys(request, CATEGORIES_KEY)
+    return JsonResponse({
+        'results': [serialize_recipe(recipe, fields, request)
+                    for recipe in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@query_budget(3)
+def recipe_list_view(request):
+    """
+    Returns published recipes, newest first.
+    """
+    if not request.method == "GET":
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        fields = get_fields(request, LIST_FIELDS)
+    except FieldsError as error:
+        return fields_error(error)
+
+    return recipe_list_response(request, get_recipes(fields), fields,
+                                RECIPES_KEY)
+
+
+@query_budget(4)
+def category_recipes_view(request, slug):
+    """
+    Returns published recipes in selected category, newest first.
+    """
+    if not request.method == "GET":
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        fields = get_fields(request, LIST_FIELDS)
+    except FieldsError as error:
+        return fields_error(error)
+
+    category = get_object_or_404(Category, slug=slug)
+    queryset = get_recipes(fields).filter(categories=category)
+    return recipe_list_response(request, queryset, fields,
+                                category_key(category.slug))
+
+
+@query_budget(4)
+def user_recipes_view(request, pk):
+    """
+    Returns published recipes of selected user, newest first.
+    """
+    if not request.method == "GET":
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        fields = get_fields(request, LIST_FIELDS)
+    except FieldsError as error:
+        return fields_error(error)
+
+    user = get_object_or_404(User, pk=pk)
+    queryset = get_recipes(fields).filter(author=user)
+    return recipe_list_response(request, queryset, fields, user_key(user.pk))
+
+
+PHOTO_DERIVATIVE_FIELDS = [field for field, _ in Recipe.PHOTO_DERIVATIVES]
+
+
+def get_recipe_state(request, pk):
+    """
+    Return dict of edit date and photo derivatives' paths of published
+    recipe, or None if there is no such recipe. Cached on request, since
+    it's needed by both etag and last modified functions.
+    """
+    if not hasattr(request, '_api_recipe_state'):
+        request._api_recipe_state = Recipe.objects\
+            .filter(pk=pk, status=Recipe.STATUS_PUBLISHED)\
+            .values('edit_date', *PHOTO_DERIVATIVE_FIELDS)\
+            .first()
+    return request._api_recipe_state
+
+
+def recipe_etag(request, pk):
+    """
+    Strong ETag of recipe's representation: changes with recipe's
+    edit date and selected fields. Like count, category names and photo
+    derivatives change without editing the recipe, so their cache
+    versions (or paths) are included when these fields are selected.
+    """
+    state = get_recipe_state(request, pk)
+    try:
+        fields = get_fields(request, DETAIL_FIELDS)
+    except FieldsError:
+        return None
+    if state is None:
+        return None
+
+    parts = [pk, state['edit_date'].timestamp(), ','.join(fields)]
+    if 'like_count' in fields:
+        parts.append(get_version('recipe:{}:likes'.format(pk)))
+    if 'categories' in fields:
+        parts.append(get_version('categories'))
+    if 'photo' in fields:
+        parts += [state[field] for field in PHOTO_DERIVATIVE_FIELDS]
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def recipe_last_modified(request, pk):
+    """
+    Recipe's edit date, unless representation includes fields changing
+    without editing the recipe.
+    """
+    try:
+        fields = get_fields(request, DETAIL_FIELDS)
+    except FieldsError:
+        return None
+    if {'like_count', 'categories', 'photo'} & set(fields):
+        return None
+    state = get_recipe_state(request, pk)
+    return state and state['edit_date']
+
+
+@query_budget(7)
+@condition(etag_func=recipe_etag, last_modified_func=recipe_last_modified)
+def recipe_detail_view(request, pk):
+    """
+    Returns published recipe. Supports conditional requests with
+    If-None-Match and If-Modified-Since headers.
+    """
+    if not request.method == "GET":
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        fields = get_fields(request, DETAIL_FIELDS)
+    except FieldsError as error:
+        return fields_error(error)
+
+    recipe = get_object_or_404(get_recipes(fields), pk=pk)
+    add_surrogate_keys(request, recipe_key(recipe.pk))
+    if 'categories' in fields:
+        add_surrogate_keys(request, CATEGORIES_KEY)
+    return JsonResponse(serialize_recipe(recipe, fields, request))
@@ -0,0 +1,53 @@
+""" Streaming exports of users' data and of the whole catalog """
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse, HttpResponseBadRequest, Http404
+
+from catalog.export import FORMATS, get_exports, export
+from catalog.query_budget import query_budget
+
+
+def export_response(request, exports, kind):
+    """
+    Stream export of given kind as attachment, in format from 'format'
+    GET parameter (ndjson by default), gzip-compressed if 'gzip' is set.
+    Queries made while streaming, after the view returns, aren't counted
+    in view's query budget.
+    """
+    if kind not in exports:
+        raise Http404("Unknown export: {}".format(kind))
+    format = request.GET.get('format', 'ndjson')
+    if format not in FORMATS:
+        return HttpResponseBadRequest("Unknown format.")
+    compress = bool(request.GET.get('gzip'))
+
+    rows, fields = exports[kind]
+    filename = '{}.{}'.format(kind, format)
+    content_type = FORMATS[format]
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        export(rows, fields, format, compress), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        filename)
+    return response
+
+
+@query_budget(2)
+@login_required
+def export_view(request, kind):
+    """
+    Export user's recipes, drafts, favourites or comments.
+    """
+    return export_response(request, get_exports(request.user), kind)
+
+
+@query_budget(2)
+@staff_member_required
+def export_catalog_view(request, kind):
+    """
+    Export all published recipes, favourites or comments.
+    """
+    return export_response(request, get_exports(), kind)
@@ -1,66 +1,111 @@
 """ Views available without authentication """
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView, DetailView, ListView
-from django.db.models import Count
 from django.contrib.auth.models import User
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlencode
 
 
-from catalog.models import Recipe, Category, Favourite
+from catalog.models import (
+    Recipe, RecipeQuerySet, Category, Comment, SimilarRecipe)
 from catalog.forms import CommentForm
-
-
-class IndexView(TemplateView):
+from catalog.search import search_recipes
+from catalog.ingredients import find_recipes
+from catalog.pagination import KeysetPaginationMixin, get_keyset_page
+from catalog.cache import get_version
+from catalog.favourites import get_favourite_ids
+from catalog.feed import get_feed
+from catalog.http_cache import (
+    SurrogateKeysMixin, CATEGORIES_KEY, RECIPES_KEY, POPULAR_KEY,
+    SIMILAR_KEY, recipe_key, category_key, user_key)
+
+
+class IndexView(SurrogateKeysMixin, TemplateView):
     template_name = 'catalog/index.html'
+    surrogate_keys = (CATEGORIES_KEY, RECIPES_KEY, POPULAR_KEY)
+    # with "for you" feed of authenticated user
+    query_budget = 9
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         latest_recipes = Recipe.objects\
             .filter(status=Recipe.STATUS_PUBLISHED)\
-            .select_related('author')[:10]
+            .cards()[:10]
 
+        # leaderboard contains only published recipes
         popular_recipes = Recipe.objects\
-            .filter(status=Recipe.STATUS_PUBLISHED)\
-            .annotate(like_count=Count('favourite'))\
-            .filter(like_count__gte=1)\
-            .order_by('-like_count', '-pub_date')[:10]
+            .filter(popularity__isnull=False)\
+            .order_by('-popularity__score')\
+            .cards()[:10]
         context['latest_recipes'] = latest_recipes
         context['popular_recipes'] = popular_recipes
+
+        # personalized feed, skipping recipes user already likes
+        user = self.request.user
+        if user.is_authenticated:
+            context['feed_recipes'] = get_feed(
+                user, exclude=get_favourite_ids(user))
         return context
 
+    def get_surrogate_keys(self, context):
+        recipes = (list(context['latest_recipes'])
+                   + list(context['popular_recipes']))
+        return list(self.surrogate_keys) + [recipe_key(recipe.pk)
+                                            for recipe in recipes]
+
 
-class RecipeDetail(DetailView):
+class RecipeDetail(SurrogateKeysMixin, DetailView):
     """
     Shows details of selected recipe with status 'published'.
+    Whole page is cached for anonymous users by HttpCacheMiddleware.
+    Parts of the page are cached as template fragments,
+    see recipe_detail.html.
     """
     model = Recipe
     context_object_name = 'recipe'
+    surrogate_keys = (CATEGORIES_KEY, SIMILAR_KEY)
+    query_budget = 10
+
+    def get_surrogate_keys(self, context):
+        return list(self.surrogate_keys) + [recipe_key(self.object.pk)]
 
     def get_queryset(self):
         queryset = super().get_queryset()
         queryset = queryset\
             .filter(status=Recipe.STATUS_PUBLISHED)\
-            .prefetch_related('categories')\
-            .prefetch_related('comments__user')\
-            .annotate(like_count=Count('favourite'))
+            .select_related('author')
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # add comments to context
-        # comments = self.object.comments.select_related('author')
-        # context['comments'] = comments
+        # First page of comments, evaluated lazily, only if cached
+        # fragment with comments is missing. Next pages are loaded
+        # on demand from comments_view.
+        comments = self.object.comments.select_related('user')
+        context['comments_page'] = SimpleLazyObject(
+            lambda: get_keyset_page(comments, Comment.KEYSET_ORDERING,
+                                    settings.COMMENTS_PER_PAGE))
+        context['comments_version'] = get_version(
+            'recipe:{}:comments'.format(self.object.pk))
+
+        # precomputed neighbours, see catalog.recommendations
+        context['similar_recipes'] = SimilarRecipe.objects\
+            .filter(recipe=self.object,
+                    similar__status=Recipe.STATUS_PUBLISHED)\
+            .select_related('similar')\
+            .only('similar', *['similar__' + field
+                               for field in RecipeQuerySet.CARD_FIELDS])\
+            .order_by('-score')
 
         # if user authenticated...
         if self.request.user.is_authenticated:
 
             # ... check if user liked recipe
-            is_liked = Favourite.objects.filter(
-                recipe=self.object,
-                user=self.request.user
-            ).exists()
+            is_liked = self.object.pk in get_favourite_ids(self.request.user)
             context['is_liked'] = is_liked
 
             # ... add comment form to context
@@ -70,7 +115,8 @@ class RecipeDetail(DetailView):
         return context
 
 
-class RecipesByCategoryList(ListView):
+class RecipesByCategoryList(SurrogateKeysMixin, KeysetPaginationMixin,
+                            ListView):
     """
     Shows list of published recipes in selected category.
     """
@@ -79,6 +125,8 @@ class RecipesByCategoryList(ListView):
     template_name = 'catalog/recipes_list.html'
     paginate_by = 10
     allow_empty = True
+    keyset_ordering = ('-pub_date', '-edit_date', '-id')
+    query_budget = 5
 
     def get_queryset(self):
         # get Category's slug from url
@@ -87,7 +135,7 @@ class RecipesByCategoryList(ListView):
         # get queryset of recipes from that category
         queryset = self.category.recipes\
             .filter(status=Recipe.STATUS_PUBLISHED)\
-            .select_related('author')
+            .cards()
         return queryset
 
     def get_context_data(self, object_list=None, **kwargs):
@@ -96,8 +144,12 @@ class RecipesByCategoryList(ListView):
         context.update(title=str(self.category))
         return context
 
+    def get_surrogate_keys(self, context):
+        keys = super().get_surrogate_keys(context)
+        return keys + [category_key(self.category.slug)]
+
 
-class RecipesNewest(ListView):
+class RecipesNewest(SurrogateKeysMixin, ListView):
     """
     Shows up to 100 most recent recipes with status 'published'.
     """
@@ -107,19 +159,25 @@ class RecipesNewest(ListView):
     paginate_by = 10
     allow_empty = True
 
+    surrogate_keys = (CATEGORIES_KEY, RECIPES_KEY)
+    query_budget = 5
+
     extra_context = {
         'title': 'Newest recipes'
     }
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.filter(status=Recipe.STATUS_PUBLISHED)[:100]
+        queryset = queryset\
+            .filter(status=Recipe.STATUS_PUBLISHED)\
+            .cards()[:100]
         return queryset
 
 
-class RecipesPopular(ListView):
+class RecipesPopular(SurrogateKeysMixin, ListView):
     """
-    Shows up to 100 most liked recipes with status 'published'.
+    Shows up to 100 trending recipes with status 'published',
+    as ranked by precomputed leaderboard (see catalog.popularity).
     """
     model = Recipe
     context_object_name = 'recipes_list'
@@ -127,20 +185,24 @@ class RecipesPopular(ListView):
     paginate_by = 10
     allow_empty = True
 
+    surrogate_keys = (CATEGORIES_KEY, POPULAR_KEY)
+    query_budget = 5
+
     extra_context = {
-        'title': 'Most liked recipes'
+        'title': 'Popular recipes'
     }
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.filter(status=Recipe.STATUS_PUBLISHED)\
-            .annotate(like_count=Count('favourite'))\
-            .filter(like_count__gte=1)\
-            .order_by('-like_count', '-pub_date')[:100]
+        # leaderboard contains only published recipes
+        queryset = queryset\
+            .filter(popularity__isnull=False)\
+            .order_by('-popularity__score')\
+            .cards()[:100]
         return queryset
 
 
-class RecipesByUser(ListView):
+class RecipesByUser(SurrogateKeysMixin, KeysetPaginationMixin, ListView):
     """
     Shows recipes created by selected user
     """
@@ -149,6 +211,8 @@ class RecipesByUser(ListView):
     template_name = 'catalog/recipes_list.html'
     paginate_by = 10
     allow_empty = True
+    keyset_ordering = ('-pub_date', '-edit_date', '-id')
+    query_budget = 5
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -158,7 +222,7 @@ class RecipesByUser(ListView):
         queryset = queryset.filter(
             status=Recipe.STATUS_PUBLISHED,
             author=self.selected_user
-        )
+        ).cards()
 
         return queryset
 
@@ -167,3 +231,75 @@ class RecipesByUser(ListView):
         title = "Recipes by: {}".format(self.selected_user)
         context['title'] = title
         return context
+
+    def get_surrogate_keys(self, context):
+        keys = super().get_surrogate_keys(context)
+        return keys + [user_key(self.selected_user.pk)]
+
+
+class RecipeSearch(SurrogateKeysMixin, ListView):
+    """
+    Shows published recipes matching query from 'q' GET parameter,
+    ranked by relevance.
+    """
+    context_object_name = 'recipes_list'
+    template_name = 'catalog/recipes_list.html'
+    paginate_by = 10
+    allow_empty = True
+
+    surrogate_keys = (CATEGORIES_KEY, RECIPES_KEY)
+    query_budget = 5
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        # list of ranked recipes' pks
+        return search_recipes(self.query)
+
+    def get_context_data(self, object_list=None, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # replace paginated pks with recipes, keeping the ranking
+        recipes = Recipe.objects.cards().in_bulk(context['object_list'])
+        recipes_list = [recipes[pk] for pk in context['object_list']
+                        if pk in recipes]
+        context['recipes_list'] = recipes_list
+        context['title'] = "Search results for: {}".format(self.query)
+        context['pagination_query'] = urlencode({'q': self.query})
+        return context
+
+
+class RecipesByIngredients(SurrogateKeysMixin, ListView):
+    """
+    Shows published recipes which can be cooked with ingredients
+    given in 'ingredients' GET parameter (comma separated), ranked
+    by fraction of recipe's ingredients available.
+    """
+    context_object_name = 'recipes_list'
+    template_name = 'catalog/recipes_by_ingredients.html'
+    paginate_by = 10
+    allow_empty = True
+
+    surrogate_keys = (CATEGORIES_KEY, RECIPES_KEY)
+    query_budget = 4
+
+    def get_queryset(self):
+        self.pantry = self.request.GET.get('ingredients', '').strip()
+        # list of (pk, matched, total) tuples
+        return find_recipes(self.pantry.split(','))
+
+    def get_context_data(self, object_list=None, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # replace paginated tuples with recipes, keeping the ranking
+        page = context['object_list']
+        recipes = Recipe.objects.cards().in_bulk([pk for pk, _, _ in page])
+        recipes_list = []
+        for pk, matched, total in page:
+            if pk in recipes:
+                recipe = recipes[pk]
+                recipe.matched, recipe.total = matched, total
+                recipes_list.append(recipe)
+        context['recipes_list'] = recipes_list
+        context['pantry'] = self.pantry
+        context['title'] = "What can I cook?"
+        context['pagination_query'] = urlencode(
+            {'ingredients': self.pantry})
+        return context
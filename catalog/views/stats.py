@@ -0,0 +1,42 @@
+""" Views for monitoring """
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse, HttpResponse
+
+from catalog.cache import get_stats
+from catalog.jobs import get_queue_stats
+from catalog.metrics import get_metrics
+from catalog.query_budget import query_budget
+
+
+@query_budget(2)
+@staff_member_required
+def cache_stats_view(request):
+    """
+    Return hit and miss counters of catalog's caches.
+    """
+    return JsonResponse({'caches': get_stats()})
+
+
+@query_budget(5)
+@staff_member_required
+def job_stats_view(request):
+    """
+    Return background jobs' queue depth and latency.
+    """
+    return JsonResponse({'queue': get_queue_stats()})
+
+
+@query_budget(7)
+def metrics_view(request):
+    """
+    Return requests, caches and jobs metrics in Prometheus text format.
+    """
+    address = request.META.get('REMOTE_ADDR')
+    if not (request.user.is_staff
+            or address in settings.METRICS_ALLOWED_IPS):
+        raise PermissionDenied()
+    return HttpResponse(get_metrics(),
+                        content_type='text/plain; version=0.0.4')
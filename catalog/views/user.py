@@ -9,14 +9,17 @@ from django.db import transaction
 from django.core.exceptions import PermissionDenied
 from django.urls import reverse
 
-import json
 from datetime import datetime
 
 from catalog.forms import (
     RecipeForm, IngredientFormSet, DirectionFormSet, RecipePhotoForm)
-from catalog.models import Recipe, Category, Favourite
+from catalog.models import Recipe, RecipeQuerySet, Category, Favourite
+from catalog.jobs import enqueue
+from catalog.pagination import KeysetPaginationMixin
+from catalog.query_budget import query_budget
 
 
+@query_budget(9)
 @login_required
 @transaction.atomic  # atomic in case save_m2m() failed
 def recipe_create_draft(request):
@@ -64,6 +67,7 @@ def recipe_create_draft(request):
     return render(request, 'catalog/recipe_create.html', context)
 
 
+@query_budget(19)  # with photo upload
 @login_required
 @transaction.atomic  # atomic in case save_m2m() failed
 def recipe_edit(request, pk):
@@ -92,20 +96,15 @@ def recipe_edit(request, pk):
                 and ingredient_formset.is_valid()
                 and direction_formset.is_valid()
                 and photo_form.is_valid()):
-            # Dumping ingredient_formset into json string.
-            ingredients_list = [{'desc': form.cleaned_data.get('desc')}
-                                for form in ingredient_formset
-                                if form.cleaned_data.get('desc')]
-            ingredients = json.dumps(ingredients_list)
-
-            # Dumping direction_formset into json string.
-            directions_list = [{'desc': form.cleaned_data.get('desc')}
-                               for form in direction_formset
-                               if form.cleaned_data.get('desc')]
-            directions = json.dumps(directions_list)
+            ingredients = [form.cleaned_data.get('desc')
+                           for form in ingredient_formset
+                           if form.cleaned_data.get('desc')]
+            directions = [form.cleaned_data.get('desc')
+                          for form in direction_formset
+                          if form.cleaned_data.get('desc')]
 
             # add warning message if ing. or dir. list is empty
-            if not ingredients_list or not directions_list:
+            if not ingredients or not directions:
                 messages.add_message(
                     request, messages.WARNING,
                     "Ingredients list or directions list is empty, "
@@ -116,15 +115,18 @@ def recipe_edit(request, pk):
             # get photo file if uploaded
             photo = request.FILES.get('photo-photo', None)
 
-            # Set ingredients and directions to respective Recipe fields
-            # and save object.
+            # Save object with its ingredients and directions.
             recipe_form.save(commit=False)
             if photo:
                 recipe.photo = photo
-            recipe.ingredients = ingredients
-            recipe.directions = directions
             recipe.save()
             recipe_form.save_m2m()
+            recipe.set_ingredients(ingredients)
+            recipe.set_directions(directions)
+            # slow post-save work is done by background worker
+            enqueue('update_recipe_ingredients', recipe_id=recipe.pk)
+            if photo:
+                enqueue('generate_photo_derivatives', recipe_id=recipe.pk)
 
             # add success message
             messages.add_message(
@@ -161,7 +163,9 @@ def recipe_edit(request, pk):
     return render(request, 'catalog/recipe_edit.html', context)
 
 
+@query_budget(11)
 @login_required
+@transaction.atomic  # recipe is published together with its index job
 def recipe_publish(request, pk):
     """
     For confirming publication of a recipe.
@@ -186,6 +190,7 @@ def recipe_publish(request, pk):
         recipe.status = Recipe.STATUS_PUBLISHED
         recipe.pub_date = datetime.now()
         recipe.save()
+        enqueue('index_recipe', recipe_id=recipe.pk)
 
         # add success message
         messages.add_message(
@@ -202,6 +207,7 @@ def recipe_publish(request, pk):
     return render(request, 'catalog/recipe_publish.html', context)
 
 
+@query_budget(15)
 @login_required
 def recipe_delete(request, pk):
     """
@@ -231,7 +237,7 @@ def recipe_delete(request, pk):
     return render(request, 'catalog/recipe_delete.html', context)
 
 
-class MyRecipes(LoginRequiredMixin, ListView):
+class MyRecipes(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
     Shows list of authenticated user's recipes with status 'published'.
     """
@@ -240,19 +246,21 @@ class MyRecipes(LoginRequiredMixin, ListView):
     template_name = 'catalog/recipes_list.html'
     paginate_by = 10
     allow_empty = True
+    keyset_ordering = ('-pub_date', '-edit_date', '-id')
+    query_budget = 4
 
     extra_context = {
         'title': 'My recipes'
     }
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        queryset = queryset.filter(
-            status=Recipe.STATUS_PUBLISHED, author=self.request.user)
+        queryset = Recipe.objects\
+            .authored_by(self.request.user, Recipe.STATUS_PUBLISHED)\
+            .cards()
         return queryset
 
 
-class MyDrafts(LoginRequiredMixin, ListView):
+class MyDrafts(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
     Shows list of authenticated user's recipes with status 'draft'.
     """
@@ -261,15 +269,17 @@ class MyDrafts(LoginRequiredMixin, ListView):
     template_name = 'catalog/recipes_list.html'
     paginate_by = 10
     allow_empty = True
+    keyset_ordering = ('-edit_date', '-id')
+    query_budget = 4
 
     extra_context = {
         'title': 'My drafts'
     }
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        queryset = queryset.filter(
-            status=Recipe.STATUS_DRAFT, author=self.request.user)
+        queryset = Recipe.objects\
+            .authored_by(self.request.user, Recipe.STATUS_DRAFT)\
+            .cards()
         return queryset
 
 
@@ -280,10 +290,12 @@ class DraftDetail(DetailView):
     model = Recipe
     context_object_name = 'recipe'
     template_name = 'catalog/draft_detail.html'
+    query_budget = 8
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.prefetch_related('categories')
+        queryset = queryset.prefetch_related(
+            'categories', 'ingredients', 'directions')
         return queryset
 
     def get_object(self, queryset=None):
@@ -299,11 +311,13 @@ class DraftDetail(DetailView):
         return obj
 
 
-class MyFavourites(LoginRequiredMixin, ListView):
+class MyFavourites(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     context_object_name = 'favourites_list'
-    template_name = 'catalog/favourites_list.html'
+    template_name = 'catalog/favourite_list.html'
     paginate_by = 10
     allow_empty = True
+    keyset_ordering = ('-timestamp', '-id')
+    query_budget = 4
 
     extra_context = {
         'title': 'Favourite recipes'
@@ -313,7 +327,8 @@ class MyFavourites(LoginRequiredMixin, ListView):
         user = self.request.user
         queryset = Favourite.objects\
             .select_related('recipe')\
-            .filter(user=user)\
-            .order_by('-timestamp')
+            .only('timestamp', 'recipe', *[
+                'recipe__' + field for field in RecipeQuerySet.CARD_FIELDS])\
+            .filter(user=user)
         # queryset = Recipe.objects.filter(favourite__user=user)
         return queryset
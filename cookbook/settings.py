@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.profiling.ProfilingMiddleware',
+    'catalog.query_budget.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'catalog.http_cache.HttpCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'cookbook.urls'
@@ -84,9 +87,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # test database in a file, instead of memory, so tests can use
+        # concurrent connections (see FavouriteConcurrencyTest)
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
+# PostgreSQL, if configured by environment (eg. to run benchmarks)
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', ''),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', ''),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Local memory cache is per process. With multiple worker processes use
+# shared backend (eg. memcached), so invalidation reaches all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Pages for anonymous users (see catalog.http_cache): 'local' caches them
+# in CACHES, 'headers' only sends Cache-Control and Surrogate-Key headers
+# for reverse proxy. Purged keys are also sent as PURGE requests to
+# HTTP_CACHE_PURGE_URL (eg. 'http://proxy/purge/{key}'), if it's set.
+HTTP_CACHE_MODE = 'local'
+HTTP_CACHE_TIMEOUT = 24 * 3600
+HTTP_CACHE_PURGE_URL = None
+# Number of comments rendered with recipe page and loaded on demand
+COMMENTS_PER_PAGE = 10
+# Number of recipes on a page of JSON API lists
+API_PAGE_SIZE = 20
+# Number of rows fetched at once by streaming exports (see catalog.export),
+# chunk's recipe ids are query parameters, mind SQLite's limit of 999
+EXPORT_CHUNK_SIZE = 500
+# Cached sets of users' favourite recipes expire after (seconds)
+FAVOURITE_IDS_CACHE_TIMEOUT = 24 * 3600
+# Maximal number of recipes in one favourite status request
+FAVOURITE_STATUS_MAX_IDS = 100
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -142,3 +192,61 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'index'
 LOGOUT_REDIRECT_URL = 'index'
+
+# Popular recipes leaderboard: weight of a favourite halves every N days
+POPULAR_HALF_LIFE_DAYS = 7
+# Recipes with lower score are dropped from the leaderboard
+POPULAR_MIN_SCORE = 0.01
+
+# Similar recipes (see catalog.recommendations): number of neighbours kept
+# for every recipe, and minimal number of users who liked both recipes
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_RECIPES_MIN_COMMON = 2
+
+# "For you" feed on index page (see catalog.feed): weight of favourites
+# and recipes halves every N days, affinity is computed from user's last
+# FEED_MAX_FAVOURITES favourites (category links) and cached for
+# FEED_AFFINITY_TIMEOUT seconds, FEED_SIZE recipes are picked from
+# FEED_CANDIDATES newest ones in FEED_CATEGORIES strongest categories
+FEED_HALF_LIFE_DAYS = 30
+FEED_MAX_FAVOURITES = 500
+FEED_AFFINITY_TIMEOUT = 24 * 3600
+FEED_CATEGORIES = 5
+FEED_CANDIDATES = 200
+FEED_SIZE = 10
+
+# Recipe search: maximal number of ranked results, cached for
+# SEARCH_CACHE_TIMEOUT seconds (or until the index changes)
+SEARCH_MAX_RESULTS = 500
+SEARCH_CACHE_TIMEOUT = 3600
+# "What can I cook" search: maximal number of ranked results
+INGREDIENTS_MAX_RESULTS = 500
+
+# Background jobs (see catalog.jobs): failed job is retried up to
+# JOB_MAX_ATTEMPTS times, after JOB_RETRY_DELAY seconds doubled with every
+# attempt. Jobs running longer than JOB_TIMEOUT seconds are considered
+# abandoned by crashed worker. Finished jobs are kept for JOB_KEEP_DAYS.
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 30
+JOB_TIMEOUT = 15 * 60
+JOB_KEEP_DAYS = 7
+
+# Benchmark commands refuse to fill or change database, unless it's
+# the benchmark one (see cookbook.settings_benchmark)
+BENCHMARK_DATABASE = False
+
+# Raise error when view makes more queries than its query budget
+# (see catalog.query_budget)
+QUERY_BUDGET_ENFORCE = DEBUG
+
+# Request profiling (see catalog.profiling): timings of requests are
+# aggregated for /metrics/, PROFILING_SAMPLE_RATE fraction of requests is
+# profiled with cProfile, keeping PROFILING_MAX_FILES newest stats files.
+PROFILING = False
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_FILES = 200
+# /metrics/ is available to staff and these addresses (eg. Prometheus).
+# Behind reverse proxy on the same host, every request comes from
+# 127.0.0.1, so don't list local addresses there.
+METRICS_ALLOWED_IPS = []
@@ -0,0 +1,19 @@
+"""
+Settings for benchmarks: separate database, filled with generated data
+by seed_benchmark_data command.
+
+    python manage.py seed_benchmark_data --settings=cookbook.settings_benchmark
+    python manage.py benchmark --settings=cookbook.settings_benchmark
+"""
+
+import os
+
+from cookbook.settings import *  # noqa: F401,F403
+from cookbook.settings import BASE_DIR, DATABASES
+
+BENCHMARK_DATABASE = True
+
+# PostgreSQL database is chosen by environment (see settings)
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['NAME'] = os.path.join(
+        BASE_DIR, 'benchmark.sqlite3')